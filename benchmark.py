@@ -0,0 +1,279 @@
+"""Benchmarks for the hot parts of the game, on generated scenarios.
+
+    python benchmark.py                                   # every benchmark on every scenario
+    python benchmark.py -s medium -b full_frame,render_frame
+    python benchmark.py --save-baseline                   # store the results as the baseline
+    python benchmark.py --baseline benchmark_baseline.json --margin 0.2
+
+Scenarios are built from a few numbers: how many enemies of each kind, how many towers
+and how long the path is, see SCENARIOS. --enemies/--towers/--path-length/--bullets run
+one custom scenario instead. Everything runs headless, pygame uses the SDL dummy driver.
+
+Each benchmark is timed over several repeats with a fresh scenario for each, and the best
+repeat is kept since that is the least noisy. Results are printed and written as JSON.
+With a baseline, any benchmark slower than baseline * (1 + margin) is reported and the
+exit status is 1, so it can guard a CI job.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import numpy as np
+
+from simulation import GameState, SlowTower, TOWER_TYPES, ENEMY_NAMES, FRAME_TIME, WIDTH, HEIGHT
+from waves import CompiledWaves
+from event_log import log, OFF
+
+# Enemy counts by kind, tower count, path length in pixels and bullets in flight
+SCENARIOS = {
+    'small': {'enemies': {'green': 40, 'purple': 10}, 'towers': 8, 'path_length': 1500, 'bullets': 20},
+    'medium': {'enemies': {'green': 500, 'purple': 200, 'blue': 150, 'red': 100, 'black': 50},
+               'towers': 30, 'path_length': 3000, 'bullets': 200},
+    'large': {'enemies': {'green': 5000, 'purple': 2000, 'blue': 1500, 'red': 1000, 'black': 500},
+              'towers': 60, 'path_length': 4500, 'bullets': 2000},
+}
+
+def make_path(length, margin=50, spacing=100):
+    # Back and forth across the map, spacing apart, cut off once it's length long
+    points = [(margin, margin)]
+    remaining = length
+    x, y = margin, margin
+    direction = 1
+    while remaining > 0 and y <= HEIGHT - margin:
+        run = min(WIDTH - 2 * margin, remaining)
+        x += direction * run
+        points.append((x, y))
+        remaining -= run
+        if remaining <= 0 or y + spacing > HEIGHT - margin:
+            break
+        step = min(spacing, remaining)
+        y += step
+        points.append((x, y))
+        remaining -= step
+        direction = -direction
+    return points
+
+def build_state(scenario, seed=0):
+    # A GameState mid-level with the scenario's enemies spread along the path and towers placed
+    rng = np.random.default_rng(seed)
+    state = GameState(CompiledWaves({}), path=make_path(scenario['path_length']), money=10 ** 9)
+    tower_types = list(TOWER_TYPES.values())
+    candidates = np.stack(np.meshgrid(np.arange(25, WIDTH, 25), np.arange(25, HEIGHT, 25)), -1).reshape(-1, 2)
+    placed = 0
+    for x, y in rng.permutation(candidates).tolist():
+        if placed == scenario['towers']:
+            break
+        placed += state.add_tower(tower_types[placed % len(tower_types)](x, y))
+
+    kinds = np.concatenate([np.full(count, ENEMY_NAMES.index(name)) for name, count in scenario['enemies'].items()])
+    rng.shuffle(kinds)
+    distances = np.sort(rng.uniform(0, state.path.length * 0.9, len(kinds)))
+    for kind, distance in zip(kinds.tolist(), distances.tolist()):
+        state.enemies.spawn(kind, distance)
+    state.level = 1
+    state.can_start_next_level = False
+    state.enemies.advance(0.0)  # Settle positions like after a normal tick
+    return state
+
+def fire_bullets(state, count, rng):
+    # Put count bullets in flight from the shooting towers at random enemies
+    shooters = [tower for tower in state.towers if not isinstance(tower, SlowTower)]
+    handles = state.enemies.handle[:state.enemies.count]
+    for i in range(count):
+        tower = shooters[i % len(shooters)]
+        tower.make_bullet(int(handles[rng.integers(len(handles))]), state)
+
+# name -> (setup, ops per repeat). setup builds a fresh scenario and returns the operation to time
+BENCHMARKS = {}
+
+def benchmark(name, iterations):
+    def register(setup):
+        BENCHMARKS[name] = (setup, iterations)
+        return setup
+    return register
+
+@benchmark('enemy_advance', 50)
+def bench_enemy_advance(scenario):
+    # Moving every enemy one tick along the path
+    state = build_state(scenario)
+    return lambda: state.enemies.advance(1.0)
+
+@benchmark('tower_find_target', 50)
+def bench_tower_find_target(scenario):
+    # Every tower picking its target, including the one distance sort a tick needs
+    state = build_state(scenario)
+    enemies = state.enemies
+
+    def run():
+        enemies.advance(0.0)  # Throws away the sorted order like a real tick does
+        for tower in state.towers:
+            tower.find_target(enemies)
+    return run
+
+@benchmark('tower_shoot', 50)
+def bench_tower_shoot(scenario):
+    # Every tower off cooldown and firing, the bullets are thrown away again
+    state = build_state(scenario)
+
+    def run():
+        for tower in state.towers:
+            tower.last_shot_time = -np.inf
+            tower.shoot(state)
+        state.bullets.clear()
+    return run
+
+@benchmark('bullet_update', 10)
+def bench_bullet_update(scenario):
+    # Moving and sweeping every bullet in flight, hits are found but not resolved
+    state = build_state(scenario)
+    fire_bullets(state, scenario['bullets'], np.random.default_rng(1))
+    return lambda: state.bullets.advance(state.enemies, 1.0)
+
+@benchmark('placement_check', 20)
+def bench_placement_check(scenario):
+    # 1000 is-this-spot-valid checks, like hovering with a tower over the map
+    state = build_state(scenario)
+    points = np.random.default_rng(2).integers(0, (WIDTH, HEIGHT), size=(1000, 2)).tolist()
+
+    def run():
+        for x, y in points:
+            state.can_place(x, y)
+    return run
+
+@benchmark('spawn_enemy', 1)
+def bench_spawn_enemy(scenario):
+    # Spawning the scenario's whole enemy count from a level timeline in one tick
+    kinds = np.concatenate([np.full(count, ENEMY_NAMES.index(name), dtype=np.int8)
+                            for name, count in scenario['enemies'].items()])
+    state = GameState(CompiledWaves({1: (np.zeros(len(kinds)), kinds)}), path=make_path(scenario['path_length']))
+    state.start_next_level(True)
+    return state.spawn_enemy
+
+@benchmark('full_frame', 30)
+def bench_full_frame(scenario):
+    # One whole simulation tick: towers, bullets, spawning and movement
+    state = build_state(scenario)
+    return lambda: state.step(FRAME_TIME)
+
+@benchmark('render_frame', 30)
+def bench_render_frame(scenario):
+    # Drawing one frame with the real renderer, on the dummy video driver
+    import pygame
+    from renderer import Renderer
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    renderer = Renderer(screen, pygame.font.Font(None, 30))
+    state = build_state(scenario)
+    fire_bullets(state, scenario['bullets'], np.random.default_rng(1))
+    renderer.draw(state, 60)  # Background and sprites are built once, not every frame
+
+    def run():
+        state.enemies.advance(1.0)
+        renderer.draw(state, 60)
+    return run
+
+def run_benchmark(name, scenario, repeat):
+    setup, iterations = BENCHMARKS[name]
+    times = []
+    for _ in range(repeat):
+        operation = setup(scenario)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            operation()
+        times.append((time.perf_counter() - started) / iterations)
+    return {'best_ms': min(times) * 1000, 'median_ms': statistics.median(times) * 1000,
+            'repeat': repeat, 'iterations': iterations}
+
+def compare(results, baseline, margin):
+    # Names of the benchmarks slower than the baseline allows
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old and result['best_ms'] > old['best_ms'] * (1 + margin):
+            regressions.append(key)
+    return regressions
+
+def parse_enemies(text):
+    # "green=500,red=100" -> {'green': 500, 'red': 100}
+    enemies = {}
+    for part in text.split(','):
+        name, _, count = part.partition('=')
+        if name not in ENEMY_NAMES or not count.isdigit():
+            raise argparse.ArgumentTypeError(f"expected name=count with names from {', '.join(ENEMY_NAMES)}")
+        enemies[name] = int(count)
+    return enemies
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--scenarios', default=','.join(SCENARIOS), help="Comma separated scenario names")
+    parser.add_argument('-b', '--benchmarks', default=','.join(BENCHMARKS), help="Comma separated benchmark names")
+    parser.add_argument('--enemies', type=parse_enemies, help="Custom scenario enemies, like green=500,red=100")
+    parser.add_argument('--towers', type=int, default=30, help="Custom scenario tower count")
+    parser.add_argument('--path-length', type=float, default=3000, help="Custom scenario path length in pixels")
+    parser.add_argument('--bullets', type=int, default=200, help="Custom scenario bullets in flight")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh scenarios per benchmark, the best one counts")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="Where to write the results")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="Results to compare against")
+    parser.add_argument('--margin', type=float, default=0.25, help="Allowed slowdown over the baseline, 0.25 is 25%%")
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results to the baseline file too")
+    args = parser.parse_args(argv)
+
+    if args.enemies:
+        scenarios = {'custom': {'enemies': args.enemies, 'towers': args.towers,
+                                'path_length': args.path_length, 'bullets': args.bullets}}
+    else:
+        scenarios = {}
+        for name in args.scenarios.split(','):
+            if name not in SCENARIOS:
+                parser.error(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+            scenarios[name] = SCENARIOS[name]
+    names = args.benchmarks.split(',')
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}, expected one of {', '.join(BENCHMARKS)}")
+
+    log.level = OFF  # Level and combat messages would only measure stdout
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+
+    results = {}
+    for scenario_name, scenario in scenarios.items():
+        for name in names:
+            key = f"{scenario_name}/{name}"
+            results[key] = result = run_benchmark(name, scenario, args.repeat)
+            line = f"{key:32} {result['best_ms']:10.3f} ms  (median {result['median_ms']:.3f})"
+            if key in baseline:
+                line += f"  baseline {baseline[key]['best_ms']:.3f}, {result['best_ms'] / baseline[key]['best_ms'] - 1:+.0%}"
+            print(line)
+
+    report = {
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'platform': platform.platform(), 'processor': platform.processor()},
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scenarios': scenarios,
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    regressions = compare(results, baseline, args.margin)
+    if regressions:
+        print(f"Slower than {args.baseline} by more than {args.margin:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
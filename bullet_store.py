@@ -0,0 +1,143 @@
+import numpy as np
+
+# Bullets in flight live in parallel NumPy arrays like the enemies do, so every bullet on
+# the map moves and is checked for hits with a handful of array operations per tick.
+
+class BulletStore:
+    """Struct-of-arrays storage for every bullet in flight.
+
+    Rows [0, count) are the bullets, oldest first. A bullet flies in a straight line at
+    the target's position when it was fired, or, if it homes, turns towards its target
+    every tick. Hits are found by sweeping each bullet's movement this tick as a segment
+    against its target's circle, so a fast bullet or a long step can't jump over the
+    target. Bullets whose target is gone keep flying and are culled once they leave the
+    map.
+    """
+
+    COLUMNS = ('x', 'y', 'vx', 'vy', 'target', 'kind', 'owner', 'homing')
+
+    def __init__(self, bullet_types, enemy_radius, bounds, capacity=64):
+        self.bullet_types = bullet_types  # Bullet classes, indexed by the kind column
+        self.type_speed = np.array([t.speed for t in bullet_types], dtype=np.float64)
+        # A hit is any contact between the bullet and the enemy's body
+        self.type_hit_radius = np.array([t.radius + enemy_radius for t in bullet_types], dtype=np.float64)
+        self.bounds = bounds  # (left, top, right, bottom), bullets outside it are culled
+        self.count = 0
+        self.capacity = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        def grown(old, dtype):
+            column = np.zeros(capacity, dtype=dtype)
+            if old is not None:
+                column[:len(old)] = old
+            return column
+
+        old = self.__dict__
+        self.x = grown(old.get('x'), np.float64)
+        self.y = grown(old.get('y'), np.float64)
+        self.vx = grown(old.get('vx'), np.float64)  # Pixels per 1/60 s
+        self.vy = grown(old.get('vy'), np.float64)
+        self.target = grown(old.get('target'), np.int64)  # Enemy handle
+        self.kind = grown(old.get('kind'), np.int8)
+        self.owner = grown(old.get('owner'), np.int64)  # Index of the tower that fired it
+        self.homing = grown(old.get('homing'), bool)
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, count):
+        # Make room for at least count rows up front
+        capacity = self.capacity
+        while capacity < count:
+            capacity *= 2
+        if capacity != self.capacity:
+            self._allocate(capacity)
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, x, y, target_x, target_y, target, kind, owner, homing=False):
+        # Fire one bullet from (x, y) towards (target_x, target_y)
+        if self.count == self.capacity:
+            self._allocate(self.capacity * 2)
+        row = self.count
+        speed = self.type_speed[kind]
+        dx, dy = target_x - x, target_y - y
+        length = np.hypot(dx, dy)
+        self.x[row], self.y[row] = x, y
+        if length > 0:
+            self.vx[row], self.vy[row] = dx / length * speed, dy / length * speed
+        else:
+            self.vx[row], self.vy[row] = 0.0, speed  # Fired from right on top of it, any direction hits
+        self.target[row] = target
+        self.kind[row] = kind
+        self.owner[row] = owner
+        self.homing[row] = homing
+        self.count += 1
+        return row
+
+    def remove_rows(self, rows):
+        # Drop a batch of bullets, the rest keep their order so hits resolve oldest first
+        n = self.count
+        keep = np.ones(n, dtype=bool)
+        keep[rows] = False
+        remaining = int(np.count_nonzero(keep))
+        if remaining == n:
+            return
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            column[:remaining] = column[:n][keep]
+        self.count = remaining
+
+    def advance(self, enemies, steps):
+        """Move every bullet by steps ticks and return the rows that hit their target.
+
+        Homing bullets are steered at their target first. A bullet hits if the segment it
+        travelled comes within hit radius of its target's center. Bullets that left the
+        map are removed here, hits are left for the caller to resolve and remove.
+        """
+        n = self.count
+        if n == 0 or steps <= 0:
+            return np.zeros(0, dtype=np.int64)
+        rows = enemies.find_rows(self.target[:n])
+        alive = rows >= 0
+        rows[~alive] = 0  # Any row will do, misses on those bullets are forced below
+        target_x, target_y = enemies.x[rows], enemies.y[rows]
+        x, y = self.x[:n], self.y[:n]
+        vx, vy = self.vx[:n], self.vy[:n]
+        kind = self.kind[:n]
+
+        # Right on top of the target there's no direction to turn to, it keeps its old one
+        steer = self.homing[:n] & alive & ((target_x != x) | (target_y != y))
+        if steer.any():
+            dx, dy = target_x[steer] - x[steer], target_y[steer] - y[steer]
+            scale = self.type_speed[kind[steer]] / np.hypot(dx, dy)
+            vx[steer] = dx * scale
+            vy[steer] = dy * scale
+
+        # Swept segment against circle: closest point of this tick's movement to the target.
+        # Speeds are never zero, so neither is the length of the movement.
+        move_x, move_y = vx * steps, vy * steps
+        to_x, to_y = target_x - x, target_y - y
+        t = (to_x * move_x + to_y * move_y) / (move_x * move_x + move_y * move_y)
+        np.maximum(t, 0.0, out=t)
+        np.minimum(t, 1.0, out=t)
+        miss_x, miss_y = to_x - t * move_x, to_y - t * move_y
+        radius = self.type_hit_radius[kind]
+        hit = alive & (miss_x * miss_x + miss_y * miss_y <= radius * radius)
+        t[~hit] = 1.0
+
+        # Bullets that hit stop where they touched, the rest fly the whole way
+        x += t * move_x
+        y += t * move_y
+
+        left, top, right, bottom = self.bounds
+        gone = ~hit & ((x < left) | (x > right) | (y < top) | (y > bottom))
+        hits = np.flatnonzero(hit)
+        if gone.any():
+            kept = np.cumsum(~gone) - 1  # Where each surviving row ends up
+            self.remove_rows(np.flatnonzero(gone))
+            hits = kept[hits]
+        return hits
@@ -0,0 +1,85 @@
+import numpy as np
+
+# Zoom steps the mouse wheel moves through, 1 is one map pixel per screen pixel
+ZOOMS = (0.125, 0.1875, 0.25, 0.375, 0.5, 0.75, 1.0, 1.5, 2.0)
+
+class Camera:
+    """Which part of the map the window shows.
+
+    x, y is the map position at the top left of the window and zoom is screen pixels per
+    map pixel. The view is kept on the map: a map smaller than the window is centered.
+    version goes up whenever the view changes, so the renderer knows when to recompose.
+    """
+
+    def __init__(self, view_size, map_size, zoom=1.0):
+        self.view_width, self.view_height = view_size
+        self.map_width, self.map_height = map_size
+        self.x = 0.0
+        self.y = 0.0
+        self.zoom = zoom
+        self.version = 0
+        self._clamp()
+
+    def set_map(self, map_size):
+        # A different map was loaded, start again from its top left corner
+        self.map_width, self.map_height = map_size
+        self.x = self.y = 0.0
+        self._clamp()
+        self.version += 1
+
+    def _clamp(self):
+        view_width, view_height = self.view_width / self.zoom, self.view_height / self.zoom
+        if view_width >= self.map_width:
+            self.x = (self.map_width - view_width) / 2
+        else:
+            self.x = min(max(self.x, 0.0), self.map_width - view_width)
+        if view_height >= self.map_height:
+            self.y = (self.map_height - view_height) / 2
+        else:
+            self.y = min(max(self.y, 0.0), self.map_height - view_height)
+        # Whole screen pixels, so sprites and background tiles stay lined up while panning
+        self.x = round(self.x * self.zoom) / self.zoom
+        self.y = round(self.y * self.zoom) / self.zoom
+
+    def pan(self, dx, dy):
+        # Move the view by dx, dy screen pixels
+        old = (self.x, self.y)
+        self.x += dx / self.zoom
+        self.y += dy / self.zoom
+        self._clamp()
+        if (self.x, self.y) != old:
+            self.version += 1
+
+    def zoom_at(self, screen_x, screen_y, steps):
+        # Zoom in (steps > 0) or out through ZOOMS, keeping the map point under the mouse still
+        index = min(range(len(ZOOMS)), key=lambda i: abs(ZOOMS[i] - self.zoom))
+        zoom = ZOOMS[min(max(index + steps, 0), len(ZOOMS) - 1)]
+        if zoom == self.zoom:
+            return
+        map_x, map_y = self.to_map(screen_x, screen_y)
+        self.zoom = zoom
+        self.x = map_x - screen_x / zoom
+        self.y = map_y - screen_y / zoom
+        self._clamp()
+        self.version += 1
+
+    def fit(self):
+        # Zoom out until the whole map is in view, or as far as ZOOMS goes
+        fitting = [zoom for zoom in ZOOMS
+                   if self.map_width * zoom <= self.view_width and self.map_height * zoom <= self.view_height]
+        self.zoom = max(fitting) if fitting else ZOOMS[0]
+        self._clamp()
+        self.version += 1
+
+    def to_screen(self, x, y):
+        # Map position to window position, works on scalars and arrays
+        return (x - self.x) * self.zoom, (y - self.y) * self.zoom
+
+    def to_map(self, screen_x, screen_y):
+        # Window position to map position, rounded to the pixel like mouse positions always were
+        return int(np.floor(self.x + screen_x / self.zoom)), int(np.floor(self.y + screen_y / self.zoom))
+
+    def visible(self, margin=0):
+        # Map rectangle in view as (left, top, right, bottom), grown by margin map pixels
+        return (self.x - margin, self.y - margin,
+                self.x + self.view_width / self.zoom + margin, self.y + self.view_height / self.zoom + margin)
@@ -0,0 +1,93 @@
+import numpy as np
+
+from waves import CompiledWaves, compile_level
+
+# Endless mode: once the levels in level_config.json run out, every further level is made
+# up from a difficulty curve instead of being empty. A generated level is a few overlapping
+# groups like a hand written one (see waves.py), so it compiles to the same spawn timeline.
+# The numbers come from a random generator seeded with the level, so a level is the same
+# every time it is played, saved games and replays included.
+
+class DifficultyCurve:
+    """How generated waves grow, n counts the generated levels from 1.
+
+    count * growth ** (n - 1) enemies, capped at max_count. Enemy kinds join the mix at
+    their unlock level and then get more common by mix_growth per level. Spawns start
+    interval apart and speed up by interval_decay per level down to min_interval, and
+    come in bursts when the wave would otherwise last longer than max_duration seconds.
+    """
+
+    def __init__(self, count=12, growth=1.12, max_count=5000, unlocks=(1, 2, 4, 6, 9), mix_growth=0.3,
+                 interval=0.5, interval_decay=0.95, min_interval=0.05, max_duration=60.0, after_config=True):
+        self.count = count
+        self.growth = growth
+        self.max_count = max_count
+        self.unlocks = unlocks  # Level each enemy kind first turns up at, by kind
+        self.mix_growth = mix_growth
+        self.interval = interval
+        self.interval_decay = interval_decay
+        self.min_interval = min_interval
+        self.max_duration = max_duration
+        self.after_config = after_config  # Carry on from level_config.json, or generate every level
+
+    def settings(self):
+        return tuple(sorted(vars(self).items()))
+
+    def generate(self, n, seed=0):
+        # Spawn timeline for the n-th generated level
+        rng = np.random.default_rng([seed, n])
+        total = int(min(self.max_count, round(self.count * self.growth ** (n - 1))))
+        unlocks = np.array(self.unlocks, dtype=np.float64)
+        weights = np.where(n >= unlocks, 1.0 + self.mix_growth * (n - unlocks), 0.0)
+        counts = rng.multinomial(total, weights / weights.sum())
+
+        interval = max(self.min_interval, self.interval * self.interval_decay ** (n - 1))
+        burst = max(1, int(np.ceil(total * interval / self.max_duration)))
+        duration = total * interval / burst
+        groups = []
+        for kind in np.flatnonzero(counts).tolist():
+            groups.append({'kind': kind, 'count': int(counts[kind]), 'interval': interval, 'burst': burst,
+                           # Groups overlap, each starts somewhere in the first half of the wave
+                           'start': float(rng.uniform(0, duration / 2)), 'delay': 0.0})
+        return compile_level(groups)
+
+# Named curves, endless goes on from the level config, stress is for finding scaling limits:
+# over 50k enemies a wave from level 10, all spawned within a few seconds
+PROFILES = {
+    'endless': DifficultyCurve(),
+    'stress': DifficultyCurve(count=1000, growth=1.55, max_count=200000, unlocks=(1, 1, 2, 3, 4),
+                              interval=0.02, interval_decay=1.0, min_interval=0.0, max_duration=5.0,
+                              after_config=False),
+}
+
+class EndlessWaves(CompiledWaves):
+    """CompiledWaves that never run out: levels past the configured ones are generated."""
+
+    def __init__(self, curve, base=None, seed=0):
+        super().__init__(dict(base.levels) if base is not None and curve.after_config else {})
+        self.curve = curve
+        self.seed = seed
+        self.first_generated = max(self.levels, default=0) + 1
+        # Pick the curve up where the config left off, not back at the start of it
+        last_count = len(self.get(self.first_generated - 1)[0])
+        self.first_n = 1
+        if last_count > curve.count and curve.growth > 1:
+            self.first_n += int(np.ceil(np.log(last_count / curve.count) / np.log(curve.growth)))
+        self.generated = {}  # Level -> (times, kinds), made the first time the level is asked for
+
+    def get(self, level):
+        if level < self.first_generated:
+            return super().get(level)
+        waves = self.generated.get(level)
+        if waves is None:
+            waves = self.generated[level] = self.curve.generate(level - self.first_generated + self.first_n, self.seed)
+        return waves
+
+    def signature(self):
+        return repr((self.curve.settings(), self.seed, self.first_generated)).encode()
+
+def endless_waves(profile, base=None, seed=0):
+    # EndlessWaves for one of the PROFILES, base is the compiled level config to start from
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown endless profile {profile!r}, expected one of {', '.join(PROFILES)}")
+    return EndlessWaves(PROFILES[profile], base, seed)
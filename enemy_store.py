@@ -0,0 +1,281 @@
+import numpy as np
+
+# Enemies live in parallel NumPy arrays instead of one Python object each, so a whole
+# wave can be moved, searched and culled with a handful of array operations.
+
+# A handle packs a slot number in the low bits and that slot's generation above them
+SLOT_BITS = 32
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+class EnemyStore:
+    """Struct-of-arrays storage for every live enemy.
+
+    Rows [0, count) hold the enemies, in no particular order. Anything that needs to
+    refer to one enemy over time (bullets, the spatial hash) holds its handle instead
+    of a row. The handle names a slot, and the slot table says which row that enemy is
+    in right now. Each slot also has a generation that is bumped when its enemy dies,
+    so an old handle can never find a newer enemy that reused the slot.
+
+    Killing an enemy only retires its handle and marks the row dead. Dead rows are
+    swap-removed in one batch by flush_removals at the end of the phase: the last live
+    rows move into the holes. That costs O(number removed) with nothing shifted or
+    allocated.
+    """
+
+    COLUMNS = ('handle', 'row_slot', 'kind', 'x', 'y', 'speed', 'health', 'max_health', 'distance', 'slow')
+
+    def __init__(self, enemy_types, path, capacity=256):
+        self.path = path  # Path everyone walks, positions are derived from distance
+        self.enemy_types = enemy_types  # Enemy classes, indexed by the kind column
+        self.type_speed = np.array([t.speed for t in enemy_types], dtype=np.float64)
+        self.type_health = np.array([t.health for t in enemy_types], dtype=np.int32)
+        self.type_reward = np.array([t.reward for t in enemy_types], dtype=np.int64)
+        self.count = 0
+        self.dead_count = 0  # Rows killed but not swap-removed yet
+        self._order = None  # Rows sorted by distance, rebuilt lazily after anything moves
+        self.position_version = 0  # Bumped whenever enemies move, for caches like SpatialHash
+        self.capacity = 0
+        self._allocate(capacity)
+        self.next_slot = 0
+        self.free_slots = []  # Slots whose enemy died, reused before new ones are handed out
+
+    def _allocate(self, capacity):
+        # Grow every column and the slot table, keeping what's in them
+        def grown(old, dtype, fill=0):
+            column = np.full(capacity, fill, dtype=dtype)
+            if old is not None:
+                column[:len(old)] = old
+            return column
+
+        old = self.__dict__
+        self.handle = grown(old.get('handle'), np.int64)
+        self.row_slot = grown(old.get('row_slot'), np.int64)  # Slot of the enemy in each row
+        self.kind = grown(old.get('kind'), np.int8)
+        self.x = grown(old.get('x'), np.float64)
+        self.y = grown(old.get('y'), np.float64)
+        self.speed = grown(old.get('speed'), np.float64)
+        self.health = grown(old.get('health'), np.int32)
+        self.max_health = grown(old.get('max_health'), np.int32)
+        self.distance = grown(old.get('distance'), np.float64)  # How far along the path
+        self.slow = grown(old.get('slow'), np.float64, 1.0)  # Speed multiplier for the next move
+        self.dead = grown(old.get('dead'), bool)
+        # Live slots never outnumber rows, so the slot table grows with the columns
+        self.slot_row = grown(old.get('slot_row'), np.int64, -1)  # -1 for a free slot
+        self.slot_generation = grown(old.get('slot_generation'), np.int64)
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.count - self.dead_count
+
+    def reserve(self, count):
+        # Make room for at least count rows up front
+        capacity = self.capacity
+        while capacity < count:
+            capacity *= 2
+        if capacity != self.capacity:
+            self._allocate(capacity)
+
+    def clear(self):
+        self.kill_rows(np.arange(self.count))
+        self.flush_removals()
+
+    @property
+    def entrance_count(self):
+        return len(self.path.paths)
+
+    def enter(self, kind, entrance):
+        # Spawn at the start of one of the map's entrances
+        return self.spawn(kind, self.path.start_of(entrance))
+
+    def spawn(self, kind, distance=0.0):
+        # Add one enemy of the given kind at distance along the path and return its handle
+        x, y = self.path.position_at(distance)
+        return self.spawn_at(kind, x, y, distance)
+
+    def spawn_at(self, kind, x, y, distance=0.0):
+        # Add one enemy at a map position, distance is its progress
+        if self.count == self.capacity:
+            self._allocate(self.capacity * 2)
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.next_slot
+            self.next_slot += 1
+        row = self.count
+        handle = (int(self.slot_generation[slot]) << SLOT_BITS) | slot
+        self.slot_row[slot] = row
+        self.handle[row] = handle
+        self.row_slot[row] = slot
+        self.kind[row] = kind
+        self.x[row], self.y[row] = x, y
+        self.speed[row] = self.type_speed[kind]
+        self.health[row] = self.type_health[kind]
+        self.max_health[row] = self.type_health[kind]
+        self.distance[row] = distance
+        self.slow[row] = 1.0
+        self.dead[row] = False
+        self.count += 1
+        self._order = None
+        return handle
+
+    def set_kind(self, rows, kinds):
+        # Turn enemies into another kind in place, with that kind's speed and full health
+        self.kind[rows] = kinds
+        self.speed[rows] = self.type_speed[kinds]
+        self.health[rows] = self.type_health[kinds]
+        self.max_health[rows] = self.type_health[kinds]
+
+    def row_of(self, handle):
+        # Row currently holding the enemy, or None if it is gone
+        slot = handle & SLOT_MASK
+        if slot >= self.next_slot or self.slot_generation[slot] != handle >> SLOT_BITS:
+            return None
+        row = int(self.slot_row[slot])
+        return row if row >= 0 else None
+
+    def rows_of(self, handles):
+        # Rows for many handles at once, handles of enemies that are gone are left out
+        handles = np.asarray(handles, dtype=np.int64)
+        slots = handles & SLOT_MASK
+        found = slots < self.next_slot
+        slots = slots[found]
+        found[found] = self.slot_generation[slots] == handles[found] >> SLOT_BITS
+        rows = self.slot_row[handles[found] & SLOT_MASK]
+        return rows[rows >= 0]
+
+    def find_rows(self, handles):
+        # Row for each handle in order, -1 where the enemy is gone
+        handles = np.asarray(handles, dtype=np.int64)
+        slots = handles & SLOT_MASK
+        rows = np.full(len(handles), -1, dtype=np.int64)
+        found = slots < self.next_slot
+        found[found] = self.slot_generation[slots[found]] == handles[found] >> SLOT_BITS
+        rows[found] = self.slot_row[slots[found]]
+        return rows
+
+    def __contains__(self, handle):
+        return self.row_of(handle) is not None
+
+    def get(self, handle):
+        # Object style access to one enemy, None if it is gone
+        return EnemyRecord(self, handle) if handle in self else None
+
+    def kill_rows(self, rows):
+        """Retire the enemies in rows right away, their rows are reclaimed on the next flush.
+
+        Their handles stop resolving immediately and their distance is set below the
+        start of the path, so targeting passes them over until they are removed.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[~self.dead[rows]]
+        if len(rows) == 0:
+            return
+        slots = self.row_slot[rows]
+        self.slot_generation[slots] += 1
+        self.slot_row[slots] = -1
+        self.free_slots.extend(slots.tolist())
+        self.dead[rows] = True
+        self.distance[rows] = -1.0
+        self.dead_count += len(rows)
+        self._order = None
+
+    def kill(self, handle):
+        row = self.row_of(handle)
+        if row is not None:
+            self.kill_rows([row])
+
+    def flush_removals(self):
+        # Swap-remove every dead row: live rows from the end move into the holes
+        if self.dead_count == 0:
+            return
+        n = self.count
+        remaining = n - self.dead_count
+        holes = np.flatnonzero(self.dead[:remaining])
+        movers = remaining + np.flatnonzero(~self.dead[remaining:n])
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            column[holes] = column[movers]
+        self.slot_row[self.row_slot[holes]] = holes
+        self.dead[:n] = False
+        self.count = remaining
+        self.dead_count = 0
+        self._order = None
+
+    def advance(self, steps):
+        """Move every live enemy along the path, steps is the distance per unit speed.
+
+        Enemies that walk past the end leak: they are removed and the number of them is
+        returned so the caller can take the lives in one go.
+        """
+        self.flush_removals()
+        n = self.count
+        if n == 0:
+            return 0
+
+        distance = self.distance[:n]
+        distance += self.speed[:n] * self.slow[:n] * steps
+        self.slow[:n] = 1.0  # Slow fields are reapplied every tick
+        self._order = None
+        self.position_version += 1
+
+        leaked = np.flatnonzero(self.path.past_end(distance))
+        if len(leaked):
+            self.kill_rows(leaked)
+            self.flush_removals()
+            n = self.count
+
+        # Positions come straight from the arc length, so fast enemies can't overshoot corners
+        self.x[:n], self.y[:n] = self.path.position_at(self.distance[:n])
+        return len(leaked)
+
+    def distance_order(self):
+        """Rows sorted by distance along the path, and the sorted distances themselves.
+
+        Built at most once per tick and shared by every tower, which then finds the
+        furthest enemy in any stretch of path with a binary search.
+        """
+        if self._order is None:
+            distance = self.distance[:self.count]
+            # Enemies rarely pass each other, and stable sort is fast on nearly sorted input
+            order = np.argsort(distance, kind='stable')
+            self._order = (order, distance[order])
+        return self._order
+
+class EnemyRecord:
+    """One enemy seen as an object, for code that isn't hot enough to work on columns."""
+
+    __slots__ = ('store', 'handle')
+
+    def __init__(self, store, handle):
+        self.store = store
+        self.handle = handle
+
+    @property
+    def alive(self):
+        return self.handle in self.store
+
+    def _column(self, name):
+        row = self.store.row_of(self.handle)
+        if row is None:
+            raise LookupError(f"Enemy {self.handle:#x} is gone")
+        return getattr(self.store, name)[row].item()
+
+    @property
+    def kind(self):
+        return self._column('kind')
+
+    @property
+    def x(self):
+        return self._column('x')
+
+    @property
+    def y(self):
+        return self._column('y')
+
+    @property
+    def health(self):
+        return self._column('health')
+
+    @property
+    def distance(self):
+        return self._column('distance')
@@ -0,0 +1,109 @@
+import collections
+import os
+import sys
+import threading
+
+# Game events go through here instead of print(). A disabled event costs one dict lookup
+# and a compare, and an enabled one is only a tuple appended to an in-memory ring buffer.
+# Nothing is formatted or written until the buffer is flushed, either by the background
+# writer thread or at the end of a level.
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+OFF = 100
+
+LEVEL_NAMES = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'off': OFF}
+
+class EventLog:
+    def __init__(self, level=INFO, capacity=8192, stream=None):
+        self.level = level  # Level for any category without its own setting
+        self.category_levels = {}
+        self.buffer = collections.deque(maxlen=capacity)
+        self.dropped = 0  # Events pushed out of the ring buffer before they were written
+        self.stream = stream
+        self._lock = threading.Lock()  # Only one flush writes at a time
+        self._writer = None
+        self._stop = threading.Event()
+
+    def configure(self, spec):
+        """Set levels from a string like "info,combat:debug,spawn:off".
+
+        A bare level sets the default, category:level overrides one category.
+        """
+        for part in spec.split(','):
+            part = part.strip().lower()
+            if not part:
+                continue
+            category, _, name = part.rpartition(':')
+            if name not in LEVEL_NAMES:
+                raise ValueError(f"Unknown log level {name!r} in {spec!r}")
+            if category:
+                self.category_levels[category] = LEVEL_NAMES[name]
+            else:
+                self.level = LEVEL_NAMES[name]
+
+    def set_level(self, category, level):
+        self.category_levels[category] = level
+
+    def enabled(self, category, level=INFO):
+        return level >= self.category_levels.get(category, self.level)
+
+    def log(self, category, level, message, *args):
+        # message is only %-formatted with args when the buffer is written out
+        if level < self.category_levels.get(category, self.level):
+            return
+        buffer = self.buffer
+        if len(buffer) == buffer.maxlen:
+            self.dropped += 1
+        buffer.append((category, level, message, args))
+
+    def debug(self, category, message, *args):
+        self.log(category, DEBUG, message, *args)
+
+    def info(self, category, message, *args):
+        self.log(category, INFO, message, *args)
+
+    def warning(self, category, message, *args):
+        self.log(category, WARNING, message, *args)
+
+    def flush(self):
+        # Format and write everything buffered so far
+        with self._lock:
+            buffer = self.buffer
+            lines = []
+            while buffer:
+                category, level, message, args = buffer.popleft()
+                lines.append(f"[{category}] {message % args if args else message}\n")
+            if self.dropped:
+                lines.append(f"[log] {self.dropped} events dropped, the buffer was full\n")
+                self.dropped = 0
+            if lines:
+                stream = self.stream or sys.stdout
+                stream.write(''.join(lines))
+                stream.flush()
+
+    def start_writer(self, interval=0.25):
+        # Flush from a background thread every interval seconds, so the frame loop never writes
+        if self._writer is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self.flush()
+            self.flush()
+
+        self._writer = threading.Thread(target=run, name='event-log-writer', daemon=True)
+        self._writer.start()
+
+    def stop_writer(self):
+        if self._writer is not None:
+            self._stop.set()
+            self._writer.join()
+            self._writer = None
+        self.flush()
+
+# Shared log for the whole game, TD_LOG sets the levels (see EventLog.configure)
+log = EventLog()
+log.configure(os.environ.get('TD_LOG', ''))
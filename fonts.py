@@ -0,0 +1,68 @@
+import json
+import os
+
+import pygame
+
+# Finding a system font by name (pygame.font.SysFont) makes pygame list every installed
+# font first, which on Linux means running fc-list and can take hundreds of ms. The file
+# a name resolves to is remembered in FONT_CACHE, so that only happens the first time.
+# Names that aren't installed fall back to pygame's bundled default font. That miss is
+# remembered too, along with a fingerprint of the font directories, and looked up again
+# once they change so a font installed later gets picked up.
+
+FONT_CACHE = 'font_cache.json'
+FONT_DIRS_KEY = '_font_dirs'  # Fingerprint the cached misses were made with
+
+FONT_DIRS = [
+    '/usr/share/fonts', '/usr/local/share/fonts', '~/.fonts', '~/.local/share/fonts',  # Linux
+    '/Library/Fonts', '/System/Library/Fonts', '~/Library/Fonts',  # macOS
+    os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'),  # Windows
+]
+if os.environ.get('LOCALAPPDATA'):
+    FONT_DIRS.append(os.path.join(os.environ['LOCALAPPDATA'], 'Microsoft', 'Windows', 'Fonts'))
+
+def _font_dirs_fingerprint():
+    # Newest modification time and count of the font directories, installing a font
+    # changes at least one. Only the directories are looked at, so it stays quick.
+    newest, count = 0.0, 0
+    for top in FONT_DIRS:
+        for directory, _, _ in os.walk(os.path.expanduser(top)):
+            try:
+                newest = max(newest, os.stat(directory).st_mtime)
+            except OSError:
+                continue
+            count += 1
+    return f"{count}:{newest}"
+
+def _read_cache():
+    try:
+        with open(FONT_CACHE) as file:
+            cache = json.load(file)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def resolve_font(name):
+    """Path of the font file for a system font name, or None for the bundled default."""
+    cache = _read_cache()
+    if name in cache:
+        if cache[name] is None:
+            if cache.get(FONT_DIRS_KEY) == _font_dirs_fingerprint():
+                return None  # Still not installed
+        elif os.path.exists(cache[name]):
+            return cache[name]
+    path = pygame.font.match_font(name)  # The slow part
+    cache[name] = path
+    if path is None:
+        cache[FONT_DIRS_KEY] = _font_dirs_fingerprint()
+    try:
+        with open(FONT_CACHE, 'w') as file:
+            json.dump(cache, file)
+    except OSError:
+        pass  # A read-only checkout just looks it up every time
+    return path
+
+def load_font(name, size):
+    if not pygame.font.get_init():
+        pygame.font.init()
+    return pygame.font.Font(resolve_font(name), size)
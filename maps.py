@@ -0,0 +1,125 @@
+import json
+
+from maze import Maze
+from path import build_path
+from simulation import GameState, PATH, WIDTH, HEIGHT
+
+# A map file gives the size of the map in pixels and one path per entrance, each a list
+# of [x, y] points from where enemies come in to where they leak:
+#
+#     {"width": 4000, "height": 3000,
+#      "paths": [[[50, 1500], [900, 1500], [900, 600], ...],
+#                [[2000, 50], [2000, 900], ...]]}
+#
+# Enemies take turns between the entrances in the order the paths are listed. The map
+# can be far bigger than the window, the viewer scrolls and zooms around it.
+#
+# A mazing map has a grid instead of paths. Enemies walk from the entrance cells to the
+# nearest exit cell around whatever is in the way, and every tower blocks its cell:
+#
+#     {"width": 1600, "height": 1200,
+#      "maze": {"cell_size": 40, "entrances": [[0, 14]], "exits": [[39, 15]],
+#               "walls": [[10, 0, 1, 12], [25, 20]]}}
+#
+# Cells are [column, row]. A wall is one cell, or [column, row, columns, rows] for a block.
+
+class GameMap:
+    """Size of a map and the paths across it."""
+
+    def __init__(self, width, height, paths, name='default', maze=None):
+        self.width = width
+        self.height = height
+        self.paths = paths  # Empty for a mazing map
+        self.name = name
+        self.maze = maze  # Keyword arguments for Maze on a mazing map
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def new_game(self, waves, **kwargs):
+        # A fresh GameState on this map, kwargs go to GameState (money, lives)
+        if self.maze is not None:
+            return GameState(waves, size=self.size, maze=Maze(self.width, self.height, **self.maze), **kwargs)
+        return GameState(waves, path=build_path(self.paths), size=self.size, **kwargs)
+
+# The original 800x600 map
+DEFAULT_MAP = GameMap(WIDTH, HEIGHT, [PATH])
+
+def _size(value, where):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{where} must be a whole number of pixels, got {value!r}")
+    return value
+
+def _cells(value, where, columns, rows, blocks=False):
+    # List of [column, row] cells inside the grid, [column, row, columns, rows] blocks too if allowed
+    if not isinstance(value, list):
+        raise ValueError(f"{where} must be a list of [column, row] cells")
+    cells = []
+    for item in value:
+        sizes = (2, 4) if blocks else (2,)
+        if (not isinstance(item, list) or len(item) not in sizes
+                or any(isinstance(v, bool) or not isinstance(v, int) or v < 0 for v in item)):
+            raise ValueError(f"{where}: {item!r} is not a [column, row] cell")
+        column, row, width, height = item + [1, 1] if len(item) == 2 else item
+        if column + width > columns or row + height > rows:
+            raise ValueError(f"{where}: {item!r} is outside the {columns}x{rows} grid")
+        cells.extend((c, r) for r in range(row, row + height) for c in range(column, column + width))
+    return cells
+
+def _maze(config, name, width, height):
+    where = f"{name}: maze"
+    if not isinstance(config, dict):
+        raise ValueError(f"{where} must be an object")
+    unknown = set(config) - {'cell_size', 'entrances', 'exits', 'walls'}
+    if unknown:
+        raise ValueError(f"{where}: unknown fields {', '.join(sorted(unknown))}")
+    cell_size = _size(config.get('cell_size', 40), f"{where}: cell_size")
+    columns, rows = width // cell_size, height // cell_size
+    entrances = _cells(config.get('entrances'), f"{where}: entrances", columns, rows)
+    exits = _cells(config.get('exits'), f"{where}: exits", columns, rows)
+    walls = _cells(config.get('walls', []), f"{where}: walls", columns, rows, blocks=True)
+    if not entrances or not exits:
+        raise ValueError(f"{where} needs at least one entrance and one exit")
+    if set(walls) & (set(entrances) | set(exits)):
+        raise ValueError(f"{where}: walls can't cover an entrance or exit")
+    maze = {'cell_size': cell_size, 'entrances': entrances, 'exits': exits, 'walls': walls}
+    grid = Maze(width, height, **maze)
+    if not grid.field.reachable(grid.entrance_cells):
+        raise ValueError(f"{where}: the walls cut an entrance off from every exit")
+    return maze
+
+def validate_map(config, name='map'):
+    """Check a map file's contents against the layout above and return it as a GameMap.
+
+    Raises ValueError naming the field that is wrong.
+    """
+    if not isinstance(config, dict):
+        raise ValueError(f"{name} must be a JSON object with width, height and paths")
+    unknown = set(config) - {'width', 'height', 'paths', 'maze'}
+    if unknown:
+        raise ValueError(f"{name}: unknown fields {', '.join(sorted(unknown))}")
+    width = _size(config.get('width'), f"{name}: width")
+    height = _size(config.get('height'), f"{name}: height")
+    if 'maze' in config:
+        if 'paths' in config:
+            raise ValueError(f"{name}: a map has either paths or a maze, not both")
+        return GameMap(width, height, [], name, _maze(config['maze'], name, width, height))
+    paths = config.get('paths')
+    if not isinstance(paths, list) or not paths:
+        raise ValueError(f"{name}: paths must be a list with at least one path")
+    for i, points in enumerate(paths):
+        where = f"{name}: path {i + 1}"
+        if not isinstance(points, list) or len(points) < 2:
+            raise ValueError(f"{where} must be a list of at least two [x, y] points")
+        for point in points:
+            if (not isinstance(point, list) or len(point) != 2
+                    or any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in point)):
+                raise ValueError(f"{where}: {point!r} is not an [x, y] point")
+            if not (0 <= point[0] <= width and 0 <= point[1] <= height):
+                raise ValueError(f"{where}: {point!r} is outside the {width}x{height} map")
+    return GameMap(width, height, [[tuple(point) for point in points] for points in paths], name)
+
+def load_map(filename):
+    with open(filename, 'r') as file:
+        return validate_map(json.load(file), filename)
@@ -0,0 +1,316 @@
+import heapq
+from collections import deque
+
+import numpy as np
+
+from enemy_store import EnemyStore
+
+# Mazing mode: instead of walking a fixed path, enemies cross an open grid to the exit and
+# every tower blocks the cell it stands on, so the player builds the maze. All enemies
+# share one flow field: each cell knows its walking distance to the nearest exit and the
+# neighbor to step to next, so an enemy's pathfinding each tick is one array lookup.
+
+UNREACHABLE = 1 << 30  # Distance of blocked cells and cells walled off from every exit
+
+class FlowField:
+    """Walking distance to the nearest exit for every cell of a grid, kept up to date.
+
+    Cells are numbered row by row and connect to their four neighbors. Blocking or
+    unblocking one cell only revisits the cells whose distance actually changes: a block
+    first finds the cells that lost every way down (their distance can only grow), then
+    re-settles just those from their unaffected neighbors. An unblock spreads the shorter
+    distances out from the freed cell. The bookkeeping runs on Python lists; dist and
+    next_cell are NumPy copies for the enemies to index with whole arrays.
+    """
+
+    def __init__(self, columns, rows, exits, blocked=()):
+        self.columns = columns
+        self.rows = rows
+        count = columns * rows
+        self.neighbors = []
+        for cell in range(count):
+            column, row = cell % columns, cell // columns
+            self.neighbors.append([cell + step for step, ok in ((-columns, row > 0), (-1, column > 0),
+                                                                (1, column < columns - 1), (columns, row < rows - 1)) if ok])
+        self.exits = list(exits)
+        self.blocked = [False] * count
+        for cell in blocked:
+            self.blocked[cell] = True
+        self._dist = [UNREACHABLE] * count
+        self.dist = np.full(count, UNREACHABLE, dtype=np.int64)
+        self.next_cell = np.arange(count, dtype=np.int64)  # Where to step next, itself when there's nowhere to go
+        self.rebuild()
+
+    def rebuild(self):
+        # Breadth first search out from the exits over the whole grid
+        dist = self._dist = [UNREACHABLE] * len(self.blocked)
+        queue = deque()
+        for cell in self.exits:
+            if not self.blocked[cell]:
+                dist[cell] = 0
+                queue.append(cell)
+        while queue:
+            cell = queue.popleft()
+            for neighbor in self.neighbors[cell]:
+                if dist[neighbor] == UNREACHABLE and not self.blocked[neighbor]:
+                    dist[neighbor] = dist[cell] + 1
+                    queue.append(neighbor)
+        self._publish(range(len(dist)))
+
+    def block(self, cell):
+        """Make cell impassable and fix up every distance that depended on it.
+
+        Returns the cells whose distance changed.
+        """
+        dist, neighbors = self._dist, self.neighbors
+        self.blocked[cell] = True
+        old = dist[cell]
+        changed = [cell]
+        dist[cell] = UNREACHABLE
+        if old == UNREACHABLE:
+            self._publish(changed)
+            return changed
+
+        # Cells one further out that may have relied on this one, nearest first. A cell is
+        # only affected if none of its neighbors is still one step closer to the exit.
+        affected = []
+        queue = deque(neighbor for neighbor in neighbors[cell] if dist[neighbor] == old + 1)
+        while queue:
+            cell = queue.popleft()
+            d = dist[cell]
+            if d == UNREACHABLE or any(dist[neighbor] == d - 1 for neighbor in neighbors[cell]):
+                continue
+            dist[cell] = UNREACHABLE
+            affected.append(cell)
+            queue.extend(neighbor for neighbor in neighbors[cell] if dist[neighbor] == d + 1)
+
+        # Settle the affected cells again from the unaffected ones around them
+        heap = []
+        for cell in affected:
+            best = min(dist[neighbor] for neighbor in neighbors[cell])
+            if best < UNREACHABLE:
+                dist[cell] = best + 1
+                heap.append((best + 1, cell))
+        heapq.heapify(heap)
+        self._spread(heap)
+        changed.extend(affected)
+        self._publish(changed)
+        return changed
+
+    def unblock(self, cell):
+        """Open cell up again and spread the shorter ways through it. Returns the changed cells."""
+        dist = self._dist
+        self.blocked[cell] = False
+        if cell in self.exits:
+            dist[cell] = 0
+        else:
+            dist[cell] = min(UNREACHABLE - 1, min(dist[neighbor] for neighbor in self.neighbors[cell])) + 1
+        changed = [cell]
+        if dist[cell] < UNREACHABLE:
+            changed.extend(self._spread([(dist[cell], cell)]))
+        else:
+            dist[cell] = UNREACHABLE
+        self._publish(changed)
+        return changed
+
+    def _spread(self, heap):
+        # Dijkstra from the cells on the heap, lowering any distance it can. Returns the lowered cells.
+        dist, blocked, neighbors = self._dist, self.blocked, self.neighbors
+        lowered = []
+        while heap:
+            d, cell = heapq.heappop(heap)
+            if d > dist[cell]:
+                continue
+            for neighbor in neighbors[cell]:
+                if dist[neighbor] > d + 1 and not blocked[neighbor]:
+                    dist[neighbor] = d + 1
+                    lowered.append(neighbor)
+                    heapq.heappush(heap, (d + 1, neighbor))
+        return lowered
+
+    def _publish(self, cells):
+        # Copy changed distances to the arrays and re-point these cells and their neighbors.
+        # The next cell only depends on the distances, so it is the same however they were reached.
+        dist, neighbors = self._dist, self.neighbors
+        touched = set(cells)
+        for cell in cells:
+            touched.update(neighbors[cell])
+        for cell in touched:
+            self.dist[cell] = dist[cell]
+            best = cell
+            for neighbor in neighbors[cell]:
+                if dist[neighbor] < dist[best]:
+                    best = neighbor
+            self.next_cell[cell] = best
+
+    def reachable(self, cells):
+        return all(self._dist[cell] < UNREACHABLE for cell in cells)
+
+class MazeLayout:
+    """The parts of a Maze that never change once it's built: its grid, walls, entrances and exits.
+
+    It's all the renderer needs, so a Frame carries this instead of the Maze, whose flow
+    field the simulation thread changes whenever a tower goes up or a placement is tried.
+    """
+
+    def __init__(self, maze):
+        self.width, self.height = maze.width, maze.height
+        self.cell_size = maze.cell_size
+        self.columns, self.rows = maze.columns, maze.rows
+        self.entrance_cells = tuple(maze.entrance_cells)
+        self.exit_cells = tuple(maze.exit_cells)
+        self.wall_cells = tuple(maze.wall_cells)
+
+    def snap(self, x, y):
+        # Middle of the cell under (x, y), where a tower built there stands
+        half = self.cell_size // 2
+        return int(x // self.cell_size) * self.cell_size + half, int(y // self.cell_size) * self.cell_size + half
+
+class Maze:
+    """An open map divided into square cells, with entrances, exits and fixed walls.
+
+    Towers stand in the middle of a cell and block it. Positions are in map pixels, cells
+    are numbered row by row like in the FlowField.
+    """
+
+    def __init__(self, width, height, cell_size, entrances, exits, walls=()):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.columns = width // cell_size
+        self.rows = height // cell_size
+        # (column, row) pairs as given, and as cell numbers
+        self.entrance_cells = [self.cell(column, row) for column, row in entrances]
+        self.exit_cells = [self.cell(column, row) for column, row in exits]
+        self.wall_cells = [self.cell(column, row) for column, row in walls]
+        self.field = FlowField(self.columns, self.rows, self.exit_cells, self.wall_cells)
+        self.is_exit = np.zeros(self.columns * self.rows, dtype=bool)
+        self.is_exit[self.exit_cells] = True
+        cells = np.arange(self.columns * self.rows)
+        self.center_x = (cells % self.columns + 0.5) * cell_size
+        self.center_y = (cells // self.columns + 0.5) * cell_size
+        # Longer than any walk across the grid, enemy progress counts down from it
+        self.reach = float(self.columns * self.rows * cell_size)
+        self.layout = MazeLayout(self)  # One per maze, the renderer tells games apart by it
+
+    def cell(self, column, row):
+        return row * self.columns + column
+
+    def cells_at(self, x, y):
+        # Cell under each map position, works on scalars and arrays
+        column = np.clip(np.floor_divide(x, self.cell_size).astype(np.int64), 0, self.columns - 1)
+        row = np.clip(np.floor_divide(y, self.cell_size).astype(np.int64), 0, self.rows - 1)
+        return row * self.columns + column
+
+    snap = MazeLayout.snap
+
+    def _free(self, x, y, enemies):
+        # Cell at (x, y) if a tower could go there without looking at the flow field, else None
+        if not (0 <= x < self.columns * self.cell_size and 0 <= y < self.rows * self.cell_size):
+            return None
+        cell = int(self.cells_at(x, y))
+        if self.field.blocked[cell] or self.is_exit[cell] or cell in self.entrance_cells:
+            return None
+        n = enemies.count
+        if n and np.any(self.cells_at(enemies.x[:n], enemies.y[:n]) == cell):
+            return None  # Nothing gets built on top of an enemy
+        return cell
+
+    def _try_block(self, cell, enemies):
+        # Block the cell unless that cuts an entrance or an enemy off from every exit
+        field = self.field
+        field.block(cell)
+        n = enemies.count
+        stranded = np.unique(self.cells_at(enemies.x[:n], enemies.y[:n])).tolist() if n else []
+        if field.reachable(self.entrance_cells) and field.reachable(stranded):
+            return True
+        field.unblock(cell)
+        return False
+
+    def can_place(self, x, y, enemies):
+        cell = self._free(x, y, enemies)
+        if cell is None or not self._try_block(cell, enemies):
+            return False
+        self.field.unblock(cell)
+        return True
+
+    def add_tower(self, x, y, enemies):
+        # Block the cell for a tower at (x, y), returns False if it can't go there
+        cell = self._free(x, y, enemies)
+        return cell is not None and self._try_block(cell, enemies)
+
+    def remove_tower(self, x, y):
+        self.field.unblock(int(self.cells_at(x, y)))
+
+class MazeEnemyStore(EnemyStore):
+    """EnemyStore for mazing mode: enemies walk cell to cell down the shared flow field.
+
+    The distance column holds progress rather than distance walked: maze.reach minus the
+    walk still left to the exit, so sorting by it still puts the closest to leaking last.
+    """
+
+    MAX_HOPS = 4  # Cell centers an enemy can pass in one step, the rest of a longer step is lost
+
+    def __init__(self, enemy_types, maze, capacity=256):
+        super().__init__(enemy_types, None, capacity)
+        self.maze = maze
+
+    @property
+    def entrance_count(self):
+        return len(self.maze.entrance_cells)
+
+    def enter(self, kind, entrance):
+        # Spawn in the middle of the entrance cell
+        maze = self.maze
+        cell = maze.entrance_cells[entrance]
+        handle = self.spawn_at(kind, maze.center_x[cell], maze.center_y[cell])
+        self._measure(np.array([self.count - 1]))
+        return handle
+
+    def _measure(self, rows):
+        # Progress of the enemies in rows from where they stand
+        maze = self.maze
+        field = maze.field
+        next_cell = field.next_cell[maze.cells_at(self.x[rows], self.y[rows])]
+        left = np.hypot(maze.center_x[next_cell] - self.x[rows], maze.center_y[next_cell] - self.y[rows])
+        self.distance[rows] = maze.reach - (field.dist[next_cell] * maze.cell_size + left)
+
+    def advance(self, steps):
+        """Move every live enemy towards the exit, leaks are removed and counted like on a path.
+
+        An enemy always heads straight for the middle of the cell its own cell points to,
+        which is next to it, so it can't clip the corner of a blocked cell.
+        """
+        self.flush_removals()
+        n = self.count
+        if n == 0:
+            return 0
+        maze = self.maze
+        x, y = self.x[:n], self.y[:n]
+        budget = self.speed[:n] * self.slow[:n] * steps
+        self.slow[:n] = 1.0  # Slow fields are reapplied every tick
+        moving = np.arange(n)
+        for _ in range(self.MAX_HOPS):
+            target = maze.field.next_cell[maze.cells_at(x[moving], y[moving])]
+            dx = maze.center_x[target] - x[moving]
+            dy = maze.center_y[target] - y[moving]
+            length = np.hypot(dx, dy)
+            step = budget[moving]
+            scale = np.divide(step, length, out=np.ones_like(length), where=length > step)
+            x[moving] += dx * scale
+            y[moving] += dy * scale
+            budget[moving] = step - np.minimum(length, step)
+            # Whoever reached a cell center with some step left turns and carries on
+            moving = moving[(budget[moving] > 0) & (length > 0)]
+            if len(moving) == 0:
+                break
+        self._order = None
+        self.position_version += 1
+
+        leaked = np.flatnonzero(maze.is_exit[maze.cells_at(x, y)])
+        if len(leaked):
+            self.kill_rows(leaked)
+            self.flush_removals()
+            n = self.count
+        self._measure(np.arange(n))
+        return len(leaked)
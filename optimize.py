@@ -0,0 +1,289 @@
+"""Propose tower layouts for a money budget from how much of the path each spot covers.
+
+    python optimize.py                                   # Tower and SniperTower, 675 money
+    python optimize.py --budget 2000 --method beam --top 3
+    python optimize.py --map maps/canyon.json --types Tower SniperTower SplashTower --budget 6000
+    python optimize.py --budget 1500 --confirm 3 --levels 1 10 -o layouts.json
+
+Every grid spot a tower may stand on (clear of the path, see PlacementMap) is scored
+once per tower type: the length of path inside its range times its shots per second,
+which is how many shots an enemy walking past takes, per pixel per second of its speed.
+On a map with several entrances each lane counts for the share of enemies walking it.
+That is the coverage matrix, one row per tower type and one column per spot, and a
+layout's score is the sum of its towers' entries. Searching it only has to keep towers
+TOWER_RADIUS apart and within the budget, so it takes milliseconds:
+
+    greedy   best score per money first, until nothing more fits
+    beam     grows the best --beam-width layouts a tower at a time, trying the best
+             spots of every type that's still affordable
+    anneal   moves, swaps, adds and drops towers at random from the best layout found
+             so far, taking worse layouts less and less often as it cools down
+
+The score is only a stand-in for how well a layout holds: it knows nothing of splash,
+slowing or targeting. --confirm N plays the N best layouts headless through --levels
+and ranks them by how long they hold out, then by lives lost. -o writes the layouts in
+sweep.py's format.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from maps import DEFAULT_MAP, load_map
+from path import build_path
+from placement import PlacementMap
+from simulation import (TOWER_TYPES, Tower, SniperTower, TOWER_RADIUS, PATH_CLEARANCE, PATH_WIDTH, FRAME_TIME,
+                        load_compiled_waves)
+from event_log import log, OFF
+
+class CoverageMatrix:
+    """Score of every tower type at every spot on a grid over a map with paths.
+
+    x and y are the spots, value[type, spot] the score there and cost[type] the price,
+    both indexed like tower_types.
+    """
+
+    def __init__(self, game_map, tower_types=(Tower, SniperTower), grid=10):
+        if game_map.maze is not None:
+            raise ValueError(f"{game_map.name} is a mazing map, the towers make the path there")
+        self.game_map = game_map
+        self.tower_types = list(tower_types)
+        path = build_path(game_map.paths)
+        placement = PlacementMap(game_map.width, game_map.height, path, PATH_CLEARANCE, PATH_WIDTH, TOWER_RADIUS)
+        xs = np.arange(grid // 2, game_map.width, grid)
+        ys = np.arange(grid // 2, game_map.height, grid)
+        x, y = np.meshgrid(xs, ys)
+        free = ~placement.near_path[np.ix_(ys, xs)]
+        self.x, self.y = x[free], y[free]
+        self.spacing = placement.tower_radius
+
+        # Tower stats are set per instance, so ask one of each
+        towers = [tower_type(0, 0) for tower_type in self.tower_types]
+        self.cost = np.array([tower.cost for tower in towers])
+        shots_per_second = np.array([120 / tower.rate_of_fire for tower in towers])
+        lanes = path.paths
+        self.coverage = np.zeros((len(towers), len(self.x)))
+        for row, tower in enumerate(towers):
+            for lane in lanes:
+                self.coverage[row] += lane.covered_length(self.x, self.y, tower.range) / len(lanes)
+        self.value = self.coverage * shots_per_second[:, None]
+
+    def __len__(self):
+        return len(self.x)
+
+    def clear_of(self, spots):
+        # Which spots are far enough from every one of spots for another tower
+        clear = np.ones(len(self.x), dtype=bool)
+        for spot in spots:
+            clear &= (self.x - self.x[spot]) ** 2 + (self.y - self.y[spot]) ** 2 >= self.spacing ** 2
+        return clear
+
+    def score(self, towers):
+        return float(sum(self.value[kind, spot] for kind, spot in towers))
+
+    def layout(self, towers):
+        return Layout(self, towers)
+
+class Layout:
+    """Towers as (type row, spot) pairs in a CoverageMatrix, with their score and cost."""
+
+    def __init__(self, matrix, towers):
+        self.towers = tuple(sorted(towers))  # Same towers in any order are the same layout
+        self.score = matrix.score(self.towers)
+        self.cost = int(sum(matrix.cost[kind] for kind, _ in self.towers))
+        self.matrix = matrix
+
+    def as_list(self):
+        # [["Tower", x, y], ...] like sweep.py layouts
+        matrix = self.matrix
+        return [[matrix.tower_types[kind].__name__, int(matrix.x[spot]), int(matrix.y[spot])] for kind, spot in self.towers]
+
+    def __str__(self):
+        towers = ", ".join(f"{name} ({x}, {y})" for name, x, y in self.as_list())
+        return f"score {self.score:8.1f}  cost {self.cost:5d}  {towers or 'no towers'}"
+
+def greedy(matrix, budget):
+    """Keep adding the tower with the best score for its cost that still fits and is affordable."""
+    ratio = matrix.value / matrix.cost[:, None]
+    clear = np.ones(len(matrix), dtype=bool)
+    money = budget
+    towers = []
+    while True:
+        options = np.where(clear[None, :] & (matrix.cost <= money)[:, None], ratio, -np.inf)
+        best = int(np.argmax(options))
+        kind, spot = divmod(best, len(matrix))
+        if not options[kind, spot] > 0:
+            return matrix.layout(towers)
+        towers.append((kind, spot))
+        money -= matrix.cost[kind]
+        clear &= matrix.clear_of([spot])
+
+def beam_search(matrix, budget, width=8):
+    """Grow width layouts at once, each by the width best free spots of every affordable type.
+
+    Returns every finished layout, best first.
+    """
+    best_ratio = float((matrix.value / matrix.cost[:, None]).max())
+    beams = [matrix.layout([])]
+    finished = {}
+    while beams:
+        children = {}
+        for layout in beams:
+            money = budget - layout.cost
+            clear = matrix.clear_of([spot for _, spot in layout.towers])
+            grown = False
+            for kind in np.flatnonzero(matrix.cost <= money).tolist():
+                values = np.where(clear, matrix.value[kind], -np.inf)
+                best = np.argpartition(-values, min(width, len(values) - 1))[:width]
+                for spot in best[values[best] > 0].tolist():
+                    child = matrix.layout(layout.towers + ((kind, spot),))
+                    children[child.towers] = child
+                    grown = True
+            if not grown:
+                finished[layout.towers] = layout
+        # Partial layouts are ranked with their money left counted at the best rate there is,
+        # or expensive towers would always win the first steps
+        beams = sorted(children.values(), key=lambda layout: -(layout.score + (budget - layout.cost) * best_ratio))[:width]
+    return sorted(finished.values(), key=lambda layout: -layout.score)
+
+def anneal(matrix, budget, start, iterations=3000, seed=0, candidates=400):
+    """Simulated annealing from the start layout, returns the best layout it came across.
+
+    New towers are drawn from the candidates best spots of each type, anything else is
+    never worth trying.
+    """
+    rng = np.random.default_rng(seed)
+    top = [np.argsort(-matrix.value[kind])[:candidates] for kind in range(len(matrix.tower_types))]
+    spacing_squared = matrix.spacing ** 2
+    current = list(start.towers)
+    score = best_score = start.score
+    best = current[:]
+    cost = start.cost
+    temperature = max(float(matrix.value.max()) * 0.2, 1e-9)
+
+    def fits(kind, spot, others):
+        return all((matrix.x[spot] - matrix.x[other]) ** 2 + (matrix.y[spot] - matrix.y[other]) ** 2 >= spacing_squared
+                   for _, other in others)
+
+    for i in range(iterations):
+        heat = temperature * (1 - i / iterations) + 1e-9
+        move = rng.random()
+        trial = current[:]
+        if trial and move < 0.6:
+            trial.pop(rng.integers(len(trial)))  # Move or swap one tower
+            move = 1.0
+        elif trial and move < 0.7:
+            trial.pop(rng.integers(len(trial)))  # Drop one, the money may fit something better later
+            move = 0.0
+        if move >= 0.7:
+            kind = int(rng.integers(len(top)))
+            spot = int(top[kind][rng.integers(len(top[kind]))])
+            if not fits(kind, spot, trial):
+                continue
+            trial.append((kind, spot))
+        trial_cost = int(sum(matrix.cost[kind] for kind, _ in trial))
+        if trial_cost > budget:
+            continue
+        trial_score = matrix.score(trial)
+        if trial_score >= score or rng.random() < math.exp((trial_score - score) / heat):
+            current, score, cost = trial, trial_score, trial_cost
+            if score > best_score:
+                best, best_score = current[:], score
+    return matrix.layout(best)
+
+def propose(matrix, budget, method='all', beam_width=8, iterations=3000, seed=0):
+    # Layouts from the chosen search (or all of them), best first and without repeats
+    layouts = {}
+    start = greedy(matrix, budget)
+    if method in ('greedy', 'anneal', 'all'):
+        layouts[start.towers] = start
+    if method in ('beam', 'all'):
+        for layout in beam_search(matrix, budget, beam_width):
+            layouts.setdefault(layout.towers, layout)
+    if method in ('anneal', 'all'):
+        best = max(layouts.values(), key=lambda layout: layout.score)
+        layout = anneal(matrix, budget, best, iterations, seed)
+        layouts.setdefault(layout.towers, layout)
+    if method == 'anneal':
+        layouts = {layout.towers: layout}  # Greedy was only the starting point
+    return sorted(layouts.values(), key=lambda layout: -layout.score)
+
+def confirm(layout, first=1, last=17, lives=25, waves=None):
+    """Play the layout headless from level first to last, returns (lives lost, money, leaks per level played).
+
+    Starts with exactly the layout's cost in money, so only its towers get built.
+    """
+    state = layout.matrix.game_map.new_game(waves if waves is not None else load_compiled_waves(),
+                                            money=layout.cost, lives=lives)
+    for name, x, y in layout.as_list():
+        if not state.add_tower(TOWER_TYPES[name](x, y)):
+            raise ValueError(f"{name} at ({x}, {y}) doesn't fit, the coverage matrix is out of step with the game")
+    leaks = []
+    for level in range(first, last + 1):
+        leaks.append(state.play_level(level if level == first else None, FRAME_TIME))
+        if state.lives <= 0:
+            break  # Lost, the rest of the levels tell us nothing
+    return lives - state.lives, state.money, leaks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--map', help="Map file to place on, the default map without one")
+    parser.add_argument('--budget', type=int, default=675, help="Money to spend on towers")
+    parser.add_argument('--types', nargs='+', default=['Tower', 'SniperTower'], choices=list(TOWER_TYPES),
+                        help="Tower types to choose from")
+    parser.add_argument('--grid', type=int, default=10, help="Pixels between the spots tried")
+    parser.add_argument('--method', default='all', choices=('greedy', 'beam', 'anneal', 'all'))
+    parser.add_argument('--beam-width', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=3000, help="Annealing steps")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--top', type=int, default=5, help="How many layouts to show")
+    parser.add_argument('--confirm', type=int, default=0, metavar='N', help="Play the N best layouts headless")
+    parser.add_argument('--levels', type=int, nargs=2, default=(1, 17), metavar=('FIRST', 'LAST'),
+                        help="Levels --confirm plays")
+    parser.add_argument('-o', '--output', help="Write the layouts to this file in sweep.py's format")
+    args = parser.parse_args(argv)
+    if args.grid < 1 or args.budget < 0:
+        parser.error("--grid must be at least 1 and --budget can't be negative")
+
+    try:
+        game_map = load_map(args.map) if args.map else DEFAULT_MAP
+        started = time.perf_counter()
+        matrix = CoverageMatrix(game_map, [TOWER_TYPES[name] for name in args.types], args.grid)
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    built = time.perf_counter()
+    layouts = propose(matrix, args.budget, args.method, args.beam_width, args.iterations, args.seed)[:args.top]
+    searched = time.perf_counter()
+    print(f"{len(matrix)} spots on {game_map.name} for {', '.join(args.types)}: matrix in "
+          f"{(built - started) * 1000:.0f} ms, {args.method} search in {(searched - built) * 1000:.0f} ms")
+    for rank, layout in enumerate(layouts, 1):
+        print(f"{rank:3d}  {layout}")
+
+    if args.confirm:
+        log.level = OFF  # The level messages of every game would bury the table
+        first, last = args.levels
+        waves = load_compiled_waves()
+        print(f"\nPlaying levels {first} to {last}:")
+        results = []
+        for rank, layout in enumerate(layouts[:args.confirm], 1):
+            lives_lost, money, leaks = confirm(layout, first, last, waves=waves)
+            results.append((-len(leaks), lives_lost, -money, rank))  # Holding out longer wins first
+            print(f"{rank:3d}  lives lost {lives_lost:3d}  money {money:6d}  leaks {' '.join(map(str, leaks))}", flush=True)
+        best = min(results)[-1]
+        print(f"Best when played: layout {best}")
+
+    if args.output:
+        spec = {'layouts': [{'name': f"{args.method} {rank}", 'towers': layout.as_list()}
+                            for rank, layout in enumerate(layouts, 1)],
+                'money': args.budget}
+        with open(args.output, 'w') as file:
+            json.dump(spec, file, indent=2)
+        print(f"Wrote {len(layouts)} layouts to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import numpy as np
+
+class Path:
+    """A polyline enemies walk along, measured by arc length.
+
+    Segment lengths, the running total of them and the unit direction of every segment
+    are worked out once. An enemy then only needs to remember how far it has walked,
+    and its position is a binary search over the segments plus one multiply-add.
+    """
+
+    def __init__(self, points):
+        self.points = np.array(points, dtype=np.float64)
+        deltas = np.diff(self.points, axis=0)
+        self.segment_lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        # cumulative[i] is the distance along the path at points[i]
+        self.cumulative = np.concatenate(([0.0], np.cumsum(self.segment_lengths)))
+        self.directions = np.divide(deltas, self.segment_lengths[:, None],
+                                    out=np.zeros_like(deltas), where=self.segment_lengths[:, None] > 0)
+        self.length = float(self.cumulative[-1])
+
+    # Behave like the old list of (x, y) tuples for drawing code
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, index):
+        x, y = self.points[index]
+        return (int(x), int(y))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def paths(self):
+        # A single path is a network of one, for code that handles both
+        return [self]
+
+    def start_of(self, lane):
+        return 0.0
+
+    def past_end(self, distance):
+        # Whether enemies at these distances have walked off the end
+        return distance >= self.length
+
+    def progress(self, distance):
+        # Larger is closer to the exit, only meant for comparing enemies. On one path
+        # that's just the distance.
+        return distance
+
+    def segment_at(self, distance):
+        # Index of the segment containing distance, works on scalars and arrays
+        index = np.searchsorted(self.cumulative, distance, side='right') - 1
+        return np.clip(index, 0, len(self.segment_lengths) - 1)
+
+    def position_at(self, distance):
+        # (x, y) at the given distance along the path, clamped to the end points
+        distance = np.clip(distance, 0.0, self.length)
+        segment = self.segment_at(distance)
+        along = distance - self.cumulative[segment]
+        start = self.points[segment]
+        direction = self.directions[segment]
+        if np.ndim(distance) == 0:
+            return float(start[0] + direction[0] * along), float(start[1] + direction[1] * along)
+        return start[:, 0] + direction[:, 0] * along, start[:, 1] + direction[:, 1] * along
+
+    def coverage(self, x, y, radius):
+        """Stretches of the path inside the circle at (x, y), as sorted (start, end) distances.
+
+        Towers and the path never move, so a tower can ask this once and then find enemies
+        in range by their distance along the path alone.
+        """
+        intervals = []
+        for i, length in enumerate(self.segment_lengths):
+            if length == 0:
+                continue
+            # Solve |start + direction * t - center| < radius for t on this segment
+            start_x, start_y = self.points[i]
+            direction_x, direction_y = self.directions[i]
+            to_center_x, to_center_y = x - start_x, y - start_y
+            along = direction_x * to_center_x + direction_y * to_center_y
+            discriminant = along * along - (to_center_x ** 2 + to_center_y ** 2 - radius * radius)
+            if discriminant <= 0:
+                continue
+            half_chord = discriminant ** 0.5
+            t0 = max(along - half_chord, 0.0)
+            t1 = min(along + half_chord, length)
+            if t0 >= t1:
+                continue
+            start, end = self.cumulative[i] + t0, self.cumulative[i] + t1
+            # Merge with the previous stretch when it carries on around a corner
+            if intervals and start <= intervals[-1][1] + 1e-9:
+                intervals[-1] = (intervals[-1][0], max(intervals[-1][1], float(end)))
+            else:
+                intervals.append((float(start), float(end)))
+        return intervals
+
+    def covered_length(self, x, y, radius):
+        # Total length of the stretches coverage() would give, for whole arrays of centers at once
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        total = np.zeros(np.broadcast(x, y).shape)
+        for i, length in enumerate(self.segment_lengths.tolist()):
+            if length == 0:
+                continue
+            start_x, start_y = self.points[i]
+            direction_x, direction_y = self.directions[i]
+            to_center_x, to_center_y = x - start_x, y - start_y
+            along = direction_x * to_center_x + direction_y * to_center_y
+            discriminant = along * along - (to_center_x ** 2 + to_center_y ** 2 - radius * radius)
+            half_chord = np.sqrt(np.maximum(discriminant, 0.0))
+            total += np.maximum(np.minimum(along + half_chord, length) - np.maximum(along - half_chord, 0.0), 0.0)
+        return total
+
+class PathNetwork:
+    """Several paths into the same exit area, sharing one distance space.
+
+    Each path (lane) gets its own stretch of distances, starting at offsets[lane], with a
+    wide gap after it so no enemy can step from the end of one lane into the next. That
+    keeps a single distance column per enemy: positions, coverage intervals and the
+    sorted distance order all work exactly like on one path.
+    """
+
+    GAP = 1e6  # Far more than any enemy walks in one step
+
+    def __init__(self, paths):
+        self.paths = [path if isinstance(path, Path) else Path(path) for path in paths]
+        lengths = np.array([path.length for path in self.paths])
+        self.offsets = np.concatenate(([0.0], np.cumsum(lengths + self.GAP)[:-1]))
+        self.ends = self.offsets + lengths
+        self.points = np.concatenate([path.points for path in self.paths])
+
+    def lane_at(self, distance):
+        # Lane whose stretch of distances holds distance, works on scalars and arrays
+        return np.clip(np.searchsorted(self.offsets, distance, side='right') - 1, 0, len(self.paths) - 1)
+
+    def start_of(self, lane):
+        return float(self.offsets[lane])
+
+    def past_end(self, distance):
+        return distance >= self.ends[self.lane_at(distance)]
+
+    def progress(self, distance):
+        # Minus the distance left to walk, so enemies on different lanes compare fairly
+        return distance - self.ends[self.lane_at(distance)]
+
+    def position_at(self, distance):
+        lanes = self.lane_at(distance)
+        if np.ndim(distance) == 0:
+            return self.paths[lanes].position_at(distance - self.offsets[lanes])
+        x = np.empty(len(distance))
+        y = np.empty(len(distance))
+        for lane, path in enumerate(self.paths):
+            on_lane = lanes == lane
+            if on_lane.any():
+                x[on_lane], y[on_lane] = path.position_at(distance[on_lane] - self.offsets[lane])
+        return x, y
+
+    def coverage(self, x, y, radius):
+        # Every lane's stretches, shifted into the shared distance space, still sorted
+        return [(start + offset, end + offset)
+                for path, offset in zip(self.paths, self.offsets.tolist())
+                for start, end in path.coverage(x, y, radius)]
+
+def build_path(paths):
+    # One polyline stays a plain Path, several become a PathNetwork
+    if len(paths) == 1:
+        return Path(paths[0])
+    return PathNetwork(paths)
@@ -0,0 +1,63 @@
+import numpy as np
+
+class PlacementMap:
+    """Which pixels a new tower may be placed on, as one boolean per pixel.
+
+    Distance to the path is worked out once for the whole map when it is loaded.
+    Every placed tower then stamps out the disc around it where another tower would be
+    too close. Checking a spot, on hover or on click, is a single array lookup.
+    """
+
+    def __init__(self, width, height, path, clearance=25, path_width=10, tower_radius=50):
+        self.width = width
+        self.height = height
+        self.tower_radius = tower_radius
+        # A tower needs `clearance` pixels between its center and the edge of the path
+        self.near_path = self._near_path(path, clearance + path_width / 2)
+        # Count of towers too close to each pixel, so towers could be taken away again
+        self.tower_cover = np.zeros((height, width), dtype=np.uint8)  # Towers 50 apart overlap a pixel a few times at most
+        self.valid = ~self.near_path
+
+    def _near_path(self, path, limit):
+        near = np.zeros((self.height, self.width), dtype=bool)
+        segments = [segment for lane in path.paths for segment in zip(lane.points[:-1], lane.points[1:])]
+        for (x0, y0), (x1, y1) in segments:
+            # Only the pixels in the segment's bounding box grown by limit can be close to it
+            left = max(int(np.floor(min(x0, x1) - limit)), 0)
+            right = min(int(np.ceil(max(x0, x1) + limit)) + 1, self.width)
+            top = max(int(np.floor(min(y0, y1) - limit)), 0)
+            bottom = min(int(np.ceil(max(y0, y1) + limit)) + 1, self.height)
+            if left >= right or top >= bottom:
+                continue
+            px = np.arange(left, right, dtype=np.float64)[None, :] - x0
+            py = np.arange(top, bottom, dtype=np.float64)[:, None] - y0
+            segment_x, segment_y = x1 - x0, y1 - y0
+            length_squared = segment_x * segment_x + segment_y * segment_y
+            t = np.clip((px * segment_x + py * segment_y) / length_squared, 0.0, 1.0) if length_squared else 0.0
+            dx = px - t * segment_x
+            dy = py - t * segment_y
+            near[top:bottom, left:right] |= dx * dx + dy * dy < limit * limit
+        return near
+
+    def _disc(self, x, y):
+        # Window of the map around (x, y) and the pixels in it closer than tower_radius
+        r = self.tower_radius
+        left, right = max(x - r, 0), min(x + r + 1, self.width)
+        top, bottom = max(y - r, 0), min(y + r + 1, self.height)
+        px = np.arange(left, right)[None, :] - x
+        py = np.arange(top, bottom)[:, None] - y
+        return (slice(top, bottom), slice(left, right)), px * px + py * py < r * r
+
+    def is_valid(self, x, y):
+        x, y = int(x), int(y)  # Same pixel add_tower stamps around, for float positions too
+        return 0 <= x < self.width and 0 <= y < self.height and bool(self.valid[y, x])
+
+    def add_tower(self, x, y):
+        window, disc = self._disc(int(x), int(y))
+        self.tower_cover[window] += disc
+        self.valid[window] &= ~disc
+
+    def remove_tower(self, x, y):
+        window, disc = self._disc(int(x), int(y))
+        self.tower_cover[window] -= disc
+        self.valid[window] = ~self.near_path[window] & (self.tower_cover[window] == 0)
@@ -0,0 +1,161 @@
+import collections
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Where frame time goes. Code wraps each phase of a frame in `with profiler.phase(name):`
+# and the main loop marks frame boundaries. While the profiler is off, phase() hands back
+# one shared do-nothing context manager, so the cost is a method call and an attribute
+# check. While it's on, every phase's total per frame is kept for the last `history`
+# frames for percentiles, and every phase call goes into a ring buffer that can be written
+# out as a Chrome trace (load it in chrome://tracing or https://ui.perfetto.dev).
+# Phases can be recorded from any thread, they land in whatever frame the main loop is
+# on and show up on their own thread's row in the trace.
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = _NullPhase()
+
+class _Phase:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+class FrameProfiler:
+    def __init__(self, history=600, trace_capacity=100000):
+        self.enabled = False
+        self.history = history  # Frames kept for the percentiles
+        self.phases = {}  # Phase name -> ms spent in it, one entry per frame it ran in
+        self.counters = {}  # Counter name -> value, one entry per frame
+        self.frame_times = {}  # Phase name -> seconds so far this frame
+        self.frame_counts = {}
+        self.frame_start = None
+        self.trace = collections.deque(maxlen=trace_capacity)  # (name, start, end, thread) or (counts, time)
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()  # The simulation thread records phases too
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.frame_start = None
+        self.frame_times.clear()
+        self.frame_counts.clear()
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return _Phase(self, name)
+
+    def record(self, name, start, end):
+        with self._lock:
+            self.frame_times[name] = self.frame_times.get(name, 0.0) + end - start
+        self.trace.append((name, start, end, threading.get_native_id()))
+
+    def count(self, name, value):
+        # Entity counts and the like, the last value in a frame is kept
+        if self.enabled:
+            self.frame_counts[name] = value
+
+    def begin_frame(self):
+        if self.enabled:
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        # Fold this frame's phase totals and counts into the history
+        if not self.enabled or self.frame_start is None:
+            return
+        now = time.perf_counter()
+        self.record('frame', self.frame_start, now)
+        with self._lock:
+            frame_times = dict(self.frame_times)
+            self.frame_times.clear()
+        for name, seconds in frame_times.items():
+            history = self.phases.get(name)
+            if history is None:
+                history = self.phases[name] = collections.deque(maxlen=self.history)
+            history.append(seconds * 1000)
+        for name, value in self.frame_counts.items():
+            history = self.counters.get(name)
+            if history is None:
+                history = self.counters[name] = collections.deque(maxlen=self.history)
+            history.append(value)
+        if self.frame_counts:
+            self.trace.append((dict(self.frame_counts), now))
+        self.frame_counts.clear()
+        self.frame_start = None
+
+    def reset(self, history=None):
+        # Forget every recorded frame, optionally keeping a different number of them from now on
+        if history is not None:
+            self.history = history
+        self.phases.clear()
+        self.counters.clear()
+        self.trace.clear()
+
+    def totals(self):
+        # Phase name -> ms spent in it over all the recorded frames
+        return {name: float(sum(history)) for name, history in self.phases.items()}
+
+    def percentiles(self):
+        # Phase name -> (p50, p95, p99) in ms over the recent frames
+        return {name: tuple(np.percentile(np.fromiter(history, float), (50, 95, 99)))
+                for name, history in self.phases.items() if history}
+
+    def latest_counts(self):
+        return {name: history[-1] for name, history in self.counters.items() if history}
+
+    def chrome_trace(self):
+        # Trace Event Format: complete events for phases, counter events for entity counts
+        events = []
+        origin = self.origin
+        for entry in tuple(self.trace):  # The simulation thread may be adding to it
+            if len(entry) == 4:
+                name, start, end, thread = entry
+                events.append({'name': name, 'ph': 'X', 'pid': 1, 'tid': thread,
+                               'ts': (start - origin) * 1e6, 'dur': (end - start) * 1e6})
+            else:
+                counts, at = entry
+                events.append({'name': 'counts', 'ph': 'C', 'pid': 1, 'tid': 1,
+                               'ts': (at - origin) * 1e6, 'args': counts})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def stats(self):
+        return {
+            'frames': len(self.phases.get('frame', ())),
+            'phases_ms': {name: dict(zip(('p50', 'p95', 'p99'), values)) for name, values in self.percentiles().items()},
+            'counts': self.latest_counts(),
+        }
+
+    def dump(self, prefix=None):
+        # Write <prefix>.trace.json and <prefix>.stats.json, returns their names
+        if prefix is None:
+            prefix = time.strftime('profile-%Y%m%d-%H%M%S')
+        trace_file, stats_file = prefix + '.trace.json', prefix + '.stats.json'
+        with open(trace_file, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+        with open(stats_file, 'w') as file:
+            json.dump(self.stats(), file, indent=2)
+        return trace_file, stats_file
+
+# Shared profiler for the whole game, TD_PROFILE=1 turns it on from the start
+profiler = FrameProfiler()
+profiler.set_enabled(os.environ.get('TD_PROFILE', '') not in ('', '0'))
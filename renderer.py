@@ -0,0 +1,425 @@
+import time
+
+import numpy as np
+import pygame
+
+from camera import Camera
+from profiler import profiler
+from simulation import Tower, ENEMY_TYPES, WIDTH, HEIGHT, WHITE, RED, GREEN, BLACK
+
+# Define a background color
+BACKGROUND_COLOR = WHITE
+OUTSIDE_COLOR = (90, 90, 90)  # Around a map that's smaller than the window
+
+# The map's background is cut into square tiles this many map pixels across, and at most
+# this many pixels worth of drawn tiles are kept (tiles of every zoom level together)
+TILE_SIZE = 256
+TILE_CACHE_PIXELS = 16 * 1024 * 1024
+
+# Sprites only partly in view still get drawn, in screen pixels
+CULL_MARGIN = 32
+
+# Define the tower button rectangle
+tower_button_rect = pygame.Rect(10, HEIGHT - 60, 150, 50)
+
+# Define the start button rectangle
+start_button_rect = pygame.Rect(WIDTH - 220, HEIGHT - 60, 200, 50)
+
+# Past this many changed rectangles one full-window update is cheaper than the list
+MAX_DIRTY_RECTS = 300
+
+# Health bars are pre-rendered in this many steps, 12 keeps thirds and quarters exact
+HEALTH_STEPS = 12
+
+# Level of detail: above these enemy counts health bars are dropped, and then enemies
+# sharing a small screen cell are drawn as one sprite
+HEALTH_BAR_LIMIT = 300
+AGGREGATE_LIMIT = 3000
+AGGREGATE_CELL = 6
+
+# The profiler overlay is redrawn from fresh percentiles this often, in seconds
+PROFILE_REFRESH = 0.5
+PROFILE_COLUMNS = (10, 90, 140, 190)  # x of the name and the three percentile columns
+
+def draw_path(screen, path, offset=(0, 0), zoom=1.0):
+    # Every path of the map, offset is the map position at the surface's top left
+    left, top = offset
+    for lane in path.paths:
+        points = [((x - left) * zoom, (y - top) * zoom) for x, y in lane.points.tolist()]
+        for i in range(len(points) - 1):
+            pygame.draw.line(screen, BLACK, points[i], points[i + 1], max(1, round(5 * zoom)))
+
+# Mazing maps: grid lines, fixed walls, and the cells enemies come in at and leave by
+GRID_COLOR = (225, 225, 225)
+WALL_COLOR = (110, 100, 90)
+ENTRANCE_COLOR = (170, 230, 170)
+EXIT_COLOR = (240, 170, 170)
+
+def draw_maze(screen, maze, offset=(0, 0), zoom=1.0):
+    # Only the cells that overlap the surface, offset is the map position at its top left
+    left, top = offset
+    size = maze.cell_size
+    width, height = screen.get_size()
+    first_column, first_row = max(int(left // size), 0), max(int(top // size), 0)
+    last_column = min(int((left + width / zoom) // size), maze.columns - 1)
+    last_row = min(int((top + height / zoom) // size), maze.rows - 1)
+    for column in range(first_column, last_column + 2):
+        x = (column * size - left) * zoom
+        pygame.draw.line(screen, GRID_COLOR, (x, (first_row * size - top) * zoom), (x, ((last_row + 1) * size - top) * zoom))
+    for row in range(first_row, last_row + 2):
+        y = (row * size - top) * zoom
+        pygame.draw.line(screen, GRID_COLOR, ((first_column * size - left) * zoom, y), (((last_column + 1) * size - left) * zoom, y))
+    for cells, color in ((maze.wall_cells, WALL_COLOR), (maze.entrance_cells, ENTRANCE_COLOR), (maze.exit_cells, EXIT_COLOR)):
+        for cell in cells:
+            column, row = cell % maze.columns, cell // maze.columns
+            if first_column <= column <= last_column and first_row <= row <= last_row:
+                # Rounded on both edges so neighboring cells meet without gaps
+                x0, y0 = round((column * size - left) * zoom), round((row * size - top) * zoom)
+                x1, y1 = round(((column + 1) * size - left) * zoom), round(((row + 1) * size - top) * zoom)
+                screen.fill(color, (x0, y0, x1 - x0, y1 - y0))
+
+def draw_tower(screen, tower, offset=(0, 0), zoom=1.0):
+    left, top = offset
+    pygame.draw.circle(screen, tower.color, ((tower.x - left) * zoom, (tower.y - top) * zoom), 20 * zoom)
+
+def draw_range(screen, tower, offset=(0, 0), zoom=1.0):
+    # Draw the range circle (if needed separately for placement)
+    left, top = offset
+    return pygame.draw.circle(screen, RED, ((tower.x - left) * zoom, (tower.y - top) * zoom),
+                              tower.range * zoom, 1)  # Draw range
+
+def draw_health_bar(screen, x, y, health_ratio):
+    health_bar_width = 40
+    health_bar_color = RED if health_ratio < 0.5 else GREEN
+
+    pygame.draw.rect(screen, BLACK, (x - health_bar_width // 2, y - 20, health_bar_width, 5))
+    pygame.draw.rect(screen, health_bar_color, (x - health_bar_width // 2, y - 20, health_bar_width * health_ratio, 5))
+
+class SpriteCache:
+    """Enemy and bullet images drawn once, so a frame is just blits.
+
+    Enemy sprites are 41x31 with the health bar along the top and the body centered at
+    (20, 20), keyed by enemy kind and health rounded to HEALTH_STEPS. They live in one
+    flat list so a whole array of keys can be turned into surfaces with one lookup each.
+    Each kind's sprites are only drawn the first time that kind is on screen. A zoomed
+    view gets its own cache with every sprite scaled by the zoom.
+    """
+
+    OFFSET = (20, 20)  # Enemy position inside its sprite, before scaling
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.offset = (round(self.OFFSET[0] * scale), round(self.OFFSET[1] * scale))
+        self.enemy_sprites = [None] * (len(ENEMY_TYPES) * (HEALTH_STEPS + 2))
+        self.built_kinds = np.zeros(len(ENEMY_TYPES), dtype=bool)
+        self.bullet_sprites = {}
+
+    def build_kinds(self, kinds):
+        # Draw the sprites of any of these kinds that haven't been drawn yet
+        present = np.bincount(kinds, minlength=len(ENEMY_TYPES)) > 0
+        for kind in np.flatnonzero(present & ~self.built_kinds).tolist():
+            first = kind * (HEALTH_STEPS + 2)
+            color = ENEMY_TYPES[kind].color
+            for step in range(HEALTH_STEPS + 1):
+                self.enemy_sprites[first + step] = self._enemy_sprite(color, step / HEALTH_STEPS)
+            self.enemy_sprites[first + HEALTH_STEPS + 1] = self._enemy_sprite(color, None)  # No health bar
+            self.built_kinds[kind] = True
+
+    def _enemy_sprite(self, color, health_ratio):
+        surface = pygame.Surface((41, 31), pygame.SRCALPHA)
+        pygame.draw.circle(surface, color, self.OFFSET, 10)
+        if health_ratio is not None:
+            draw_health_bar(surface, 20, 20, health_ratio)
+        if self.scale != 1:
+            surface = pygame.transform.smoothscale(surface, (round(41 * self.scale), round(31 * self.scale)))
+        return surface.convert_alpha()
+
+    def enemy_keys(self, kinds, health_ratios, health_bars=True):
+        # Index into enemy_sprites for arrays of kinds and health ratios
+        per_kind = HEALTH_STEPS + 2
+        if not health_bars:
+            return kinds.astype(np.int64) * per_kind + HEALTH_STEPS + 1
+        steps = np.rint(health_ratios * HEALTH_STEPS).astype(np.int64)
+        return kinds.astype(np.int64) * per_kind + np.clip(steps, 0, HEALTH_STEPS)
+
+    def bullet(self, color, radius):
+        # Returns the sprite and the bullet's position inside it
+        key = (color, radius)
+        sprite = self.bullet_sprites.get(key)
+        if sprite is None:
+            radius = max(1, round(radius * self.scale))
+            sprite = pygame.Surface((radius * 2 + 1, radius * 2 + 1), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, color, (radius, radius), radius)
+            sprite = self.bullet_sprites[key] = (sprite.convert_alpha(), radius)
+        return sprite
+
+class TileCache:
+    """The map's background (path and towers) cut into TILE_SIZE squares, drawn on demand.
+
+    A tile is drawn at the current zoom the first time it comes into view and kept until
+    a tower is placed on it. The least recently shown tiles are dropped once they add up
+    to more than TILE_CACHE_PIXELS, so drawing costs what is in view, not the map size.
+    """
+
+    def __init__(self):
+        self.tiles = {}  # (zoom, column, row) -> surface, least recently shown first
+        self.pixels = 0
+        self.layout = None  # Path or maze the tiles were drawn for
+        self.tower_count = 0  # Towers already drawn into the tiles
+
+    def clear(self):
+        self.tiles.clear()
+        self.pixels = 0
+
+    def sync(self, state):
+        # Throw away the tiles anything new was placed on, or all of them for another game
+        towers = state.towers
+        layout = state.path if state.maze is None else state.maze
+        if layout is not self.layout or len(towers) < self.tower_count:
+            self.clear()
+            self.layout = layout
+        else:
+            for tower in towers[self.tower_count:]:
+                self.forget_area(tower.x - 20, tower.y - 20, tower.x + 20, tower.y + 20)
+        self.tower_count = len(towers)
+
+    def forget_area(self, left, top, right, bottom):
+        # Drop every tile, at any zoom, that overlaps the map rectangle
+        columns = range(int(left // TILE_SIZE), int(right // TILE_SIZE) + 1)
+        rows = range(int(top // TILE_SIZE), int(bottom // TILE_SIZE) + 1)
+        for key in [key for key in self.tiles if key[1] in columns and key[2] in rows]:
+            self.pixels -= self.tiles.pop(key).get_width() ** 2
+
+    def tile(self, state, zoom, column, row):
+        key = (zoom, column, row)
+        surface = self.tiles.pop(key, None)
+        if surface is None:
+            surface = self._draw(state, zoom, column, row)
+            self.pixels += surface.get_width() ** 2
+            while self.pixels > TILE_CACHE_PIXELS and self.tiles:
+                self.pixels -= self.tiles.pop(next(iter(self.tiles))).get_width() ** 2
+        self.tiles[key] = surface  # Back to the most recently shown end
+        return surface
+
+    def _draw(self, state, zoom, column, row):
+        size = round(TILE_SIZE * zoom)
+        surface = pygame.Surface((size, size)).convert()
+        surface.fill(BACKGROUND_COLOR)
+        left, top = column * TILE_SIZE, row * TILE_SIZE
+        if state.maze is not None:
+            draw_maze(surface, state.maze, (left, top), zoom)
+        else:
+            draw_path(surface, state.path, (left, top), zoom)
+        for tower in state.towers:
+            if left - 20 <= tower.x <= left + TILE_SIZE + 20 and top - 20 <= tower.y <= top + TILE_SIZE + 20:
+                draw_tower(surface, tower, (left, top), zoom)
+        return surface
+
+class Renderer:
+    """Draws the game in two layers and only pushes what changed to the display.
+
+    The path, towers and buttons only change when a tower is placed, a button changes
+    color or the camera moves, so the visible map tiles and the buttons are put together
+    once onto a cached background surface. Each frame the areas covered by last frame's
+    enemies, bullets and text get patched from that background, the new ones are drawn
+    on top, and only those rectangles go to the display. Enemies and bullets out of view
+    are culled before anything is drawn for them.
+    """
+
+    def __init__(self, screen, font, health_bar_limit=HEALTH_BAR_LIMIT, aggregate_limit=AGGREGATE_LIMIT):
+        self.screen = screen
+        self.font = font
+        self.camera = Camera(screen.get_size(), (WIDTH, HEIGHT))  # Follows the map of the game it draws
+        self.sprite_caches = {}  # Zoom -> SpriteCache
+        self.sprites = self.sprites_for(self.camera.zoom)
+        self.tiles = TileCache()
+        self.health_bar_limit = health_bar_limit
+        self.aggregate_limit = aggregate_limit
+        self.background = pygame.Surface(screen.get_size()).convert()
+        self.background_key = None
+        self.dirty = []  # Areas drawn on top of the background last frame
+        self.text_cache = {}
+        self.small_font = None  # Default font for the profiler overlay, loaded when it's first shown
+        self.profile_lines = []  # (surface, position) for every cell of the overlay
+        self.profile_time = -PROFILE_REFRESH
+
+    def invalidate(self):
+        # Redraw the background next frame, for when the game was swapped for another one
+        self.background_key = None
+        self.tiles.clear()
+
+    def sprites_for(self, zoom):
+        sprites = self.sprite_caches.get(zoom)
+        if sprites is None:
+            sprites = self.sprite_caches[zoom] = SpriteCache(zoom)
+        return sprites
+
+    def render_text(self, text, color):
+        # font.render is slow and the HUD text rarely changes, so keep the surfaces around
+        key = (text, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if len(self.text_cache) > 256:
+                self.text_cache.clear()
+            surface = self.text_cache[key] = self.font.render(text, True, color)
+        return surface
+
+    def draw_background(self, state, show_ranges):
+        surface = self.background
+        camera = self.camera
+        zoom = camera.zoom
+        surface.fill(OUTSIDE_COLOR)
+
+        # The map tiles in view, clipped to the edge of the map
+        map_left, map_top = camera.to_screen(0, 0)
+        surface.set_clip(pygame.Rect(round(map_left), round(map_top), round(state.width * zoom), round(state.height * zoom)))
+        left, top, right, bottom = camera.visible()
+        first_column, first_row = max(int(left // TILE_SIZE), 0), max(int(top // TILE_SIZE), 0)
+        last_column = min(int(right // TILE_SIZE), (state.width - 1) // TILE_SIZE)
+        last_row = min(int(bottom // TILE_SIZE), (state.height - 1) // TILE_SIZE)
+        self.tiles.sync(state)
+        surface.blits([(self.tiles.tile(state, zoom, column, row),
+                        (round((column * TILE_SIZE - camera.x) * zoom), round((row * TILE_SIZE - camera.y) * zoom)))
+                       for row in range(first_row, last_row + 1) for column in range(first_column, last_column + 1)],
+                      False)
+        surface.set_clip(None)
+
+        # Draw the tower ranges only while placing a new tower
+        if show_ranges:
+            for tower in state.towers:
+                if left - tower.range <= tower.x <= right + tower.range and top - tower.range <= tower.y <= bottom + tower.range:
+                    draw_range(surface, tower, (camera.x, camera.y), zoom)
+
+        # Draw start button, color based on state
+        button_color = GREEN if state.can_start_next_level else RED
+        pygame.draw.rect(surface, button_color, start_button_rect)
+        surface.blit(self.render_text("Start", WHITE), (WIDTH - 210, HEIGHT - 50))
+
+        # Draw the tower button with color based on money available
+        pygame.draw.rect(surface, GREEN if state.money >= Tower.cost else RED, tower_button_rect)
+        surface.blit(self.render_text(f"Tower ({Tower.cost})", WHITE), (tower_button_rect.x + 10, tower_button_rect.y + 10))
+
+    def in_view(self, xs, ys):
+        # Screen positions of the map positions, and which of them are on screen
+        screen_x, screen_y = self.camera.to_screen(xs, ys)
+        width, height = self.screen.get_size()
+        visible = ((screen_x > -CULL_MARGIN) & (screen_x < width + CULL_MARGIN)
+                   & (screen_y > -CULL_MARGIN) & (screen_y < height + CULL_MARGIN))
+        return screen_x, screen_y, visible
+
+    def draw_enemies(self, enemies):
+        # All enemies in view in one blits call, returns the areas they cover
+        n = enemies.count
+        if n == 0:
+            return []
+        screen_x, screen_y, visible = self.in_view(enemies.x[:n], enemies.y[:n])
+        x = screen_x[visible].astype(np.int64)
+        y = screen_y[visible].astype(np.int64)
+        kinds = enemies.kind[:n][visible]
+        health_ratios = enemies.health[:n][visible] / enemies.max_health[:n][visible]
+        # Level of detail goes by how many are on screen, not on the map
+        n = len(x)
+        if n > self.aggregate_limit:
+            # Too many to tell apart anyway, keep one enemy per small screen cell
+            row_cells = (self.screen.get_width() + 2 * CULL_MARGIN) // AGGREGATE_CELL + 1
+            cells = ((y + CULL_MARGIN) // AGGREGATE_CELL) * row_cells + (x + CULL_MARGIN) // AGGREGATE_CELL
+            _, keep = np.unique(cells, return_index=True)
+            x, y, kinds, health_ratios = x[keep], y[keep], kinds[keep], health_ratios[keep]
+        self.sprites.build_kinds(kinds)
+        keys = self.sprites.enemy_keys(kinds, health_ratios, n <= self.health_bar_limit)
+        sprites = self.sprites.enemy_sprites
+        offset_x, offset_y = self.sprites.offset
+        return self.screen.blits(list(zip([sprites[key] for key in keys.tolist()],
+                                          zip((x - offset_x).tolist(), (y - offset_y).tolist()))))
+
+    def draw_bullets(self, bullets):
+        # All bullets in view in one blits call, returns the areas they cover
+        n = bullets.count
+        if n == 0:
+            return []
+        sprites, offsets = zip(*[self.sprites.bullet(bullet_type.color, bullet_type.radius)
+                                 for bullet_type in bullets.bullet_types])
+        screen_x, screen_y, visible = self.in_view(bullets.x[:n], bullets.y[:n])
+        kinds = bullets.kind[:n][visible].tolist()
+        xs = screen_x[visible].astype(np.int64).tolist()
+        ys = screen_y[visible].astype(np.int64).tolist()
+        return self.screen.blits([(sprites[kind], (x - offsets[kind], y - offsets[kind]))
+                                  for kind, x, y in zip(kinds, xs, ys)])
+
+    def draw_hud(self, state, fps, speed=1):
+        screen = self.screen
+        rects = [
+            # Display enemies remaining (count down), money and lives below it
+            screen.blit(self.render_text(f"Enemies left: {state.max_enemies - state.enemies_spawned}", BLACK), (WIDTH - 220, 10)),
+            screen.blit(self.render_text(f"Money: {state.money}", BLACK), (WIDTH - 220, 50)),
+            screen.blit(self.render_text(f"Lives: {state.lives}", RED), (WIDTH - 220, 90)),
+            screen.blit(self.render_text(f"FPS: {fps}", BLACK), (WIDTH - 220, 130)),
+        ]
+        if speed != 1:
+            rects.append(screen.blit(self.render_text(f"Speed: x{speed}", BLACK), (WIDTH - 220, 170)))
+        if state.level >= 1:
+            rects.append(screen.blit(self.render_text(f"Level: {state.level}", BLACK), (10, 10)))
+        return rects
+
+    def draw_profile(self):
+        # Phase timings and entity counts in the top left corner, see profiler.py
+        now = time.perf_counter()
+        if now - self.profile_time >= PROFILE_REFRESH:
+            self.profile_time = now
+            rows = [("ms", "p50", "p95", "p99")]
+            for name, values in sorted(profiler.percentiles().items(), key=lambda item: -item[1][0]):
+                rows.append((name,) + tuple(f"{value:.2f}" for value in values))
+            counts = profiler.latest_counts()
+            if counts:
+                rows.append(("  ".join(f"{name} {value}" for name, value in counts.items()),))
+            # One surface per cell so the columns line up in a proportional font
+            if self.small_font is None:
+                self.small_font = pygame.font.Font(None, 20)
+            render = self.small_font.render
+            self.profile_lines = [(render(cell, True, BLACK, WHITE), (PROFILE_COLUMNS[column], 50 + i * 16))
+                                  for i, row in enumerate(rows) for column, cell in enumerate(row)]
+        return self.screen.blits(self.profile_lines)
+
+    def draw_placement(self, state, placing_tower, mouse_pos):
+        # Tower following the mouse, green where it can be placed and red where it can't
+        camera = self.camera
+        x, y = camera.to_map(*mouse_pos)
+        if state.maze is not None:
+            # Shown in the middle of the cell it would fill
+            x, y = state.maze.snap(x, y)
+            mouse_pos = camera.to_screen(x, y)
+        tower_color = GREEN if state.can_place(x, y) else RED
+        rect = pygame.draw.circle(self.screen, tower_color, mouse_pos, 20 * camera.zoom)
+        return [rect, draw_range(self.screen, placing_tower(x, y), (camera.x, camera.y), camera.zoom)]
+
+    def draw(self, state, fps, placing_tower=None, mouse_pos=(0, 0), speed=1, show_profile=False):
+        screen = self.screen
+        camera = self.camera
+        if (state.width, state.height) != (camera.map_width, camera.map_height):
+            camera.set_map((state.width, state.height))
+        self.sprites = self.sprites_for(camera.zoom)
+        key = (len(state.towers), state.can_start_next_level, state.money >= Tower.cost, placing_tower is not None,
+               state.path, state.maze, camera.version)
+        full_redraw = key != self.background_key
+        if full_redraw:
+            self.draw_background(state, placing_tower is not None)
+            self.background_key = key
+            screen.blit(self.background, (0, 0))
+        else:
+            # Patch over everything that moved since last frame
+            screen.blits([(self.background, rect, rect) for rect in self.dirty], False)
+
+        dirty = self.draw_bullets(state.bullets)
+        dirty.extend(self.draw_enemies(state.enemies))
+        dirty.extend(self.draw_hud(state, fps, speed))
+        if placing_tower is not None:
+            dirty.extend(self.draw_placement(state, placing_tower, mouse_pos))
+        if show_profile:
+            dirty.extend(self.draw_profile())
+
+        with profiler.phase('flip'):
+            if full_redraw or len(dirty) + len(self.dirty) > MAX_DIRTY_RECTS:
+                pygame.display.flip()
+            else:
+                pygame.display.update(self.dirty + dirty)
+        self.dirty = dirty
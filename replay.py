@@ -0,0 +1,184 @@
+"""Record a game's inputs and play them back exactly, headless and as fast as possible.
+
+    python replay.py last_session.tdr            # replay and check every checksum
+    python replay.py last_session.tdr --quiet    # only the result, for scripts and CI
+    python replay.py last_session.tdr --endless stress   # a session played with TD_ENDLESS=stress
+
+The simulation only changes through GameState.step and the player's inputs, so a list of
+inputs stamped with the tick they happened on is enough to rebuild the whole game. Every
+checksum_interval ticks the recorder also stores a checksum of the state, and the replay
+stops with ReplayDivergence at the first one that doesn't match. The game the recording
+starts from is stored as a snapshot, so a session that began from a saved game replays
+as well as one that began from scratch.
+
+File layout, all little endian:
+
+    header  b'TDRP', version u16, checksum interval u32, snapshot length u32,
+            then the starting snapshot (see snapshot.py)
+    body    zlib compressed events, each a tick u32 and a type u8 followed by
+            PLACE_TOWER tower type u8, x i16, y i16
+            START_LEVEL nothing
+            SET_SPEED   speed u16 (viewer only, kept so the session reads back in full)
+            CHECKSUM    8 byte state digest
+            END         nothing, the last tick of the session
+"""
+import argparse
+import hashlib
+import struct
+import sys
+import time
+import zlib
+
+from simulation import TOWER_TYPES, FRAME_TIME, load_compiled_waves
+from snapshot import snapshot, restore, TOWER_ORDER
+
+MAGIC = b'TDRP'
+VERSION = 2
+
+PLACE_TOWER, START_LEVEL, SET_SPEED, CHECKSUM, END = range(5)
+
+HEADER = struct.Struct('<4sHII')
+EVENT = struct.Struct('<IB')
+PAYLOADS = {
+    PLACE_TOWER: struct.Struct('<Bhh'),
+    START_LEVEL: struct.Struct('<'),
+    SET_SPEED: struct.Struct('<H'),
+    CHECKSUM: struct.Struct('<8s'),
+    END: struct.Struct('<'),
+}
+
+class ReplayDivergence(Exception):
+    """The replayed game doesn't match the recorded checksum at some tick."""
+
+    def __init__(self, tick, expected, actual):
+        super().__init__(f"State diverged at tick {tick}: recorded {expected.hex()}, replayed {actual.hex()}")
+        self.tick = tick
+
+def state_checksum(state):
+    # Digest of everything the game's future depends on
+    enemies, bullets = state.enemies, state.bullets
+    n, b = enemies.count, bullets.count
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(struct.pack('<qqiiqd', state.ticks, state.money, state.lives, state.level,
+                              state.enemies_spawned, state.time))
+    for column in (enemies.kind, enemies.health, enemies.distance, enemies.slow):
+        digest.update(column[:n].tobytes())
+    for column in (bullets.x, bullets.y, bullets.vx, bullets.vy, bullets.target):
+        digest.update(column[:b].tobytes())
+    for tower in state.towers:
+        digest.update(struct.pack('<d', tower.last_shot_time))
+    return digest.digest()
+
+class ReplayRecorder:
+    """Feeds the player's inputs to a GameState and writes them down as it goes.
+
+    The viewer calls place_tower, start_level, set_speed and step instead of going to the
+    GameState directly, and save at the end.
+    """
+
+    def __init__(self, state, checksum_interval=60):
+        self.state = state
+        self.checksum_interval = checksum_interval
+        self.start = snapshot(state)
+        self.events = bytearray()
+
+    def _record(self, kind, *payload):
+        self.events += EVENT.pack(self.state.ticks, kind)
+        self.events += PAYLOADS[kind].pack(*payload)
+
+    def place_tower(self, tower_type, x, y):
+        self._record(PLACE_TOWER, TOWER_ORDER.index(tower_type.__name__), x, y)
+        return self.state.add_tower(tower_type(x, y))
+
+    def start_level(self):
+        self._record(START_LEVEL)
+        self.state.start_next_level(self.state.level == 0)
+
+    def set_speed(self, speed):
+        self._record(SET_SPEED, speed)
+
+    def step(self):
+        self.state.step(FRAME_TIME)
+        if self.state.ticks % self.checksum_interval == 0:
+            self._record(CHECKSUM, state_checksum(self.state))
+
+    def save(self, filename):
+        header = HEADER.pack(MAGIC, VERSION, self.checksum_interval, len(self.start))
+        body = bytes(self.events) + EVENT.pack(self.state.ticks, END)
+        with open(filename, 'wb') as file:
+            file.write(header + self.start + zlib.compress(body, 9))
+
+def read_replay(filename):
+    # (checksum interval, starting snapshot, list of (tick, type, payload))
+    with open(filename, 'rb') as file:
+        data = file.read()
+    magic, version, checksum_interval, snapshot_length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{filename} is not a version {VERSION} replay")
+    start = data[HEADER.size:HEADER.size + snapshot_length]
+    body = zlib.decompress(data[HEADER.size + snapshot_length:])
+
+    events = []
+    offset = 0
+    while offset < len(body):
+        tick, kind = EVENT.unpack_from(body, offset)
+        offset += EVENT.size
+        payload = PAYLOADS[kind].unpack_from(body, offset)
+        offset += PAYLOADS[kind].size
+        events.append((tick, kind, payload))
+    return checksum_interval, start, events
+
+def replay(filename, waves=None, check=True):
+    """Play a recorded session headless and return the final GameState.
+
+    Raises ReplayDivergence at the first checksum that doesn't match, unless check is False.
+    """
+    _, start, events = read_replay(filename)
+    state = restore(start, waves if waves is not None else load_compiled_waves())
+    for tick, kind, payload in events:
+        while state.ticks < tick:
+            state.step(FRAME_TIME)
+        if kind == PLACE_TOWER:
+            tower_type, x, y = payload
+            state.add_tower(TOWER_TYPES[TOWER_ORDER[tower_type]](x, y))
+        elif kind == START_LEVEL:
+            state.start_next_level(state.level == 0)
+        elif kind == CHECKSUM and check:
+            actual = state_checksum(state)
+            if actual != payload[0]:
+                raise ReplayDivergence(tick, payload[0], actual)
+    return state
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('replay', help="Recorded session, like last_session.tdr")
+    parser.add_argument('--quiet', action='store_true', help="Turn the game's own log off")
+    parser.add_argument('--endless', help="Endless profile the session was played with, see endless.py")
+    args = parser.parse_args(argv)
+    if args.quiet:
+        from event_log import log, OFF
+        log.level = OFF
+
+    waves = load_compiled_waves()
+    if args.endless:
+        from endless import endless_waves, PROFILES
+        if args.endless not in PROFILES:
+            parser.error(f"unknown endless profile {args.endless!r}, expected one of {', '.join(PROFILES)}")
+        waves = endless_waves(args.endless, waves)
+
+    started = time.perf_counter()
+    try:
+        state = replay(args.replay, waves)
+    except ReplayDivergence as error:
+        print(error, file=sys.stderr)
+        return 1
+    except ValueError as error:
+        # Most likely a different level config, or a session from endless mode without --endless
+        print(f"Can't replay {args.replay}: {error}", file=sys.stderr)
+        return 1
+    print(f"Replayed {state.ticks} ticks ({state.time:.0f}s of play) in {time.perf_counter() - started:.2f}s: "
+          f"level {state.level}, {state.lives} lives, {state.money} money")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+import copy
+import queue
+import threading
+import time
+
+import numpy as np
+
+from enemy_store import SLOT_MASK
+from event_log import log
+from profiler import profiler
+from replay import ReplayRecorder
+from simulation import FRAME_TIME
+from snapshot import save_game, load_game
+from state_stream import watch_kills, take_kills
+from timestep import FixedTimestep
+
+# The simulation runs on its own thread so a heavy tick never holds up drawing, flipping
+# or input. The window never touches the GameState: it sends commands over a queue, and
+# after every batch of ticks the thread publishes a Frame, a read-only copy of what there
+# is to draw. The last two published frames are kept, and the window draws a blend of
+# them so movement stays smooth however the ticks and the frames line up.
+
+def _frozen(column, rows):
+    # Copy of the rows of a column that nobody can write to
+    column = column[rows].copy()
+    column.flags.writeable = False
+    return column
+
+class EnemyFrame:
+    """The enemy columns the renderer needs, copied out of an EnemyStore (live rows only)."""
+
+    def __init__(self, enemies):
+        n = enemies.count
+        rows = np.flatnonzero(~enemies.dead[:n]) if enemies.dead_count else slice(0, n)
+        self.handle = _frozen(enemies.handle, rows)
+        self.kind = _frozen(enemies.kind, rows)
+        self.x = _frozen(enemies.x, rows)
+        self.y = _frozen(enemies.y, rows)
+        self.health = _frozen(enemies.health, rows)
+        self.max_health = _frozen(enemies.max_health, rows)
+        self.count = len(self.handle)
+
+    def __len__(self):
+        return self.count
+
+    def between(self, previous, alpha):
+        # Copy with every enemy that was in previous moved back towards where it was there
+        if self.count == 0 or previous.count == 0:
+            return self
+        # Handles are unique among live enemies, so a table by slot pairs them up in O(n)
+        slots = self.handle & SLOT_MASK
+        previous_slots = previous.handle & SLOT_MASK
+        size = int(max(slots.max(), previous_slots.max())) + 1
+        handle_at = np.full(size, -1, dtype=np.int64)
+        handle_at[previous_slots] = previous.handle
+        x_at, y_at = np.empty(size), np.empty(size)
+        x_at[previous_slots] = previous.x
+        y_at[previous_slots] = previous.y
+        seen = np.flatnonzero(handle_at[slots] == self.handle)
+        from_x, from_y = x_at[slots[seen]], y_at[slots[seen]]
+        enemies = copy.copy(self)
+        enemies.x, enemies.y = self.x.copy(), self.y.copy()
+        enemies.x[seen] = from_x + (self.x[seen] - from_x) * alpha
+        enemies.y[seen] = from_y + (self.y[seen] - from_y) * alpha
+        return enemies
+
+class BulletFrame:
+    """The bullet columns the renderer needs, copied out of a BulletStore."""
+
+    def __init__(self, bullets):
+        rows = slice(0, bullets.count)
+        self.bullet_types = bullets.bullet_types
+        self.kind = _frozen(bullets.kind, rows)
+        self.x = _frozen(bullets.x, rows)
+        self.y = _frozen(bullets.y, rows)
+        self.vx = _frozen(bullets.vx, rows)
+        self.vy = _frozen(bullets.vy, rows)
+        self.count = bullets.count
+
+    def __len__(self):
+        return self.count
+
+    def between(self, steps, alpha):
+        # Copy with every bullet moved back along its flight, steps ticks is alpha 0.
+        # Bullets have no handles, and a few pixels off for one frame doesn't show.
+        if self.count == 0:
+            return self
+        back = steps * (1.0 - alpha)
+        bullets = copy.copy(self)
+        bullets.x = self.x - self.vx * back
+        bullets.y = self.y - self.vy * back
+        return bullets
+
+class Frame:
+    """Everything the renderer and the HUD read, as of one tick, never changed after publishing.
+
+    Has the GameState attributes the renderer uses, so it can be drawn in its place. The
+    path, a maze's MazeLayout and the towers are shared with the simulation, they don't
+    change once they're built. can_place answers for the spot the window last asked about.
+    """
+
+    def __init__(self, state, generation, speed, hover=None):
+        self.published = time.perf_counter()
+        self.generation = generation  # Goes up when a saved game is loaded in
+        self.ticks = state.ticks
+        self.speed = speed
+        self.width, self.height = state.width, state.height
+        self.path = state.path
+        # Only the maze's fixed layout, its flow field keeps changing on the simulation thread
+        self.maze = state.maze.layout if state.maze is not None else None
+        self.towers = tuple(state.towers)
+        self.enemies = EnemyFrame(state.enemies)
+        self.bullets = BulletFrame(state.bullets)
+        self.money = state.money
+        self.lives = state.lives
+        self.level = state.level
+        self.max_enemies = state.max_enemies
+        self.enemies_spawned = state.enemies_spawned
+        self.can_start_next_level = state.can_start_next_level
+        self.hover = hover  # (x, y, can place) for the last spot asked about
+
+    def can_place(self, x, y):
+        # None until the thread has answered for this spot
+        if self.hover is None or self.hover[:2] != (x, y):
+            return None
+        return self.hover[2]
+
+    def between(self, previous, alpha):
+        # What to draw alpha of the way from previous to this frame
+        if alpha >= 1 or previous is self or previous.generation != self.generation:
+            return self
+        frame = copy.copy(self)
+        frame.enemies = self.enemies.between(previous.enemies, alpha)
+        frame.bullets = self.bullets.between(self.ticks - previous.ticks, alpha)
+        return frame
+
+class SimulationThread:
+    """Owns the GameState and runs it in real time on a worker thread.
+
+    The place_tower, start_level, faster, slower, ask_can_place, save and load methods
+    only queue a command, the thread carries them out between ticks. frames() hands back
+    the last two published frames. With threaded=False nothing starts a thread, and the
+    owner calls update() itself once per frame instead, the old single threaded loop.
+    Given a StateStreamServer as stream, it also gets the frames, as often as it wants them.
+    """
+
+    def __init__(self, state, autosave_file=None, threaded=True, stream=None):
+        self.state = state
+        self.stream = stream
+        if stream is not None:
+            watch_kills(state)
+        self.recorder = ReplayRecorder(state)  # Every input goes through it
+        self.timestep = FixedTimestep(FRAME_TIME)
+        self.autosave_file = autosave_file  # Saved to whenever a level is cleared
+        self.threaded = threaded
+        self.commands = queue.Queue()
+        self.generation = 0
+        self.hover = None
+        self._lock = threading.Lock()  # Held only to swap the published frames
+        self.previous = self.latest = Frame(state, self.generation, self.timestep.speed)
+        self.error = None  # Whatever stopped the thread, raised again by check()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Commands, safe to call from any thread
+
+    def place_tower(self, tower_type, x, y):
+        self.commands.put(('place', tower_type, x, y))
+
+    def start_level(self):
+        self.commands.put(('start',))
+
+    def faster(self):
+        self.commands.put(('speed', 1))
+
+    def slower(self):
+        self.commands.put(('speed', -1))
+
+    def ask_can_place(self, x, y):
+        # The answer comes back in the next frame's can_place
+        self.commands.put(('hover', x, y))
+
+    def save(self, filename):
+        self.commands.put(('save', filename))
+
+    def load(self, filename):
+        self.commands.put(('load', filename))
+
+    def frames(self):
+        # The two newest frames, oldest first
+        with self._lock:
+            return self.previous, self.latest
+
+    def check(self):
+        # Raise whatever stopped the thread in the caller's thread instead
+        if self.error is not None:
+            raise self.error
+
+    # Running
+
+    def start(self):
+        if not self.threaded or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='simulation', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Finish the commands already sent and stop the thread, the state can be read again after
+        if self._thread is not None:
+            self._stop.set()
+            self.commands.put(('wake',))
+            self._thread.join()
+            self._thread = None
+        self._drain()
+
+    def _run(self):
+        last = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                now = time.perf_counter()
+                self.update(now - last)
+                last = now
+                # Sleep until the next tick is due, or until a command comes in
+                try:
+                    command = self.commands.get(timeout=self.timestep.until_next_tick())
+                except queue.Empty:
+                    continue
+                self._apply(command)
+        except Exception as error:
+            self.error = error
+            log.warning('input', "Simulation stopped: %s", error)
+
+    def update(self, elapsed):
+        # Carry out the queued commands, then run the ticks elapsed real seconds are worth
+        self._drain()
+        ticks = self.timestep.advance(elapsed)
+        if ticks:
+            state = self.state
+            level_running = not state.can_start_next_level
+            with profiler.phase('simulation'):
+                for _ in range(ticks):
+                    self.recorder.step()
+            if level_running and state.can_start_next_level and self.autosave_file:
+                self._save(self.autosave_file)  # Level boundary
+            self._publish()
+        return ticks
+
+    def _drain(self):
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            self._apply(command)
+
+    def _apply(self, command):
+        name, args = command[0], command[1:]
+        if name == 'wake':
+            return  # Only there to end the thread's wait
+        if name == 'place':
+            tower_type, x, y = args
+            # The window may have sent it before it saw the money for the last tower go
+            if self.state.money < tower_type.cost:
+                log.info('input', "Not enough money for a %s", tower_type.__name__)
+            elif not self.recorder.place_tower(tower_type, x, y):
+                log.info('input', "Invalid position! Too close to the path.")
+            self.hover = None
+        elif name == 'start':
+            if self.state.can_start_next_level:
+                self.recorder.start_level()  # Starts level 1 the first time
+        elif name == 'speed':
+            if args[0] > 0:
+                self.timestep.faster()
+                log.debug('input', "speeding up time to x%d", self.timestep.speed)
+            else:
+                self.timestep.slower()
+                log.debug('input', "speeding down time to x%d", self.timestep.speed)
+            self.recorder.set_speed(self.timestep.speed)
+        elif name == 'hover':
+            # Asked every frame while placing, so only the answer is swapped into the newest frame
+            x, y = args
+            self.hover = (x, y, bool(self.state.can_place(x, y)))
+            frame = copy.copy(self.latest)
+            frame.hover = self.hover
+            with self._lock:
+                self.latest = frame
+            return
+        elif name == 'save':
+            self._save(args[0])
+        elif name == 'load':
+            self._load(args[0])
+        self._publish()
+
+    def _save(self, filename):
+        started = time.perf_counter()
+        save_game(self.state, filename)
+        log.info('input', "Saved to %s in %.1f ms", filename, (time.perf_counter() - started) * 1000)
+
+    def _load(self, filename):
+        # Swap in the saved game, the replay recording starts over from it
+        try:
+            state = load_game(filename, self.state.waves)
+        except (OSError, ValueError) as error:
+            log.warning('input', "Couldn't load %s: %s", filename, error)
+            return
+        self.state = state
+        if self.stream is not None:
+            watch_kills(state)
+        self.recorder = ReplayRecorder(state)
+        self.generation += 1
+        self.hover = None
+        log.info('input', "Loaded %s at level %d", filename, state.level)
+
+    def _publish(self):
+        frame = Frame(self.state, self.generation, self.timestep.speed, self.hover)
+        with self._lock:
+            # Frames without a tick in between only replace the newest one, so the blend
+            # keeps going from the last tick instead of jumping ahead
+            if frame.ticks != self.latest.ticks or frame.generation != self.latest.generation:
+                self.previous = self.latest
+            self.latest = frame
+        if self.stream is not None and self.stream.due():
+            self.stream.publish(frame, take_kills(self.state))
@@ -0,0 +1,486 @@
+import math
+import json
+
+import numpy as np
+
+from enemy_store import EnemyStore
+from bullet_store import BulletStore
+from path import Path, PathNetwork
+from maze import MazeEnemyStore
+from spatial_hash import SpatialHash
+from placement import PlacementMap
+from event_log import log, DEBUG
+from profiler import profiler
+from waves import CompiledWaves, compile_waves, load_waves
+
+# The simulation never touches pygame or the wall clock, so it can run headless
+# (CI boxes, balance scripts) as fast as the CPU allows. main.py is just a viewer.
+
+# Define colors
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+BLACK = (0, 0, 0)
+
+# The game was tuned at 60 frames per second, so speeds are in pixels per 1/60 s
+FRAME_TIME = 1 / 60
+TOWER_RADIUS = 50  # Minimum distance between two towers
+PATH_CLEARANCE = 25  # Minimum distance between a tower and the edge of the path
+PATH_WIDTH = 10
+ENEMY_RADIUS = 10  # Size of an enemy's body, for bullet hits
+
+# Size of the default map in pixels, and of the window. Bigger maps come from map files, see maps.py
+WIDTH = 800
+HEIGHT = 600
+
+# Define the path for enemies on the default map
+PATH = [(50, 50), (200, 50), (200, 200), (400, 200), (400, 400), (600, 400), (600, 550)]
+
+# Load level configuration from a JSON file
+def load_level_config(filename='level_config.json'):
+    with open(filename, 'r') as file:
+        return json.load(file)
+
+# Load the level configuration compiled into spawn timelines, cached next to the file
+def load_compiled_waves(filename='level_config.json'):
+    return load_waves(filename, ENEMY_NAMES)
+
+# Bullet types only describe how a bullet looks and what it does when it lands, the
+# bullets in flight are rows in a BulletStore. on_hit gets the tower that fired it for
+# anything that depends on the tower, like the splash radius.
+
+class Bullet:
+    speed = 20  # Pixels per 1/60 s
+    color = BLACK
+    radius = 5
+
+    @staticmethod
+    def on_hit(state, tower, target):
+        state.hit_enemy(target)
+
+class SplashBullet(Bullet):
+    # Bursts on impact and damages everything within the tower's splash_radius
+    color = (255, 140, 0)
+
+    @staticmethod
+    def on_hit(state, tower, target):
+        row = state.enemies.row_of(target)
+        hit = state.enemy_grid().query_radius(state.enemies.x[row], state.enemies.y[row], tower.splash_radius)
+        # The target may be too new to be in the grid yet, it always takes the hit
+        state.damage_enemies(np.union1d(hit, [target]))
+
+class ChainBullet(Bullet):
+    # Hits its target, then arcs on to the nearest enemy not hit yet, chain_count times
+    color = (230, 200, 0)
+
+    @staticmethod
+    def on_hit(state, tower, target):
+        enemies = state.enemies
+        grid = state.enemy_grid()
+        row = enemies.row_of(target)
+        x, y = enemies.x[row], enemies.y[row]
+        hit = [target]
+        for _ in range(tower.chain_count):
+            nearby = grid.query_radius(x, y, tower.chain_range)
+            # The grid still has the enemies killed earlier this tick, a link is never spent on them
+            nearby = nearby[enemies.find_rows(nearby) >= 0]
+            next_target = next((handle for handle in nearby.tolist() if handle not in hit), None)
+            if next_target is None:
+                break
+            hit.append(next_target)
+            row = enemies.row_of(next_target)
+            x, y = enemies.x[row], enemies.y[row]
+        state.damage_enemies(hit)
+
+# The kind column of the BulletStore indexes into this tuple
+BULLET_TYPES = (Bullet, SplashBullet, ChainBullet)
+
+class Tower:
+    cost = 375
+    bullet_type = Bullet
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.range = 120  # Adjust the range as needed
+        self.color = BLUE
+        self.cooldown = 0
+        self.rate_of_fire = 80 # Fire rate in frames
+        self.homing = False  # Whether its bullets turn to follow the target
+        self.index = None  # Position in GameState.towers, set when it's placed
+        self.last_shot_time = -math.inf  # Simulation time when the last shot was fired
+        self.target_enemy = None
+        self.coverage = None  # Path intervals in range, see covered_intervals
+
+    def covered_intervals(self, path):
+        # Stretches of the path inside the range, neither the tower nor the path ever move
+        if self.coverage is None:
+            self.coverage = path.coverage(self.x, self.y, self.range)
+        return self.coverage
+
+    def _furthest_in_range(self, enemies):
+        # Row of the enemy with the most path progress inside the range, or None
+        if enemies.count == 0:
+            return None
+        order, distances = enemies.distance_order()
+        progress = enemies.path.progress
+        best = -1
+        for start, end in self.covered_intervals(enemies.path):
+            # Furthest enemy not past the end of this stretch, is it still inside it?
+            i = int(np.searchsorted(distances, end, side='right')) - 1
+            # On several paths the furthest along is the one closest to its own exit
+            if i >= 0 and distances[i] >= start and (best < 0 or progress(distances[i]) > progress(distances[best])):
+                best = i
+        return None if best < 0 else int(order[best])
+
+    def shoot(self, state):
+        # The old wall-clock cooldown was rate_of_fire * 1000 / (fps + 60) ms, which is
+        # rate_of_fire / 120 seconds at the intended 60 fps
+        if (state.time - self.last_shot_time) > self.rate_of_fire / 120:
+            row = state.furthest_in_range(self)
+            if row is None:
+                return
+            self.target_enemy = int(state.enemies.handle[row])
+
+            # Bullets already in flight keep going, even at a target that's no longer first
+            self.make_bullet(self.target_enemy, state)
+            self.last_shot_time = state.time  # Update last shot time
+
+    def make_bullet(self, target, state):
+        # Fire one bullet_type bullet at the enemy's current position
+        row = state.enemies.row_of(target)
+        return state.bullets.spawn(self.x, self.y, state.enemies.x[row], state.enemies.y[row], target,
+                                   BULLET_TYPES.index(self.bullet_type), self.index, self.homing)
+
+    def update(self, state, dt=FRAME_TIME):
+        # Fire if the cooldown is over, GameState moves every tower's bullets together
+        self.shoot(state)
+
+    def find_target(self, enemies):
+        # Find the enemy with the highest path progress within range
+        row = self._furthest_in_range(enemies)
+        self.target_enemy = None if row is None else int(enemies.handle[row])
+        return self.target_enemy
+
+class SniperTower(Tower):
+    cost = 675
+
+    def __init__(self, x, y):
+        super().__init__(x, y)
+        self.range = 260  # Adjust the range as needed
+        self.color = GREEN
+        self.rate_of_fire = 160 # Fire rate in frames
+        self.homing = True  # Long flights would miss anything fast otherwise
+
+# The area towers below find their victims through GameState.enemy_grid, so their cost
+# depends on how many enemies are near them, not on how many are on the map
+
+class SplashTower(Tower):
+    cost = 550
+    bullet_type = SplashBullet
+
+    def __init__(self, x, y):
+        super().__init__(x, y)
+        self.range = 110
+        self.color = (255, 140, 0)  # Orange
+        self.rate_of_fire = 120
+        self.splash_radius = 45
+
+class ChainTower(Tower):
+    cost = 800
+    bullet_type = ChainBullet
+
+    def __init__(self, x, y):
+        super().__init__(x, y)
+        self.range = 140
+        self.color = (230, 200, 0)  # Yellow
+        self.rate_of_fire = 100
+        self.chain_count = 4  # Extra enemies after the first one
+        self.chain_range = 70
+
+class SlowTower(Tower):
+    # Doesn't shoot, everything inside the range moves at slow_factor of its speed
+    cost = 450
+
+    def __init__(self, x, y):
+        super().__init__(x, y)
+        self.range = 90
+        self.color = (0, 200, 200)  # Cyan
+        self.slow_factor = 0.5
+
+    def update(self, state, dt=FRAME_TIME):
+        enemies = state.enemies
+        rows = enemies.rows_of(state.enemy_grid().query_radius(self.x, self.y, self.range))
+        enemies.slow[rows] = np.minimum(enemies.slow[rows], self.slow_factor)
+
+# Towers by class name, for scripts that describe layouts as data
+TOWER_TYPES = {tower_type.__name__: tower_type for tower_type in (Tower, SniperTower, SplashTower, SlowTower, ChainTower)}
+
+# Enemy types only describe stats, the live enemies themselves are rows in an EnemyStore
+
+#Base enemy AKA green enemy
+class Enemy:
+    name = "green"  # As used in level_config.json
+    speed = 1.15 # Default speed for green enemies
+    health = 1
+    color = GREEN
+    reward = 1
+
+class PurpleEnemy(Enemy):
+    name = "purple"  # As used in level_config.json
+    speed = 1.65  # Set speed for purple enemies
+    health = 1
+    color = (128, 0, 128)  # Purple color
+    reward = 2  # Double the reward
+
+class BlueEnemy(Enemy):
+    name = "blue"  # As used in level_config.json
+    speed = 2.15
+    health = 1
+    color = (52, 119, 235)
+    reward = 3
+
+class RedEnemy(Enemy):
+    name = "red"  # As used in level_config.json
+    speed = 2.75
+    health = 1
+    color = (171, 3, 3)
+    reward = 5
+
+class BlackEnemy(Enemy):
+    name = "black"  # As used in level_config.json
+    speed = 1.65
+    health = 3
+    color = (0,0,0)
+    reward = 1
+
+# The kind column of the EnemyStore indexes into this tuple
+ENEMY_TYPES = (Enemy, PurpleEnemy, BlueEnemy, RedEnemy, BlackEnemy)
+GREEN_ENEMY, PURPLE_ENEMY, BLUE_ENEMY, RED_ENEMY, BLACK_ENEMY = range(len(ENEMY_TYPES))
+ENEMY_NAMES = tuple(enemy_type.name for enemy_type in ENEMY_TYPES)
+
+# Popping a layered enemy turns it into the next weaker color, indexed by kind, -1 means it dies
+DOWNGRADES = np.array([-1, GREEN_ENEMY, PURPLE_ENEMY, BLUE_ENEMY, RED_ENEMY], dtype=np.int64)
+
+class GameState:
+    """All game state plus the rules that advance it.
+
+    Time only moves forward through step(dt), so the same inputs always give the
+    same game no matter how fast (or whether) it is being drawn.
+    """
+
+    def __init__(self, waves, path=PATH, money=675, lives=25, size=(WIDTH, HEIGHT), maze=None):
+        # Spawn timelines per level, a plain level config dict gets compiled here
+        self.waves = waves if isinstance(waves, CompiledWaves) else compile_waves(waves, ENEMY_NAMES)
+        self.width, self.height = size
+        self.money = money
+        self.lives = lives
+        self.towers = []
+        self.maze = maze  # Mazing mode, see maze.py, when there's no fixed path
+        if maze is None:
+            # One Path, or a PathNetwork when the map has several entrances
+            self.path = path if isinstance(path, (Path, PathNetwork)) else Path(path)
+            self.enemies = EnemyStore(ENEMY_TYPES, self.path)
+            # Cover the path with the spatial hash, enemies never leave it
+            left, top = self.path.points.min(axis=0) - 64
+            right, bottom = self.path.points.max(axis=0) + 64
+            self.placement = PlacementMap(self.width, self.height, self.path, PATH_CLEARANCE, PATH_WIDTH, TOWER_RADIUS)
+        else:
+            self.path = None
+            self.enemies = MazeEnemyStore(ENEMY_TYPES, maze)
+            left, top, right, bottom = 0, 0, self.width, self.height
+            self.placement = None  # The maze itself decides where towers fit
+        self.enemy_hash = SpatialHash(left, top, right - left, bottom - top)
+        self.bullets = BulletStore(BULLET_TYPES, ENEMY_RADIUS, (0, 0, self.width, self.height))
+        self.time = 0.0  # Simulation clock in seconds
+        self.ticks = 0  # Number of steps taken, replays use it to time inputs
+
+        # Variables for managing level progression and spawn rates
+        self.level = 0  # Start from level 0
+        self.can_start_next_level = True
+        self.level_start_time = 0.0
+        self.spawn_times, self.spawn_kinds = CompiledWaves.EMPTY  # Timeline of the current level
+        self.max_enemies = 0
+        self.enemies_spawned = 0  # Track how many enemies have been spawned
+        self.total_enemies = 0
+        # Batches of (handles, kinds, x, y) of the enemies killed for good, only kept while
+        # something watches for them (a deque set by state_stream.py), None otherwise
+        self.kill_log = None
+
+    def start_next_level(self, start_level=False):
+        if start_level:
+            self.level = 1  # Start at level 1
+        else:
+            self.level += 1  # Increment the level
+            if 1 < self.level <= 10:
+                self.money += 150
+
+        # Get the spawn timeline for the current level, already compiled from the config
+        self.spawn_times, self.spawn_kinds = self.waves.get(self.level)
+
+        # Store the total number of enemies for the level
+        self.max_enemies = len(self.spawn_times)
+        self.total_enemies = self.max_enemies
+
+        # Log enemy counts once
+        if log.enabled('level'):
+            counts = np.bincount(self.spawn_kinds, minlength=len(ENEMY_TYPES))
+            log.info('level', "Level %d started with %s", self.level,
+                     " and ".join(f"{count} {name} enemies" for name, count in zip(ENEMY_NAMES, counts.tolist())))
+
+        self.enemies.clear()
+        self.bullets.clear()
+        self.enemies_spawned = 0
+        self.level_start_time = self.time
+        self.can_start_next_level = False
+
+    def play_level(self, level=None, dt=FRAME_TIME, time_limit=3600.0):
+        """Start the next level (or the given one) and step until it's cleared.
+
+        Returns the lives lost during it. Gives up after time_limit simulation seconds,
+        which only happens if the level can never be cleared.
+        """
+        if level is None:
+            self.start_next_level(self.level == 0)
+        else:
+            self.level = level - 1
+            self.start_next_level(level == 1)
+        lives = self.lives
+        end = self.time + time_limit
+        while not self.can_start_next_level and self.time < end:
+            self.step(dt)
+        return lives - self.lives
+
+    def can_place(self, x, y):
+        # Not too close to the path or another tower
+        if self.maze is not None:
+            # A free cell, and walling it off still leaves every enemy a way out
+            return self.maze.can_place(x, y, self.enemies)
+        return self.placement.is_valid(x, y)
+
+    def add_tower(self, tower, pay=True):
+        # Pay for and place a tower, returns False if it can't be afforded or doesn't fit there
+        if pay and self.money < tower.cost:
+            return False
+        if self.maze is not None:
+            tower.x, tower.y = self.maze.snap(tower.x, tower.y)  # Towers fill a whole cell
+            if not self.maze.add_tower(tower.x, tower.y, self.enemies):
+                return False
+        else:
+            if not self.can_place(tower.x, tower.y):
+                return False
+            tower.covered_intervals(self.path)
+            self.placement.add_tower(tower.x, tower.y)
+        tower.index = len(self.towers)
+        self.towers.append(tower)
+        if pay:
+            self.money -= tower.cost
+        return True
+
+    def spawn_enemy(self):
+        # Spawn everything whose time in the level's timeline has come
+        level_time = self.time - self.level_start_time
+        while self.enemies_spawned < self.total_enemies and self.spawn_times[self.enemies_spawned] <= level_time:
+            kind = int(self.spawn_kinds[self.enemies_spawned])
+            # Spawn enemy at the start of the path, taking turns between the entrances
+            self.enemies.enter(kind, self.enemies_spawned % self.enemies.entrance_count)
+            self.enemies_spawned += 1
+            if log.enabled('spawn', DEBUG):
+                log.debug('spawn', "%s spawned! Total spawned: %d", ENEMY_TYPES[kind].__name__, self.enemies_spawned)
+
+    def hit_enemy(self, handle):
+        # Apply one point of damage, returns True if the enemy is gone for good
+        if not log.enabled('combat', DEBUG):
+            return self.damage_enemies([handle]) > 0  # Nothing to look up for the messages
+        enemies = self.enemies
+        row = enemies.row_of(handle)
+        kind, x, y = int(enemies.kind[row]), enemies.x[row], enemies.y[row]
+        log.debug('combat', "Enemy hit! Health left: %d", enemies.health[row] - 1)
+        killed = self.damage_enemies([handle]) > 0
+        if killed:
+            log.debug('combat', "Enemy at (%.1f, %.1f) defeated", x, y)
+        elif enemies.kind[row] != kind:
+            log.debug('combat', "%s defeated and a %s took its place!", ENEMY_TYPES[kind].__name__, ENEMY_TYPES[enemies.kind[row]].__name__)
+        return killed
+
+    def damage_enemies(self, handles):
+        # One point of damage to each enemy in a batch, returns how many died for good
+        enemies = self.enemies
+        rows = np.unique(enemies.rows_of(handles))
+        if len(rows) == 0:
+            return 0
+        enemies.health[rows] -= 1
+        popped = rows[enemies.health[rows] <= 0]
+        if len(popped) == 0:
+            return 0
+
+        kinds = enemies.kind[popped].astype(np.int64)
+        self.money += int(enemies.type_reward[kinds].sum())  # Add money for every popped layer
+
+        # Layered enemies turn into the next weaker color where they stand, the rest die
+        next_kinds = DOWNGRADES[kinds]
+        dying = next_kinds < 0
+        enemies.set_kind(popped[~dying], next_kinds[~dying])
+        if self.kill_log is not None and dying.any():
+            killed = popped[dying]
+            self.kill_log.append((enemies.handle[killed], kinds[dying], enemies.x[killed], enemies.y[killed]))
+        enemies.kill_rows(popped[dying])
+        return int(np.count_nonzero(dying))
+
+    def update_bullets(self, dt=FRAME_TIME):
+        # Move every bullet at once, then resolve the hits oldest bullet first
+        bullets = self.bullets
+        hits = bullets.advance(self.enemies, dt / FRAME_TIME)
+        if len(hits) == 0:
+            return
+        landed = []
+        for row in hits.tolist():
+            target = int(bullets.target[row])
+            # An earlier bullet this tick may have finished it off, this one flies on
+            if target not in self.enemies:
+                continue
+            BULLET_TYPES[bullets.kind[row]].on_hit(self, self.towers[bullets.owner[row]], target)
+            landed.append(row)
+        bullets.remove_rows(landed)
+
+    def furthest_in_range(self, tower):
+        # Row of the enemy closest to leaking inside the tower's range, or None
+        if self.maze is None:
+            return tower._furthest_in_range(self.enemies)
+        # No fixed path to measure coverage on, look at the enemies near the tower instead
+        rows = self.enemies.rows_of(self.enemy_grid().query_radius(tower.x, tower.y, tower.range))
+        if len(rows) == 0:
+            return None
+        return int(rows[np.argmax(self.enemies.distance[rows])])
+
+    def enemy_grid(self):
+        # Spatial hash of the enemies, rebuilt at most once per tick when something asks
+        return self.enemy_hash.update(self.enemies)
+
+    def step(self, dt=FRAME_TIME):
+        # Advance the whole game by dt seconds of simulation time
+        self.time += dt
+        self.ticks += 1
+
+        with profiler.phase('towers'):
+            for tower in self.towers:
+                tower.update(self, dt)
+        with profiler.phase('bullets'):
+            self.update_bullets(dt)
+            # Enemies killed by the towers leave the store in one batch
+            self.enemies.flush_removals()
+
+        # Spawn enemies and move them
+        with profiler.phase('spawn'):
+            self.spawn_enemy()
+
+        # Every enemy moves in one vectorized step, leaks cost a life each
+        with profiler.phase('movement'):
+            self.lives -= self.enemies.advance(dt / FRAME_TIME)
+
+        # Check for level progression
+        if not self.can_start_next_level and len(self.enemies) == 0 and self.enemies_spawned >= self.total_enemies:
+            self.can_start_next_level = True  # Allow starting the next level
+            log.info('level', "Level %d cleared with %d lives and %d money left", self.level, self.lives, self.money)
+            log.flush()  # Level end is a safe moment to write out anything buffered
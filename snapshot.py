@@ -0,0 +1,185 @@
+import hashlib
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from maze import Maze
+from path import build_path
+from simulation import GameState, TOWER_TYPES
+
+# A snapshot is the whole GameState packed into bytes: the scalars with struct, and the
+# enemy, bullet and tower tables as raw little endian column arrays. Enemies keep their
+# rows, handles and slot table exactly, so bullets can keep naming their target by handle
+# and a restored game carries on tick for tick like the original would have.
+#
+#     b'TDSV', version u16, then zlib compressed:
+#       scalars       see SCALARS
+#       map           width u32, height u32, path count u32, then per path a point
+#                     count u32 and x, y f64 pairs. A mazing map has no paths, instead
+#                     cell size u32 and the entrance, exit and wall cells, each a count
+#                     u32 then column, row u32 pairs
+#       towers        count u32, then per tower: type u8, x i32, y i32, last shot time f64
+#       enemies       row count u32, next slot u32, free slot count u32, then the columns
+#                     in ENEMY_COLUMNS order for every row, slot_row and slot_generation
+#                     for every slot, and the free slot list
+#       bullets       count u32, then the columns in BULLET_COLUMNS order
+#
+# Compiled waves aren't stored, only a digest of them, so loading needs the same level
+# config the game was saved with.
+
+MAGIC = b'TDSV'
+VERSION = 2
+
+SCALARS = struct.Struct('<8sqqiiqqqdd?')
+# Column name and the dtype it is stored as
+ENEMY_COLUMNS = (('handle', '<i8'), ('row_slot', '<i8'), ('kind', '<i1'), ('x', '<f8'), ('y', '<f8'),
+                 ('speed', '<f8'), ('health', '<i4'), ('max_health', '<i4'), ('distance', '<f8'), ('slow', '<f8'))
+BULLET_COLUMNS = (('x', '<f8'), ('y', '<f8'), ('vx', '<f8'), ('vy', '<f8'), ('target', '<i8'),
+                  ('kind', '<i1'), ('owner', '<i8'), ('homing', '?'))
+TOWER = struct.Struct('<Biid')
+COUNT = struct.Struct('<I')
+
+# Towers are stored by their place in this list
+TOWER_ORDER = list(TOWER_TYPES)
+
+def waves_digest(waves):
+    # Short digest of every level's compiled timeline
+    digest = hashlib.blake2b(digest_size=8)
+    for level in sorted(waves.levels):
+        times, kinds = waves.levels[level]
+        digest.update(struct.pack('<i', level))
+        digest.update(times.tobytes())
+        digest.update(kinds.tobytes())
+    digest.update(waves.signature())
+    return digest.digest()
+
+def snapshot(state):
+    """Pack the whole game into bytes, see the module comment for the layout."""
+    enemies, bullets = state.enemies, state.bullets
+    enemies.flush_removals()  # Between ticks there's nothing to flush, this just makes sure
+    parts = [SCALARS.pack(waves_digest(state.waves), state.ticks, state.money, state.lives, state.level,
+                          state.enemies_spawned, state.max_enemies, state.total_enemies,
+                          state.time, state.level_start_time, state.can_start_next_level)]
+
+    maze = state.maze
+    paths = state.path.paths if maze is None else []
+    parts.append(struct.pack('<III', state.width, state.height, len(paths)))
+    for path in paths:
+        parts.append(COUNT.pack(len(path.points)))
+        parts.append(path.points.astype('<f8').tobytes())
+    if maze is not None:
+        parts.append(COUNT.pack(maze.cell_size))
+        for cells in (maze.entrance_cells, maze.exit_cells, maze.wall_cells):
+            cells = np.array(cells, dtype=np.int64)
+            parts.append(COUNT.pack(len(cells)))
+            parts.append(np.stack([cells % maze.columns, cells // maze.columns], axis=1).astype('<u4').tobytes())
+
+    parts.append(COUNT.pack(len(state.towers)))
+    for tower in state.towers:
+        parts.append(TOWER.pack(TOWER_ORDER.index(type(tower).__name__), int(tower.x), int(tower.y), tower.last_shot_time))
+
+    n, slots = enemies.count, enemies.next_slot
+    parts.append(struct.pack('<III', n, slots, len(enemies.free_slots)))
+    for name, dtype in ENEMY_COLUMNS:
+        parts.append(getattr(enemies, name)[:n].astype(dtype).tobytes())
+    parts.append(enemies.slot_row[:slots].astype('<i8').tobytes())
+    parts.append(enemies.slot_generation[:slots].astype('<i8').tobytes())
+    parts.append(np.array(enemies.free_slots, dtype='<i8').tobytes())
+
+    b = bullets.count
+    parts.append(COUNT.pack(b))
+    for name, dtype in BULLET_COLUMNS:
+        parts.append(getattr(bullets, name)[:b].astype(dtype).tobytes())
+
+    return MAGIC + struct.pack('<H', VERSION) + zlib.compress(b''.join(parts), 1)
+
+class _Reader:
+    # Walks through the unpacked snapshot body
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, layout):
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+        return values
+
+    def array(self, dtype, count):
+        array = np.frombuffer(self.data, dtype=dtype, count=count, offset=self.offset)
+        self.offset += array.nbytes
+        return array
+
+def restore(data, waves):
+    """Rebuild a GameState from snapshot() bytes. waves must be the level config it used."""
+    if data[:4] != MAGIC:
+        raise ValueError("Not a saved game")
+    version, = struct.unpack_from('<H', data, 4)
+    if version != VERSION:
+        raise ValueError(f"Saved game is version {version}, this game reads version {VERSION}")
+    reader = _Reader(zlib.decompress(data[6:]))
+
+    (digest, ticks, money, lives, level, enemies_spawned, max_enemies, total_enemies,
+     time, level_start_time, can_start_next_level) = reader.unpack(SCALARS)
+    if digest != waves_digest(waves):
+        raise ValueError("Saved game was made with a different level config")
+    width, height, path_count = reader.unpack(struct.Struct('<III'))
+    paths = []
+    for _ in range(path_count):
+        point_count, = reader.unpack(COUNT)
+        paths.append(reader.array('<f8', point_count * 2).reshape(-1, 2))
+
+    if paths:
+        state = GameState(waves, path=build_path(paths), money=money, lives=lives, size=(width, height))
+    else:
+        cell_size, = reader.unpack(COUNT)
+        cells = []
+        for _ in range(3):
+            count, = reader.unpack(COUNT)
+            cells.append(reader.array('<u4', count * 2).reshape(-1, 2).tolist())
+        maze = Maze(width, height, cell_size, *cells)
+        state = GameState(waves, money=money, lives=lives, size=(width, height), maze=maze)
+    state.ticks, state.level, state.time = ticks, level, time
+    state.level_start_time, state.can_start_next_level = level_start_time, can_start_next_level
+    state.spawn_times, state.spawn_kinds = waves.get(level)
+    state.enemies_spawned, state.max_enemies, state.total_enemies = enemies_spawned, max_enemies, total_enemies
+
+    tower_count, = reader.unpack(COUNT)
+    for _ in range(tower_count):
+        tower_type, x, y, last_shot_time = reader.unpack(TOWER)
+        tower = TOWER_TYPES[TOWER_ORDER[tower_type]](x, y)
+        tower.last_shot_time = last_shot_time
+        # Already paid for. One that doesn't fit any more would shift every saved bullet's
+        # owner onto the wrong tower, so the save is no good
+        if not state.add_tower(tower, pay=False):
+            raise ValueError(f"Saved game has a {TOWER_ORDER[tower_type]} at ({x}, {y}) that can't be placed")
+
+    enemies = state.enemies
+    n, slots, free_count = reader.unpack(struct.Struct('<III'))
+    enemies.reserve(max(n, slots))
+    for name, dtype in ENEMY_COLUMNS:
+        getattr(enemies, name)[:n] = reader.array(dtype, n)
+    enemies.slot_row[:slots] = reader.array('<i8', slots)
+    enemies.slot_generation[:slots] = reader.array('<i8', slots)
+    enemies.free_slots = reader.array('<i8', free_count).tolist()
+    enemies.count, enemies.next_slot = n, slots
+
+    bullets = state.bullets
+    b, = reader.unpack(COUNT)
+    bullets.reserve(b)
+    for name, dtype in BULLET_COLUMNS:
+        getattr(bullets, name)[:b] = reader.array(dtype, b)
+    bullets.count = b
+    return state
+
+def save_game(state, filename):
+    # Write to a temporary file first so a crash never leaves half a save behind
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(snapshot(state))
+    os.replace(temporary, filename)
+
+def load_game(filename, waves):
+    with open(filename, 'rb') as file:
+        return restore(file.read(), waves)
@@ -0,0 +1,94 @@
+import numpy as np
+
+class SpatialHash:
+    """Uniform grid over the live enemies for area queries.
+
+    The whole grid is rebuilt from the EnemyStore arrays with one counting sort, at most
+    once per tick and only when someone asks. It hands back enemy handles rather than
+    rows, so enemies dying mid-tick don't invalidate it. A query only looks at the few
+    cells it overlaps, so its cost depends on how crowded that spot is and not on how
+    many enemies exist in total.
+    """
+
+    def __init__(self, left, top, width, height, cell_size=64):
+        self.left = left
+        self.top = top
+        self.cell_size = cell_size
+        self.columns = max(1, int(np.ceil(width / cell_size)))
+        self.rows = max(1, int(np.ceil(height / cell_size)))
+        self.built_version = None
+        self.handle = np.zeros(0, dtype=np.int64)
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.cell_start = np.zeros(self.columns * self.rows + 1, dtype=np.int64)
+
+    def _cell(self, x, y):
+        column = np.clip(((x - self.left) // self.cell_size).astype(np.int64), 0, self.columns - 1)
+        row = np.clip(((y - self.top) // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        return column, row
+
+    def rebuild(self, enemies):
+        # Bucket every live enemy by cell, points in cell c are [cell_start[c], cell_start[c + 1])
+        n = enemies.count
+        column, row = self._cell(enemies.x[:n], enemies.y[:n])
+        keys = row * self.columns + column
+        order = np.argsort(keys, kind='stable')  # Radix sort for integer keys
+        self.handle = enemies.handle[:n][order]
+        self.x = enemies.x[:n][order]
+        self.y = enemies.y[:n][order]
+        counts = np.bincount(keys, minlength=self.columns * self.rows)
+        self.cell_start[0] = 0
+        np.cumsum(counts, out=self.cell_start[1:])
+        self.built_version = enemies.position_version
+
+    def update(self, enemies):
+        # Rebuild only if enemies moved since the last build
+        if self.built_version != enemies.position_version:
+            self.rebuild(enemies)
+        return self
+
+    def _cell_of(self, x, y):
+        # _cell for one point, plain Python is much quicker than NumPy on scalars
+        column = min(max(int((x - self.left) // self.cell_size), 0), self.columns - 1)
+        row = min(max(int((y - self.top) // self.cell_size), 0), self.rows - 1)
+        return column, row
+
+    def _candidates(self, left, top, right, bottom):
+        # Indices of every point in the cells overlapping the box
+        first_column, first_row = self._cell_of(left, top)
+        last_column, last_row = self._cell_of(right, bottom)
+        slices = []
+        for row in range(first_row, last_row + 1):
+            start = self.cell_start[row * self.columns + first_column]
+            end = self.cell_start[row * self.columns + last_column + 1]
+            if end > start:
+                slices.append(np.arange(start, end))
+        if not slices:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def query_radius(self, x, y, r):
+        # Handles of enemies within r of (x, y), nearest first
+        candidates = self._candidates(x - r, y - r, x + r, y + r)
+        dx = self.x[candidates] - x
+        dy = self.y[candidates] - y
+        distance_squared = dx * dx + dy * dy
+        inside = distance_squared <= r * r
+        candidates, distance_squared = candidates[inside], distance_squared[inside]
+        return self.handle[candidates[np.argsort(distance_squared, kind='stable')]]
+
+    def query_segment(self, x0, y0, x1, y1, r=0.0):
+        # Handles of enemies within r of the segment from (x0, y0) to (x1, y1), nearest to the start first
+        candidates = self._candidates(min(x0, x1) - r, min(y0, y1) - r, max(x0, x1) + r, max(y0, y1) + r)
+        segment_x, segment_y = x1 - x0, y1 - y0
+        length_squared = segment_x * segment_x + segment_y * segment_y
+        px = self.x[candidates] - x0
+        py = self.y[candidates] - y0
+        if length_squared > 0:
+            t = np.clip((px * segment_x + py * segment_y) / length_squared, 0.0, 1.0)
+        else:
+            t = np.zeros(len(candidates))
+        dx = px - t * segment_x
+        dy = py - t * segment_y
+        inside = dx * dx + dy * dy <= r * r
+        return self.handle[candidates[inside][np.argsort(t[inside], kind='stable')]]
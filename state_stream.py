@@ -0,0 +1,547 @@
+"""Watch a game's state stream: what a spectator or a dashboard gets from TD_STREAM.
+
+    TD_STREAM=tcp:127.0.0.1:7878 python main.py          # the game serves its state
+    python state_stream.py tcp:127.0.0.1:7878            # one summary line a second
+    python state_stream.py unix:/tmp/td.sock --messages 600 --quiet
+
+The server side is StateStreamServer. It takes a Frame (see sim_thread.py) whenever the
+simulation has one to spare and sends every connected client one message per frame,
+at most max_rate frames a second. A keyframe describes everything, the deltas in
+between only what changed since the message before. Encoding and sending happen on the
+server's own thread, so publishing costs the simulation a lock and an append however
+many enemies or clients there are. That thread still shares the interpreter with the
+simulation, so it also keeps its own share down to cost_budget: after an encode that
+took t seconds the next frame isn't due for t / cost_budget seconds. A client that
+can't keep up isn't waited for: once it has more than a keyframe interval of messages
+or max_backlog bytes queued, what it hasn't been sent yet is dropped and it skips to
+the latest keyframe and the deltas after it.
+
+Every message is a u32 length and then that many bytes of zlib compressed body, all
+little endian. The body is:
+
+    header     type u8 (0 keyframe, 1 delta), sequence number u32, tick u32, money i64,
+               lives i32, level i32, enemies still to spawn i32
+    keyframe   map width u32, height u32
+               towers: count u32, then per tower type u8 (snapshot.TOWER_ORDER), x i32, y i32
+               enemies: count u32, then the ENEMY_COLUMNS arrays in order, sorted by handle
+    delta      towers placed since the last message, laid out like the keyframe's
+               removed: count u32, handles i64
+               added: count u32, then the ENEMY_COLUMNS arrays
+               moved: count u32 (every enemy kept), dx i16, dy i16 in handle order
+               kind changes and health changes: each a count u32, indexes u32 into the
+               new enemy list and the new values u8
+    both       kills since the last message: count u32, then the KILL_COLUMNS arrays
+
+Positions are in 1/POSITION_SCALE pixels, health is a fraction of full in 1/255ths. A
+delta only applies to the message right before it. A decoder that missed one ignores
+everything up to the next keyframe.
+"""
+import argparse
+import collections
+import os
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from event_log import log
+from snapshot import TOWER_ORDER
+
+KEYFRAME, DELTA = range(2)
+
+MESSAGE = struct.Struct('<I')
+HEADER = struct.Struct('<BIIqiii')
+SIZE = struct.Struct('<II')
+TOWER = struct.Struct('<Bii')
+COUNT = struct.Struct('<I')
+
+POSITION_SCALE = 4  # Positions go out in quarter pixels
+MAX_MOVE = 32767  # Longer moves than fit in an i16 go out as a removal and an add
+
+ENEMY_COLUMNS = (('handle', '<i8'), ('kind', 'u1'), ('x', '<i4'), ('y', '<i4'), ('health', 'u1'))
+KILL_COLUMNS = (('handle', '<i8'), ('kind', 'u1'), ('x', '<i4'), ('y', '<i4'))
+
+# Kernel send buffer for each client, small so a slow client shows up in max_backlog
+# instead of hiding seconds of old messages in the socket
+SEND_BUFFER = 64 * 1024
+
+# Kill batches kept for a stream that hasn't taken them yet, older ones are dropped
+KILL_BACKLOG = 4096
+
+def watch_kills(state):
+    # Have the simulation note down kills from now on, for take_kills
+    state.kill_log = collections.deque(maxlen=KILL_BACKLOG)
+
+def take_kills(state):
+    # The kills since the last call, as a table like ENEMY_COLUMNS without health
+    batches = state.kill_log
+    if not batches:
+        return _empty(KILL_COLUMNS)
+    handle, kind, x, y = (np.concatenate(column) for column in zip(*batches))
+    batches.clear()
+    return {'handle': handle.astype('<i8'), 'kind': kind.astype('u1'),
+            'x': np.round(x * POSITION_SCALE).astype('<i4'), 'y': np.round(y * POSITION_SCALE).astype('<i4')}
+
+def _empty(columns):
+    return {name: np.empty(0, dtype=dtype) for name, dtype in columns}
+
+def enemy_table(enemies):
+    # The enemies of a Frame as ENEMY_COLUMNS, sorted by handle
+    order = np.argsort(enemies.handle)
+    health = enemies.health[order] * 255 / np.maximum(enemies.max_health[order], 1)
+    return {'handle': enemies.handle[order].astype('<i8'),
+            'kind': enemies.kind[order].astype('u1'),
+            'x': np.round(enemies.x[order] * POSITION_SCALE).astype('<i4'),
+            'y': np.round(enemies.y[order] * POSITION_SCALE).astype('<i4'),
+            'health': np.round(np.clip(health, 0, 255)).astype('u1')}
+
+def _pack_table(table, columns):
+    return [COUNT.pack(len(table[columns[0][0]]))] + [np.ascontiguousarray(table[name], dtype).tobytes()
+                                                       for name, dtype in columns]
+
+def _pack_towers(towers):
+    return [COUNT.pack(len(towers))] + [TOWER.pack(TOWER_ORDER.index(type(tower).__name__), tower.x, tower.y)
+                                        for tower in towers]
+
+def _pack_changes(indexes, values):
+    return [COUNT.pack(len(indexes)), indexes.astype('<u4').tobytes(), values.astype('u1').tobytes()]
+
+class StreamEncoder:
+    """Turns a run of Frames into keyframe and delta messages.
+
+    Remembers the enemy table it last sent, quantized exactly like the decoder will
+    have rebuilt it, so rounding never adds up over a run of deltas.
+    """
+
+    def __init__(self, keyframe_interval=60):
+        self.keyframe_interval = keyframe_interval  # Messages from one keyframe to the next
+        self.reset()
+
+    def reset(self):
+        # Start over with a keyframe, for when whoever got the last messages is gone
+        self.sequence = 0
+        self.previous = None
+        self.tower_count = 0
+        self.layout = None
+        self.since_keyframe = 0
+
+    def encode(self, frame, kills=None):
+        """One message for frame and the kills since the last one. Returns (bytes, is keyframe)."""
+        table = enemy_table(frame.enemies)
+        layout = (frame.generation, frame.width, frame.height)
+        keyframe = (self.previous is None or self.since_keyframe >= self.keyframe_interval
+                    or layout != self.layout or len(frame.towers) < self.tower_count)
+        self.sequence += 1
+        parts = [HEADER.pack(KEYFRAME if keyframe else DELTA, self.sequence, frame.ticks, frame.money,
+                             frame.lives, frame.level, frame.max_enemies - frame.enemies_spawned)]
+        if keyframe:
+            parts.append(SIZE.pack(frame.width, frame.height))
+            parts += _pack_towers(frame.towers)
+            parts += _pack_table(table, ENEMY_COLUMNS)
+            self.since_keyframe = 0
+        else:
+            parts += _pack_towers(frame.towers[self.tower_count:])
+            parts += self._delta(table)
+            self.since_keyframe += 1
+        parts += _pack_table(kills if kills is not None else _empty(KILL_COLUMNS), KILL_COLUMNS)
+        self.previous = table
+        self.tower_count = len(frame.towers)
+        self.layout = layout
+        body = zlib.compress(b''.join(parts), 1)
+        return MESSAGE.pack(len(body)) + body, keyframe
+
+    def _delta(self, table):
+        previous = self.previous
+        handle, old_handle = table['handle'], previous['handle']
+        # Where each enemy was in the last table, both are sorted by handle
+        at = np.minimum(np.searchsorted(old_handle, handle), max(len(old_handle) - 1, 0))
+        kept = np.zeros(len(handle), dtype=bool)
+        if len(old_handle):
+            kept = old_handle[at] == handle
+        dx = table['x'] - previous['x'][at] if len(old_handle) else table['x']
+        dy = table['y'] - previous['y'][at] if len(old_handle) else table['y']
+        kept &= (np.abs(dx) <= MAX_MOVE) & (np.abs(dy) <= MAX_MOVE)
+        still_there = np.zeros(len(old_handle), dtype=bool)
+        still_there[at[kept]] = True
+
+        parts = [COUNT.pack(np.count_nonzero(~still_there)), old_handle[~still_there].tobytes()]
+        parts += _pack_table({name: column[~kept] for name, column in table.items()}, ENEMY_COLUMNS)
+        parts += [COUNT.pack(np.count_nonzero(kept)), dx[kept].astype('<i2').tobytes(), dy[kept].astype('<i2').tobytes()]
+        rows = np.flatnonzero(kept)
+        for name in ('kind', 'health'):
+            changed = rows[table[name][rows] != previous[name][at[rows]]]
+            parts += _pack_changes(changed, table[name][changed])
+        return parts
+
+class _Reader:
+    # Walks through a message body
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, layout):
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+        return values
+
+    def count(self):
+        return self.unpack(COUNT)[0]
+
+    def array(self, dtype, count):
+        dtype = np.dtype(dtype)
+        column = np.frombuffer(self.data, dtype, count, self.offset)
+        self.offset += dtype.itemsize * count
+        return column
+
+    def table(self, columns):
+        count = self.count()
+        return {name: self.array(dtype, count) for name, dtype in columns}
+
+    def towers(self):
+        return [self.unpack(TOWER) for _ in range(self.count())]
+
+class StreamDecoder:
+    """Rebuilds what a state stream describes, one message body at a time.
+
+    After each message, enemies is the table of live enemies (ENEMY_COLUMNS, sorted by
+    handle, positions still scaled), towers a list of (type, x, y) and kills the kills
+    that message brought. skipped counts the deltas that came without the message they
+    apply to.
+    """
+
+    def __init__(self):
+        self.sequence = None
+        self.ticks = self.money = self.lives = self.level = self.enemies_left = 0
+        self.width = self.height = 0
+        self.towers = []
+        self.enemies = _empty(ENEMY_COLUMNS)
+        self.kills = _empty(KILL_COLUMNS)
+        self.keyframes = 0
+        self.skipped = 0
+
+    def feed(self, body):
+        # Apply one message body (still compressed), returns False if it had to be skipped
+        reader = _Reader(zlib.decompress(body))
+        kind, sequence, *hud = reader.unpack(HEADER)
+        if kind == DELTA and (self.sequence is None or sequence != self.sequence + 1):
+            self.skipped += 1
+            return False
+        self.ticks, self.money, self.lives, self.level, self.enemies_left = hud
+        if kind == KEYFRAME:
+            self.width, self.height = reader.unpack(SIZE)
+            self.towers = reader.towers()
+            self.enemies = {name: column.copy() for name, column in reader.table(ENEMY_COLUMNS).items()}
+            self.keyframes += 1
+        else:
+            self.towers += reader.towers()
+            self._apply_delta(reader)
+        self.kills = reader.table(KILL_COLUMNS)
+        self.sequence = sequence
+        return True
+
+    def _apply_delta(self, reader):
+        enemies = self.enemies
+        removed = reader.array('<i8', reader.count())
+        added = reader.table(ENEMY_COLUMNS)
+        moved = reader.count()
+        dx, dy = reader.array('<i2', moved), reader.array('<i2', moved)
+        kept = ~np.isin(enemies['handle'], removed)
+        enemies = {name: column[kept] for name, column in enemies.items()}
+        enemies['x'] = enemies['x'] + dx
+        enemies['y'] = enemies['y'] + dy
+        order = np.argsort(np.concatenate([enemies['handle'], added['handle']]), kind='stable')
+        enemies = {name: np.concatenate([column, added[name]])[order] for name, column in enemies.items()}
+        for name in ('kind', 'health'):
+            indexes = reader.array('<u4', reader.count())
+            enemies[name][indexes] = reader.array('u1', len(indexes))
+        self.enemies = enemies
+
+def parse_address(text):
+    """'tcp:host:port', 'host:port', ':port' or 'unix:path' -> (socket family, address)."""
+    if text.startswith('unix:'):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("Unix sockets aren't available here, use tcp:host:port")
+        return socket.AF_UNIX, text[len('unix:'):]
+    if text.startswith('tcp:'):
+        text = text[len('tcp:'):]
+    host, _, port = text.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f"Bad stream address {text!r}, expected tcp:host:port or unix:path")
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+class _Client:
+    __slots__ = ('sock', 'queue', 'queued', 'sending', 'skips')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.queue = collections.deque()  # Whole messages not started yet
+        self.queued = 0  # Bytes in them
+        self.sending = b''  # Rest of the message being sent, never cut short
+        self.skips = 0
+
+class StateStreamServer:
+    """Serves Frames to every client connected to a local TCP or Unix socket.
+
+    The simulation asks due() and only then builds what publish() needs, so with nobody
+    watching, or between two frames, it costs nothing. Frames are due at most max_rate
+    times a second, and less often when encoding them would take more than cost_budget
+    of the time.
+    """
+
+    def __init__(self, address, keyframe_interval=60, max_rate=60, cost_budget=0.1, max_backlog=1024 * 1024):
+        self.family, self.address = parse_address(address) if isinstance(address, str) else address
+        self.encoder = StreamEncoder(keyframe_interval)
+        self.max_rate = max_rate
+        self.cost_budget = cost_budget  # Share of the time encoding may take
+        self.min_interval = 1.0 / max_rate  # Seconds from one due frame to the next
+        self.max_backlog = max_backlog  # Bytes queued for one client before it skips ahead
+        self.recent = []  # The last keyframe and every delta after it, for catching up
+        self.clients = []
+        self.client_count = 0  # Read by due() from other threads
+        self.published = 0.0
+        self._pending = None  # (frame, kill tables) not encoded yet, only the newest is kept
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.sent = 0  # Messages and bytes handed to clients, for the curious
+        self.sent_bytes = 0
+
+    def start(self):
+        if self.family == socket.AF_INET:
+            self.listener = socket.create_server(self.address)
+        else:
+            if os.path.exists(self.address):
+                os.unlink(self.address)  # Left over from a game that didn't shut down
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(self.address)
+            self.listener.listen()
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()  # The real port when 0 was asked for
+        self._wake_read, self._wake_write = socket.socketpair()
+        self._wake_read.setblocking(False)
+        self._wake_write.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, 'accept')
+        self.selector.register(self._wake_read, selectors.EVENT_READ, 'wake')
+        self._thread = threading.Thread(target=self._run, name='state-stream', daemon=True)
+        self._thread.start()
+        log.info('stream', "Streaming game state on %s", self.address)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake()
+        self._thread.join()
+        self._thread = None
+        for client in self.clients:
+            client.sock.close()
+        self.clients = []
+        self.selector.close()
+        self.listener.close()
+        self._wake_read.close()
+        self._wake_write.close()
+        if self.family != socket.AF_INET:
+            os.unlink(self.address)
+
+    # Called from the simulation
+
+    def due(self):
+        # Whether publish would send anything right now
+        return self.client_count > 0 and time.perf_counter() - self.published >= self.min_interval
+
+    def publish(self, frame, kills=None):
+        """Hand over a Frame and the kills since the last one (take_kills), never blocks.
+
+        A frame that the server thread hasn't got round to yet is replaced, its kills
+        are kept.
+        """
+        self.published = time.perf_counter()
+        with self._lock:
+            kill_tables = [] if self._pending is None else self._pending[1]
+            if kills is not None and len(kills['handle']):
+                kill_tables.append(kills)
+            self._pending = (frame, kill_tables)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_write.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Already woken up plenty
+
+    # The server thread
+
+    def _run(self):
+        while not self._stop.is_set():
+            for key, events in self.selector.select(timeout=1.0):
+                if key.data == 'accept':
+                    self._accept()
+                elif key.data == 'wake':
+                    try:
+                        while self._wake_read.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    client = key.data
+                    if events & selectors.EVENT_READ and not self._read(client):
+                        continue
+                    if events & selectors.EVENT_WRITE:
+                        self._send(client)
+            with self._lock:
+                pending, self._pending = self._pending, None
+            if pending is not None and self.clients:
+                self._broadcast(*pending)
+
+    def _accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        client = _Client(sock)
+        self.clients.append(client)
+        self.client_count = len(self.clients)
+        self.selector.register(sock, selectors.EVENT_READ, client)
+        # Start it off from the last keyframe, or from the next message if there's none yet
+        if not self.recent:
+            self.encoder.reset()
+        for message in self.recent:
+            self._queue(client, message)
+        log.info('stream', "Stream client connected, %d watching", len(self.clients))
+
+    def _read(self, client):
+        # Clients don't say anything, a read only ever finds the connection closing
+        try:
+            data = client.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            data = b''
+        if data:
+            return True
+        self._drop(client)
+        return False
+
+    def _drop(self, client):
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        self.clients.remove(client)
+        self.client_count = len(self.clients)
+        if not self.clients:
+            self.recent = []
+            self.encoder.reset()  # The next client needs a keyframe to start from
+        log.info('stream', "Stream client left after skipping ahead %d times, %d watching", client.skips, len(self.clients))
+
+    def _broadcast(self, frame, kill_tables):
+        kills = None
+        # Kills from before anyone was watching stay out of the first message
+        if kill_tables and self.encoder.previous is not None:
+            kills = {name: np.concatenate([table[name] for table in kill_tables]) for name, _ in KILL_COLUMNS}
+        started = time.perf_counter()
+        message, keyframe = self.encoder.encode(frame, kills)
+        self.min_interval = max(1.0 / self.max_rate, (time.perf_counter() - started) / self.cost_budget)
+        if keyframe:
+            self.recent = []
+        self.recent.append(message)
+        for client in list(self.clients):
+            if len(client.queue) >= self.encoder.keyframe_interval or client.queued + len(message) > self.max_backlog:
+                # Too far behind: forget what it hasn't been sent and catch up from the latest keyframe
+                client.queue.clear()
+                client.queued = 0
+                client.skips += 1
+                log.debug('stream', "Stream client too slow, skipping it ahead to the last keyframe")
+                for catch_up in self.recent:
+                    self._queue(client, catch_up)
+            else:
+                self._queue(client, message)
+
+    def _queue(self, client, message):
+        client.queue.append(message)
+        client.queued += len(message)
+        self._send(client)
+
+    def _send(self, client):
+        # Write as much as the socket takes without blocking, and ask to hear when it takes more
+        sock = client.sock
+        try:
+            while True:
+                if not client.sending:
+                    if not client.queue:
+                        break
+                    client.sending = memoryview(client.queue.popleft())
+                    client.queued -= len(client.sending)
+                    self.sent += 1
+                sent = sock.send(client.sending)
+                self.sent_bytes += sent
+                client.sending = client.sending[sent:]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self._drop(client)
+            return
+        waiting = bool(client.sending) or bool(client.queue)
+        self.selector.modify(sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if waiting else 0), client)
+
+def read_messages(sock):
+    # Message bodies from a connected socket until it closes
+    buffer = bytearray()
+    while True:
+        data = sock.recv(1 << 16)
+        if not data:
+            return
+        buffer += data
+        while len(buffer) >= MESSAGE.size:
+            length, = MESSAGE.unpack_from(buffer)
+            if len(buffer) < MESSAGE.size + length:
+                break
+            yield bytes(buffer[MESSAGE.size:MESSAGE.size + length])
+            del buffer[:MESSAGE.size + length]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('address', help="Where the game streams, tcp:host:port or unix:path")
+    parser.add_argument('--messages', type=int, help="Stop after this many messages")
+    parser.add_argument('--quiet', action='store_true', help="Only the totals at the end")
+    args = parser.parse_args(argv)
+
+    try:
+        family, address = parse_address(args.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(address)
+    except (ValueError, OSError) as error:
+        print(f"Can't connect to {args.address}: {error}", file=sys.stderr)
+        return 1
+
+    decoder = StreamDecoder()
+    received = received_bytes = kills = 0
+    started = last_line = time.perf_counter()
+    with sock:
+        for body in read_messages(sock):
+            received += 1
+            received_bytes += MESSAGE.size + len(body)
+            if decoder.feed(body):
+                kills += len(decoder.kills['handle'])
+            now = time.perf_counter()
+            if not args.quiet and now - last_line >= 1.0:
+                last_line = now
+                print(f"tick {decoder.ticks:7d}  level {decoder.level:3d}  money {decoder.money:7d}  "
+                      f"lives {decoder.lives:4d}  enemies {len(decoder.enemies['handle']):6d}  "
+                      f"towers {len(decoder.towers):3d}  kills {kills:7d}", flush=True)
+            if args.messages is not None and received >= args.messages:
+                break
+    seconds = max(time.perf_counter() - started, 1e-9)
+    print(f"{received} messages ({decoder.keyframes} keyframes, {decoder.skipped} skipped) in {seconds:.1f}s, "
+          f"{received_bytes / seconds / 1024:.1f} kB/s, last at tick {decoder.ticks} with "
+          f"{len(decoder.enemies['handle'])} enemies and {kills} kills")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Play endless generated waves headless and report throughput for every wave.
+
+    python stress.py                                  # stress profile, 10 waves, simulation only
+    python stress.py --levels 12 --render             # draw every tick too, on the dummy driver
+    python stress.py --profile endless --first 18 --levels 30 -o endless.csv
+    python stress.py --map maps/canyon.json --towers 120
+    python stress.py --stream tcp:127.0.0.1:7878      # watch it with state_stream.py
+
+Waves come from a difficulty curve in endless.py. The stress profile starts at 1000
+enemies and grows by half each wave, passing 50k enemies at wave 10, all spawned
+within a few seconds so most of them are alive at once. Towers are placed at random
+free spots with unlimited money, and lives don't run out.
+
+For each wave it prints how long the simulation took per tick and where that went
+(towers is targeting and shooting, bullets, spawn, movement), the sustained ticks and
+enemy updates per second, and with --render the frames per second the renderer kept
+up while drawing every tick. -o writes the same rows as CSV. --stream serves the game
+state like TD_STREAM does for the game, publishing is counted in the simulation time.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import numpy as np
+
+from endless import endless_waves, PROFILES
+from maps import DEFAULT_MAP, load_map
+from profiler import profiler
+from sim_thread import Frame
+from simulation import TOWER_TYPES, FRAME_TIME, WIDTH, HEIGHT, load_compiled_waves
+from state_stream import StateStreamServer, watch_kills, take_kills
+from event_log import log, OFF
+
+PHASES = ('towers', 'bullets', 'spawn', 'movement')
+
+def place_towers(state, count, seed=0):
+    # Up to count towers of every type in turn, at random spots where they fit
+    rng = np.random.default_rng(seed)
+    tower_types = list(TOWER_TYPES.values())
+    candidates = np.stack(np.meshgrid(np.arange(25, state.width, 25), np.arange(25, state.height, 25)), -1).reshape(-1, 2)
+    placed = 0
+    for x, y in rng.permutation(candidates).tolist():
+        if placed == count:
+            break
+        placed += state.add_tower(tower_types[placed % len(tower_types)](x, y), pay=False)
+    return placed
+
+def run_wave(state, renderer=None, time_limit=600.0, stream=None):
+    """Play the next level until it's cleared or time_limit simulation seconds pass.
+
+    Returns one row of measurements.
+    """
+    state.start_next_level(state.level == 0)
+    profiler.reset(history=10 ** 7)
+    ticks = 0
+    enemy_ticks = 0
+    peak = 0
+    lives = state.lives
+    sim_seconds = 0.0
+    render_seconds = 0.0
+    end = state.time + time_limit
+    while not state.can_start_next_level and state.time < end:
+        profiler.begin_frame()
+        started = time.perf_counter()
+        state.step(FRAME_TIME)
+        if stream is not None and stream.due():
+            stream.publish(Frame(state, 0, 1), take_kills(state))
+        sim_seconds += time.perf_counter() - started
+        profiler.end_frame()
+        ticks += 1
+        alive = len(state.enemies)
+        enemy_ticks += alive
+        peak = max(peak, alive)
+        if renderer is not None:
+            started = time.perf_counter()
+            renderer.draw(state, 0)
+            render_seconds += time.perf_counter() - started
+
+    totals = profiler.totals()
+    row = {
+        'level': state.level,
+        'enemies': state.total_enemies,
+        'peak_alive': peak,
+        'leaked': lives - state.lives,
+        'ticks': ticks,
+        'cleared': state.can_start_next_level,
+        'ms_per_tick': sim_seconds * 1000 / max(ticks, 1),
+        'ticks_per_s': ticks / sim_seconds if sim_seconds else 0.0,
+        'enemy_updates_per_s': enemy_ticks / sim_seconds if sim_seconds else 0.0,
+    }
+    for phase in PHASES:
+        row[f'{phase}_ms'] = totals.get(phase, 0.0) / max(ticks, 1)
+    if renderer is not None:
+        row['render_ms'] = render_seconds * 1000 / max(ticks, 1)
+        row['render_fps'] = ticks / render_seconds if render_seconds else 0.0
+    return row
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', default='stress', choices=sorted(PROFILES), help="Difficulty curve, see endless.py")
+    parser.add_argument('--first', type=int, default=1, help="Level to start at")
+    parser.add_argument('--levels', type=int, default=10, help="How many waves to play")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the generated waves and tower spots")
+    parser.add_argument('--map', help="Map file to play on, the default map without one")
+    parser.add_argument('--towers', type=int, default=40, help="Towers to place before the first wave")
+    parser.add_argument('--time-limit', type=float, default=600.0, help="Simulation seconds before a wave is cut short")
+    parser.add_argument('--render', action='store_true', help="Draw every tick and measure the renderer too")
+    parser.add_argument('-o', '--output', help="Write the rows to this CSV file")
+    parser.add_argument('--stream', metavar='ADDRESS', help="Serve the game state on tcp:host:port or unix:path")
+    args = parser.parse_args(argv)
+    if args.first < 1 or args.levels < 1:
+        parser.error("--first and --levels must be at least 1")
+
+    log.level = OFF  # Level and combat messages would only measure stdout
+    game_map = load_map(args.map) if args.map else DEFAULT_MAP
+    waves = endless_waves(args.profile, load_compiled_waves(), args.seed)
+    state = game_map.new_game(waves, money=0, lives=10 ** 9)
+    placed = place_towers(state, args.towers, args.seed)
+    state.level = args.first - 1
+    print(f"{args.profile} profile on {game_map.name}, {placed} towers, levels {args.first} to {args.first + args.levels - 1}")
+
+    renderer = None
+    if args.render:
+        import pygame
+        from fonts import load_font
+        from renderer import Renderer
+        pygame.display.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        renderer = Renderer(screen, load_font('Arial', 30))
+
+    stream = None
+    if args.stream:
+        try:
+            stream = StateStreamServer(args.stream)
+            stream.start()
+        except (ValueError, OSError) as error:
+            parser.error(f"can't stream to {args.stream}: {error}")
+        watch_kills(state)
+        print(f"Streaming on {stream.address}")
+
+    profiler.set_enabled(True)
+    rows = []
+    header = f"{'level':>5} {'enemies':>8} {'peak':>7} {'ticks':>6} {'ms/tick':>8} {'ticks/s':>8} {'updates/s':>10} " + \
+             " ".join(f"{phase:>8}" for phase in PHASES) + ("  render ms    fps" if renderer else "")
+    print(header)
+    for _ in range(args.levels):
+        row = run_wave(state, renderer, args.time_limit, stream)
+        rows.append(row)
+        line = (f"{row['level']:5d} {row['enemies']:8d} {row['peak_alive']:7d} {row['ticks']:6d} {row['ms_per_tick']:8.2f} "
+                f"{row['ticks_per_s']:8.0f} {row['enemy_updates_per_s']:10.3g} "
+                + " ".join(f"{row[f'{phase}_ms']:8.2f}" for phase in PHASES))
+        if renderer is not None:
+            line += f"  {row['render_ms']:9.2f} {row['render_fps']:6.0f}"
+        if not row['cleared']:
+            line += "  (cut short)"
+        print(line, flush=True)
+    if stream is not None:
+        stream.stop()
+
+    if args.output:
+        with open(args.output, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Wrote {len(rows)} rows to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Run many headless games in parallel to compare tower layouts, tower stats and waves.
+
+    python sweep.py sweep_example.json -o results.csv
+    python sweep.py sweep_example.json -o results.parquet --workers 8
+
+The sweep file lists the options to try, and every combination of them is one run:
+
+    {
+        "layouts": [{"name": "corners", "towers": [["Tower", 130, 120], ["SniperTower", 300, 260]]}],
+        "stats": [{"name": "base"}, {"name": "long range", "Tower": {"range": 140, "cost": 400}}],
+        "levels": [[1, 10], [11, 17]],
+        "level_configs": ["level_config.json"],
+        "money": 675,
+        "lives": 25
+    }
+
+Only layouts is required. Towers that can't be afforded or don't fit where they're
+asked for are skipped and counted in the towers_placed column. stats entries override
+numeric stats of a tower class (range, rate_of_fire, cost, splash_radius...) for that run
+only. Every run writes one row with the lives, money, leaks for each level and time taken.
+A run stops at the level where its lives run out (defeated_level), unless --play-on is
+given. Parquet output needs pyarrow.
+"""
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from simulation import GameState, TOWER_TYPES, FRAME_TIME, ENEMY_NAMES, WIDTH, HEIGHT
+from waves import load_waves
+from event_log import log, OFF
+
+def tower_stats(tower_type):
+    # Names of the numeric stats a tower of this type has, the ones a sweep may override
+    tower = tower_type(0, 0)
+    names = set(vars(tower)) | {name for name in dir(tower_type) if not name.startswith('_')}
+    state = {'x', 'y', 'index', 'cooldown', 'last_shot_time'}  # Set while playing, not stats
+    return {name for name in names if type(getattr(tower, name)) in (int, float)} - state
+
+def load_sweep(filename):
+    # Every combination of the sweep's options as a list of jobs
+    with open(filename) as file:
+        spec = json.load(file)
+    if not spec.get('layouts'):
+        raise ValueError(f"{filename}: a sweep needs at least one layout")
+    stats = spec.get('stats') or [{'name': 'base'}]
+    levels = spec.get('levels') or [[1, 17]]
+    level_configs = spec.get('level_configs') or ['level_config.json']
+    for layout in spec['layouts']:
+        # Caught here rather than in a worker, where it would take the whole pool down
+        if not isinstance(layout, dict) or not isinstance(layout.get('towers'), list):
+            raise ValueError(f"{filename}: layout {layout!r} needs a list of towers")
+        for tower in layout['towers']:
+            if not isinstance(tower, list) or len(tower) != 3:
+                raise ValueError(f"{filename}: layout {layout.get('name')!r} has {tower!r} for a tower, "
+                                 f"expected [type, x, y]")
+            tower_type, x, y = tower
+            if tower_type not in TOWER_TYPES:
+                raise ValueError(f"{filename}: layout {layout.get('name')!r} has unknown tower {tower_type!r}, "
+                                 f"expected one of {', '.join(TOWER_TYPES)}")
+            if not all(type(value) is int for value in (x, y)) or not (0 <= x < WIDTH and 0 <= y < HEIGHT):
+                raise ValueError(f"{filename}: layout {layout.get('name')!r} has a {tower_type} at {x!r}, {y!r}, "
+                                 f"expected whole pixels inside the {WIDTH}x{HEIGHT} map")
+    for variant in stats:
+        unknown = set(variant) - {'name'} - set(TOWER_TYPES)
+        if unknown:
+            raise ValueError(f"{filename}: stats {variant.get('name')!r} has unknown towers {', '.join(sorted(unknown))}")
+        for tower_type, overrides in variant.items():
+            if tower_type == 'name':
+                continue
+            # A misspelled stat would only add an attribute nothing reads, and the run would
+            # quietly use the default
+            if not isinstance(overrides, dict):
+                raise ValueError(f"{filename}: stats {variant.get('name')!r} has {overrides!r} for {tower_type}, "
+                                 f"expected {{stat: value}}")
+            allowed = tower_stats(TOWER_TYPES[tower_type])
+            for stat, value in overrides.items():
+                if stat not in allowed:
+                    raise ValueError(f"{filename}: stats {variant.get('name')!r} has unknown {tower_type} stat {stat!r}, "
+                                     f"expected one of {', '.join(sorted(allowed))}")
+                if type(value) not in (int, float):
+                    raise ValueError(f"{filename}: stats {variant.get('name')!r} sets {tower_type} {stat} to {value!r}, "
+                                     f"expected a number")
+
+    jobs = []
+    combinations = itertools.product(level_configs, spec['layouts'], stats, levels)
+    for run, (level_config, layout, variant, (first, last)) in enumerate(combinations):
+        jobs.append({
+            'run': run,
+            'level_config': level_config,
+            'layout': layout.get('name', str(layout['towers'])),
+            'towers': layout['towers'],
+            'stats': variant.get('name', ''),
+            'overrides': {name: values for name, values in variant.items() if name != 'name'},
+            'first_level': first,
+            'last_level': last,
+            'money': spec.get('money', 675),
+            'lives': spec.get('lives', 25),
+        })
+    return jobs
+
+# Each worker compiles every level config it sees once and keeps it
+_waves = {}
+
+def init_worker():
+    # Thousands of games' worth of level messages would drown the progress, TD_LOG still wins
+    if 'TD_LOG' not in os.environ:
+        log.level = OFF
+
+def run_job(job, dt=FRAME_TIME, play_on=False):
+    # Play one combination headless and return its results row
+    started = time.perf_counter()
+    waves = _waves.get(job['level_config'])
+    if waves is None:
+        waves = _waves[job['level_config']] = load_waves(job['level_config'], ENEMY_NAMES)
+    state = GameState(waves, money=job['money'], lives=job['lives'])
+
+    placed = 0
+    for tower_type, x, y in job['towers']:
+        tower = TOWER_TYPES[tower_type](x, y)
+        for name, value in job['overrides'].get(tower_type, {}).items():
+            setattr(tower, name, value)  # Instance attributes, the classes stay untouched
+        placed += state.add_tower(tower)
+
+    row = {
+        'run': job['run'],
+        'level_config': job['level_config'],
+        'layout': job['layout'],
+        'stats': job['stats'],
+        'first_level': job['first_level'],
+        'last_level': job['last_level'],
+        'towers_placed': placed,
+    }
+    leaks = {}
+    row['defeated_level'] = None
+    for level in range(job['first_level'], job['last_level'] + 1):
+        leaks[f'leaks_{level}'] = state.play_level(level if level == job['first_level'] else None, dt)
+        if state.lives <= 0 and row['defeated_level'] is None:
+            row['defeated_level'] = level
+            if not play_on:
+                break  # Losing games are the slowest to play out and the rest tells us nothing
+    row['lives_lost'] = job['lives'] - state.lives
+    row['lives'] = state.lives
+    row['money'] = state.money
+    row['sim_time'] = round(state.time, 3)
+    row['wall_time'] = round(time.perf_counter() - started, 3)
+    row.update(leaks)
+    return row
+
+def write_csv(filename, rows, fields):
+    with open(filename, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields, restval='')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+def write_parquet(filename, rows, fields):
+    import pyarrow
+    import pyarrow.parquet
+    columns = {field: [row.get(field) for row in rows] for field in fields}
+    pyarrow.parquet.write_table(pyarrow.table(columns), filename)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sweep', help="JSON file with the layouts, stats and levels to try")
+    parser.add_argument('-o', '--output', default='sweep_results.csv', help=".csv or .parquet file for the results")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processes to run in (default: every core)")
+    parser.add_argument('--dt', type=float, default=FRAME_TIME, help="Simulation step in seconds (default 1/60)")
+    parser.add_argument('--play-on', action='store_true', help="Keep playing levels after the lives run out")
+    args = parser.parse_args(argv)
+
+    if args.output.endswith('.parquet'):
+        # Find out now rather than after the whole sweep has run
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            parser.error("writing Parquet needs pyarrow (pip install pyarrow), or use a .csv output")
+
+    try:
+        jobs = load_sweep(args.sweep)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    # Leak columns for every level any run plays, in order
+    levels = sorted({level for job in jobs for level in range(job['first_level'], job['last_level'] + 1)})
+    fields = ['run', 'level_config', 'layout', 'stats', 'first_level', 'last_level', 'towers_placed',
+              'defeated_level', 'lives_lost', 'lives', 'money', 'sim_time', 'wall_time'] + [f'leaks_{level}' for level in levels]
+
+    started = time.perf_counter()
+    rows = []
+    # Small chunks keep every core busy to the end, big ones keep the overhead down
+    chunksize = max(1, len(jobs) // (args.workers * 16))
+    with concurrent.futures.ProcessPoolExecutor(args.workers, initializer=init_worker) as pool:
+        for row in pool.map(run_job, jobs, itertools.repeat(args.dt), itertools.repeat(args.play_on),
+                            chunksize=chunksize):
+            rows.append(row)
+            if len(rows) % 100 == 0 or len(rows) == len(jobs):
+                print(f"\r{len(rows)}/{len(jobs)} runs, {time.perf_counter() - started:.1f}s", end='', file=sys.stderr)
+    print(file=sys.stderr)
+
+    if args.output.endswith('.parquet'):
+        write_parquet(args.output, rows, fields)
+    else:
+        write_csv(args.output, rows, fields)
+    print(f"Wrote {len(rows)} runs to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
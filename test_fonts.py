@@ -0,0 +1,41 @@
+"""The font cache remembers where fonts are, and notices when a missing one gets installed.
+
+    python -m pytest -q test_fonts.py
+"""
+import os
+
+import pygame
+
+import fonts
+
+def test_missing_font_is_looked_up_again_after_install(tmp_path, monkeypatch):
+    font_dir = tmp_path / 'fonts'
+    font_dir.mkdir()
+    monkeypatch.setattr(fonts, 'FONT_CACHE', str(tmp_path / 'font_cache.json'))
+    monkeypatch.setattr(fonts, 'FONT_DIRS', [str(font_dir)])
+    installed = {}
+    lookups = []
+
+    def match_font(name):
+        lookups.append(name)
+        return installed.get(name)
+    monkeypatch.setattr(pygame.font, 'match_font', match_font)
+
+    assert fonts.resolve_font('Arial') is None
+    assert fonts.resolve_font('Arial') is None
+    assert lookups == ['Arial']  # The miss is cached while nothing changes
+
+    # Installing it adds a directory, which changes the fingerprint
+    (font_dir / 'arial').mkdir()
+    font_file = font_dir / 'arial' / 'Arial.ttf'
+    font_file.write_bytes(b'')
+    installed['Arial'] = str(font_file)
+    assert fonts.resolve_font('Arial') == str(font_file)
+    assert fonts.resolve_font('Arial') == str(font_file)
+    assert lookups == ['Arial', 'Arial']
+
+    # A cached file that's gone again is looked up again too
+    os.remove(font_file)
+    del installed['Arial']
+    assert fonts.resolve_font('Arial') is None
+    assert len(lookups) == 3
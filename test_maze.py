@@ -0,0 +1,60 @@
+"""The flow field's incremental repairs always agree with working it out from scratch.
+
+    python -m pytest -q test_maze.py
+"""
+import random
+
+import numpy as np
+import pytest
+
+from maze import FlowField, Maze, UNREACHABLE
+
+def assert_matches_rebuild(field):
+    fresh = FlowField(field.columns, field.rows, field.exits,
+                      [cell for cell, blocked in enumerate(field.blocked) if blocked])
+    assert field._dist == fresh._dist
+    assert np.array_equal(field.dist, fresh.dist)
+    assert np.array_equal(field.next_cell, fresh.next_cell)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_block_and_unblock_match_rebuild(seed):
+    rng = random.Random(seed)
+    columns, rows = rng.randint(4, 16), rng.randint(4, 12)
+    count = columns * rows
+    exits = rng.sample(range(count), rng.randint(1, 3))
+    field = FlowField(columns, rows, exits, rng.sample(range(count), count // 10))
+    assert_matches_rebuild(field)
+    for _ in range(150):
+        cell = rng.randrange(count)
+        if field.blocked[cell]:
+            field.unblock(cell)
+        else:
+            field.block(cell)
+        assert_matches_rebuild(field)
+
+def test_blocking_everything_and_back():
+    # Walls that close off whole regions and open them up again
+    field = FlowField(6, 5, [29])
+    for cell in range(29):
+        field.block(cell)
+        assert_matches_rebuild(field)
+    assert all(distance == UNREACHABLE for distance in field._dist[:29])
+    for cell in reversed(range(29)):
+        field.unblock(cell)
+        assert_matches_rebuild(field)
+
+class NoEnemies:
+    count = 0
+
+def test_add_tower_refuses_to_cut_off_an_entrance():
+    # 5x3 cells, entrance on the left, exit on the right, a wall down column 2 except the middle row
+    maze = Maze(200, 120, 40, entrances=[(0, 1)], exits=[(4, 1)], walls=[(2, 0), (2, 2)])
+    gap_x, gap_y = 2 * 40 + 20, 1 * 40 + 20
+    assert not maze.can_place(gap_x, gap_y, NoEnemies())
+    assert not maze.add_tower(gap_x, gap_y, NoEnemies())
+    assert not maze.field.blocked[maze.cell(2, 1)]
+    assert_matches_rebuild(maze.field)  # The tried block was undone completely
+
+    assert maze.add_tower(1 * 40 + 20, 0 * 40 + 20, NoEnemies())  # Off the only way through
+    assert maze.field.blocked[maze.cell(1, 0)]
+    assert_matches_rebuild(maze.field)
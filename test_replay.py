@@ -0,0 +1,80 @@
+"""Replays of a headless session have to come out tick for tick the same.
+
+    python -m pytest -q test_replay.py
+"""
+import zlib
+
+import pytest
+
+from replay import (ReplayRecorder, ReplayDivergence, read_replay, replay, state_checksum,
+                    HEADER, EVENT, PAYLOADS, MAGIC, VERSION, PLACE_TOWER, CHECKSUM)
+from simulation import GameState, Tower, SniperTower, load_compiled_waves
+from snapshot import TOWER_ORDER
+
+LEVELS = 5
+LATE_TOWER_TICK = 330  # Between two checksums, so the one after it is the first to differ
+
+def play_session(waves, filename):
+    # A few levels with towers placed before the first and in the middle of it, like a player would
+    state = GameState(waves, money=2000)
+    recorder = ReplayRecorder(state)
+    recorder.place_tower(Tower, 130, 120)
+    recorder.place_tower(SniperTower, 300, 260)
+    checksums = {}
+    for _ in range(LEVELS):
+        recorder.start_level()
+        while not state.can_start_next_level:
+            if state.ticks == LATE_TOWER_TICK:
+                assert recorder.place_tower(Tower, 485, 315)
+            recorder.step()
+            if state.ticks % recorder.checksum_interval == 0:
+                checksums[state.ticks] = state_checksum(state)
+    recorder.save(filename)
+    return state, checksums
+
+def write_replay(filename, checksum_interval, start, events):
+    # The inverse of read_replay, for making doctored recordings
+    body = bytearray()
+    for tick, kind, payload in events:
+        body += EVENT.pack(tick, kind) + PAYLOADS[kind].pack(*payload)
+    with open(filename, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, checksum_interval, len(start)) + start + zlib.compress(bytes(body), 9))
+
+@pytest.fixture(scope='module')
+def waves():
+    return load_compiled_waves()
+
+@pytest.fixture(scope='module')
+def session(waves, tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('replay') / 'session.tdr')
+    state, checksums = play_session(waves, filename)
+    return filename, state, checksums
+
+def test_replay_matches_every_checksum(session, waves):
+    filename, recorded, checksums = session
+    assert recorded.level == LEVELS and len(recorded.towers) == 3
+    _, _, events = read_replay(filename)
+    assert {tick: payload[0] for tick, kind, payload in events if kind == CHECKSUM} == checksums
+
+    replayed = replay(filename, waves)  # Raises at the first checksum that doesn't match
+    assert replayed.ticks == recorded.ticks
+    assert state_checksum(replayed) == state_checksum(recorded)
+
+def test_changed_input_diverges_at_next_checksum(session, waves, tmp_path):
+    filename, _, _ = session
+    interval, start, events = read_replay(filename)
+    changed = []
+    for tick, kind, payload in events:
+        if kind == PLACE_TOWER and tick == LATE_TOWER_TICK:
+            # Same spot, a dearer tower: the money is off from the next checksum on
+            payload = (TOWER_ORDER.index('SniperTower'),) + payload[1:]
+        changed.append((tick, kind, payload))
+    assert changed != events
+    doctored = str(tmp_path / 'doctored.tdr')
+    write_replay(doctored, interval, start, changed)
+
+    with pytest.raises(ReplayDivergence) as divergence:
+        replay(doctored, waves)
+    assert divergence.value.tick == (LATE_TOWER_TICK // interval + 1) * interval
+
+    replay(doctored, waves, check=False)  # Still plays through when not checking
@@ -0,0 +1,26 @@
+"""Bullets and towers doing what they say on the tin.
+
+    python -m pytest -q test_simulation.py
+"""
+import pytest
+
+from simulation import GameState, ChainTower, ChainBullet, load_compiled_waves
+
+@pytest.fixture(scope='module')
+def waves():
+    return load_compiled_waves()
+
+def test_chain_skips_enemies_killed_earlier_in_the_tick(waves):
+    # Four green enemies in a row, the second dies before the chain goes off. The grid
+    # isn't rebuilt for a kill, so the dead one is still in it.
+    state = GameState(waves)
+    enemies = state.enemies
+    handles = [enemies.spawn_at(0, 100 + 20 * i, 100) for i in range(4)]
+    state.enemy_grid()
+    state.damage_enemies([handles[1]])
+    assert handles[1] not in enemies
+
+    tower = ChainTower(0, 0)
+    tower.chain_count = 2
+    ChainBullet.on_hit(state, tower, handles[0])
+    assert not any(handle in enemies for handle in handles)  # Both links went to live enemies
@@ -0,0 +1,68 @@
+"""Saved games carry on tick for tick like the game they were saved from.
+
+    python -m pytest -q test_snapshot.py
+"""
+import struct
+
+import numpy as np
+import pytest
+
+from maps import load_map
+from replay import state_checksum
+from simulation import (GameState, Tower, SniperTower, SplashTower, ChainTower, SlowTower, FRAME_TIME,
+                        ENEMY_NAMES, load_compiled_waves, load_level_config)
+from snapshot import snapshot, restore, save_game, load_game, MAGIC, VERSION
+from waves import compile_waves
+
+@pytest.fixture(scope='module')
+def waves():
+    return load_compiled_waves()
+
+def play_until_busy(state, level):
+    # Into the middle of a wave, with bullets in the air
+    state.level = level - 1
+    state.start_next_level(level == 1)
+    while state.enemies_spawned < state.max_enemies // 2 or state.enemies.count < 3 or state.bullets.count == 0:
+        state.step(FRAME_TIME)
+        assert not state.can_start_next_level, "the level ended before it got busy"
+
+def assert_same_from_here(state, copy, ticks=600):
+    assert state_checksum(copy) == state_checksum(state)
+    for _ in range(ticks):
+        state.step(FRAME_TIME)
+        copy.step(FRAME_TIME)
+    assert state_checksum(copy) == state_checksum(state)
+    assert (copy.money, copy.lives, copy.enemies_spawned) == (state.money, state.lives, state.enemies_spawned)
+
+def test_round_trip_mid_wave(waves, tmp_path):
+    state = GameState(waves, money=5000)
+    for tower_type, x, y in ((Tower, 145, 125), (SniperTower, 315, 285), (SplashTower, 485, 315),
+                             (ChainTower, 235, 125), (SlowTower, 515, 465)):
+        assert state.add_tower(tower_type(x, y))
+    play_until_busy(state, 6)
+    assert_same_from_here(state, restore(snapshot(state), waves))
+
+    save_game(state, str(tmp_path / 'game.tdsave'))
+    assert_same_from_here(state, load_game(str(tmp_path / 'game.tdsave'), waves))
+
+def test_round_trip_maze(waves):
+    state = load_map('maps/open_field.json').new_game(waves, money=5000)
+    for column in range(5):
+        assert state.add_tower(Tower(column * 40 + 220, 300))
+    play_until_busy(state, 4)
+    copy = restore(snapshot(state), waves)
+    assert copy.maze is not None and copy.maze.field.blocked == state.maze.field.blocked
+    assert np.array_equal(copy.maze.field.dist, state.maze.field.dist)
+    assert_same_from_here(state, copy)
+
+def test_bad_saves_are_refused(waves):
+    data = snapshot(GameState(waves))
+    with pytest.raises(ValueError, match="Not a saved game"):
+        restore(b'NOPE' + data[4:], waves)
+    with pytest.raises(ValueError, match=f"version {VERSION + 1}"):
+        restore(MAGIC + struct.pack('<H', VERSION + 1) + data[6:], waves)
+
+    config = load_level_config()
+    del config[max(config, key=int)]  # One level less
+    with pytest.raises(ValueError, match="different level config"):
+        restore(data, compile_waves(config, ENEMY_NAMES))
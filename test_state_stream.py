@@ -0,0 +1,114 @@
+"""What a stream client decodes is what the game published, even after it missed messages.
+
+    python -m pytest -q test_state_stream.py
+"""
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from sim_thread import Frame
+from simulation import GameState, Tower, SniperTower, ChainTower, FRAME_TIME, load_compiled_waves
+from snapshot import TOWER_ORDER
+from state_stream import (StreamEncoder, StreamDecoder, StateStreamServer, MESSAGE, KILL_COLUMNS,
+                          enemy_table, watch_kills, take_kills, read_messages)
+
+KEYFRAME_INTERVAL = 20
+
+@pytest.fixture(scope='module')
+def session():
+    # A level being played, with a tower going up halfway: every frame, its kills, and
+    # the message for it
+    state = GameState(load_compiled_waves(), money=5000)
+    state.add_tower(Tower(145, 125))
+    state.add_tower(ChainTower(315, 285))
+    watch_kills(state)
+    state.start_next_level(True)
+    encoder = StreamEncoder(KEYFRAME_INTERVAL)
+    published = []
+    for tick in range(1, 901):
+        state.step(FRAME_TIME)
+        if tick == 450:
+            state.add_tower(SniperTower(485, 315))
+        if tick % 3 == 0:
+            frame = Frame(state, 0, 1)
+            kills = take_kills(state)
+            message, keyframe = encoder.encode(frame, kills)
+            published.append((frame, kills, message[MESSAGE.size:], keyframe))
+    assert sum(len(kills['handle']) for _, kills, _, _ in published) > 0, "nothing got killed to stream"
+    return published
+
+def assert_decoded(decoder, frame, kills=None):
+    expected = enemy_table(frame.enemies)
+    assert decoder.enemies.keys() == expected.keys()
+    for name in expected:
+        assert np.array_equal(decoder.enemies[name], expected[name]), name
+    assert (decoder.ticks, decoder.money, decoder.lives, decoder.level) == (frame.ticks, frame.money, frame.lives, frame.level)
+    assert decoder.enemies_left == frame.max_enemies - frame.enemies_spawned
+    assert decoder.towers == [(TOWER_ORDER.index(type(tower).__name__), tower.x, tower.y) for tower in frame.towers]
+    if kills is not None:
+        for name, _ in KILL_COLUMNS:
+            assert np.array_equal(decoder.kills[name], kills[name]), name
+
+def test_every_message_decodes_to_its_frame(session):
+    decoder = StreamDecoder()
+    for frame, kills, body, keyframe in session:
+        assert decoder.feed(body)
+        assert_decoded(decoder, frame, kills)
+    assert decoder.keyframes == sum(keyframe for _, _, _, keyframe in session) > 1
+    assert decoder.skipped == 0
+
+def test_dropped_deltas_resync_at_next_keyframe(session):
+    decoder = StreamDecoder()
+    dropped = {5, 6, 7, 41}  # Deltas after a keyframe and just before one
+    assert not any(session[index][3] for index in dropped)
+    waiting = False
+    for index, (frame, kills, body, keyframe) in enumerate(session):
+        if index in dropped:
+            waiting = True
+            continue
+        applied = decoder.feed(body)
+        if waiting and not keyframe:
+            assert not applied  # Can't go on from a message it never saw
+            continue
+        waiting = False
+        assert applied
+        assert_decoded(decoder, frame, kills)
+    assert decoder.skipped > 0
+    assert_decoded(decoder, session[-1][0])
+
+def test_slow_client_skips_ahead_and_catches_up():
+    # Enough enemies that a client that doesn't read soon has far more than max_backlog waiting
+    state = GameState(load_compiled_waves())
+    for i in range(3000):
+        state.enemies.spawn(i % 5, i * 0.3)
+    server = StateStreamServer('tcp:127.0.0.1:0', keyframe_interval=KEYFRAME_INTERVAL, max_rate=1000,
+                               max_backlog=64 * 1024)
+    server.start()
+    client = socket.socket()
+    try:
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        client.connect(server.address)
+        deadline = time.perf_counter() + 5
+        while server.client_count == 0 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        # Published as fast as the server takes them, while nobody reads
+        for _ in range(200):
+            state.step(FRAME_TIME)
+            server.publish(Frame(state, 0, 1))
+            while server._pending is not None:
+                time.sleep(0.001)
+        last = Frame(state, 0, 1)
+        assert server.clients[0].skips > 0
+
+        decoder = StreamDecoder()
+        client.settimeout(5)
+        for body in read_messages(client):
+            decoder.feed(body)
+            if decoder.ticks == last.ticks and decoder.sequence == server.encoder.sequence:
+                break
+        assert_decoded(decoder, last)
+    finally:
+        client.close()
+        server.stop()
@@ -0,0 +1,40 @@
+"""Sweep files are checked when they're loaded, before any worker plays a run.
+
+    python -m pytest -q test_sweep.py
+"""
+import json
+
+import pytest
+
+from sweep import load_sweep
+
+LAYOUT = {'name': 'corner', 'towers': [['Tower', 130, 120]]}
+
+def write_sweep(tmp_path, **spec):
+    filename = tmp_path / 'sweep.json'
+    filename.write_text(json.dumps({'layouts': [LAYOUT], **spec}))
+    return str(filename)
+
+def test_combinations(tmp_path):
+    jobs = load_sweep(write_sweep(tmp_path, stats=[{'name': 'base'}, {'name': 'long', 'Tower': {'range': 140}}],
+                                  levels=[[1, 5], [6, 10]]))
+    assert len(jobs) == 4
+    assert jobs[-1]['overrides'] == {'Tower': {'range': 140}}
+
+@pytest.mark.parametrize('spec, message', [
+    ({'layouts': []}, "at least one layout"),
+    ({'layouts': [{'name': 'bad'}]}, "needs a list of towers"),
+    ({'layouts': [{'name': 'bad', 'towers': [['Tower', 130]]}]}, "expected \\[type, x, y\\]"),
+    ({'layouts': [{'name': 'bad', 'towers': [['Castle', 130, 120]]}]}, "unknown tower 'Castle'"),
+    ({'layouts': [{'name': 'bad', 'towers': [['Tower', 130.0, 120]]}]}, "whole pixels"),
+    ({'layouts': [{'name': 'bad', 'towers': [['Tower', 130, 900]]}]}, "whole pixels"),
+    ({'stats': [{'name': 'bad', 'Castle': {'range': 140}}]}, "unknown towers Castle"),
+    ({'stats': [{'name': 'bad', 'Tower': {'rate_of_fir': 10}}]}, "unknown Tower stat 'rate_of_fir'"),
+    ({'stats': [{'name': 'bad', 'Tower': {'splash_radius': 10}}]}, "unknown Tower stat 'splash_radius'"),
+    ({'stats': [{'name': 'bad', 'Tower': {'range': '140'}}]}, "expected a number"),
+    ({'stats': [{'name': 'bad', 'Tower': {'range': True}}]}, "expected a number"),
+    ({'stats': [{'name': 'bad', 'Tower': 140}]}, "expected {stat: value}"),
+])
+def test_bad_sweeps_are_refused(tmp_path, spec, message):
+    with pytest.raises(ValueError, match=message):
+        load_sweep(write_sweep(tmp_path, **spec))
@@ -0,0 +1,50 @@
+# The simulation always moves in ticks of the same length, whatever the frame rate.
+# The real time that passed, times the speed multiplier, goes into an accumulator, and
+# as many whole ticks as fit are run. Fast forward just means more ticks at a time.
+
+from simulation import FRAME_TIME
+
+# Speed multipliers that = and - step through
+SPEEDS = (1, 2, 4, 8, 16, 32, 64, 100)
+
+# A frame longer than this (a window drag, a breakpoint) counts as only this long
+MAX_FRAME_SECONDS = 0.25
+
+class FixedTimestep:
+    """Turns real frame times into a number of fixed simulation ticks.
+
+    If the simulation can't keep up with the requested speed, the accumulator is capped
+    at max_ticks ticks of backlog and anything beyond that is dropped. The game then runs
+    slower than asked instead of falling further behind every frame.
+    """
+
+    def __init__(self, tick=FRAME_TIME, speed=1, max_ticks=200):
+        self.tick = tick
+        self.speed = speed
+        self.max_ticks = max_ticks  # Most ticks run for one frame
+        self.accumulator = 0.0
+        self.dropped = 0.0  # Simulation seconds thrown away by the cap
+
+    def set_speed(self, speed):
+        self.speed = max(SPEEDS[0], min(SPEEDS[-1], speed))
+
+    def faster(self):
+        self.set_speed(next((s for s in SPEEDS if s > self.speed), SPEEDS[-1]))
+
+    def slower(self):
+        self.set_speed(next((s for s in reversed(SPEEDS) if s < self.speed), SPEEDS[0]))
+
+    def advance(self, frame_seconds):
+        # Add one frame of real time and return how many ticks to run for it
+        self.accumulator += min(frame_seconds, MAX_FRAME_SECONDS) * self.speed
+        limit = self.max_ticks * self.tick
+        if self.accumulator > limit:
+            self.dropped += self.accumulator - limit
+            self.accumulator = limit
+        ticks = int(self.accumulator / self.tick + 1e-9)  # Tolerate float drift just under a tick
+        self.accumulator = max(0.0, self.accumulator - ticks * self.tick)
+        return ticks
+
+    def until_next_tick(self):
+        # Real seconds until the accumulator holds another whole tick
+        return max(0.0, self.tick - self.accumulator) / self.speed
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# level_config.json is checked and compiled once, when it's loaded, into one spawn
+# timeline per level: an array of times (seconds after the level starts) and an array of
+# enemy kinds. Spawning during a level is then just moving an index along those arrays.
+# The compiled arrays are cached next to the JSON file and reused while it is unchanged.
+#
+# A level is either the old style count per color, spawned one color after the other:
+#
+#     "3": {"green": 10, "purple": 5}
+#
+# or a list of groups, each with its own spacing, which may overlap and interleave:
+#
+#     "4": {"groups": [
+#         {"enemy": "red", "count": 12, "interval": 0.25},
+#         {"enemy": "black", "count": 6, "start": 1.0, "interval": 1.0, "burst": 2}
+#     ]}
+#
+# Group fields: enemy and count are required. interval is the time between spawns
+# (default SPAWN_DELAY), burst is how many spawn together each time (default 1). start
+# is a time in seconds after the level begins; without it the group starts one interval
+# after the previous group's last spawn, plus delay if given (default 0).
+
+SPAWN_DELAY = 0.5  # Seconds between each enemy spawn
+COMPILER_VERSION = 1  # Bump when the compiled form changes, to throw away old caches
+
+GROUP_FIELDS = {'enemy', 'count', 'interval', 'burst', 'start', 'delay'}
+
+def _number(value, where, minimum=0.0):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+        raise ValueError(f"{where} must be a number of at least {minimum}, got {value!r}")
+    return float(value)
+
+def _count(value, where, minimum=0):
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f"{where} must be a whole number of at least {minimum}, got {value!r}")
+    return value
+
+def validate_level_config(config, kind_names):
+    """Check config against the schema above and return it as a list of groups per level.
+
+    Raises ValueError naming the level and field that is wrong.
+    """
+    if not isinstance(config, dict):
+        raise ValueError("level config must be a JSON object keyed by level number")
+    levels = {}
+    for key, level in config.items():
+        if not key.isdigit() or int(key) < 1:
+            raise ValueError(f"level key {key!r} must be a positive whole number")
+        where = f"level {key}"
+        if not isinstance(level, dict):
+            raise ValueError(f"{where} must be an object")
+
+        if 'groups' not in level:
+            # Old style, one color after the other with the default spacing
+            groups = []
+            for name, count in level.items():
+                if name not in kind_names:
+                    raise ValueError(f"{where}: unknown enemy {name!r}, expected one of {', '.join(kind_names)}")
+                _count(count, f"{where} {name}")
+            for name in kind_names:
+                if level.get(name, 0):
+                    groups.append({'enemy': name, 'count': level[name]})
+        else:
+            if set(level) != {'groups'} or not isinstance(level['groups'], list):
+                raise ValueError(f"{where} must only have a list of groups")
+            groups = level['groups']
+
+        checked = []
+        for i, group in enumerate(groups, 1):
+            group_where = f"{where} group {i}"
+            if not isinstance(group, dict):
+                raise ValueError(f"{group_where} must be an object")
+            unknown = set(group) - GROUP_FIELDS
+            if unknown:
+                raise ValueError(f"{group_where}: unknown fields {', '.join(sorted(unknown))}")
+            if group.get('enemy') not in kind_names:
+                raise ValueError(f"{group_where}: enemy must be one of {', '.join(kind_names)}")
+            checked.append({
+                'kind': kind_names.index(group['enemy']),
+                'count': _count(group.get('count'), f"{group_where} count"),
+                'interval': _number(group.get('interval', SPAWN_DELAY), f"{group_where} interval"),
+                'burst': _count(group.get('burst', 1), f"{group_where} burst", 1),
+                'start': None if 'start' not in group else _number(group['start'], f"{group_where} start"),
+                'delay': _number(group.get('delay', 0.0), f"{group_where} delay"),
+            })
+        levels[int(key)] = checked
+    return levels
+
+def compile_level(groups):
+    # Spawn times and kinds for one level, sorted by time, groups in order on ties
+    times = []
+    kinds = []
+    last_spawn = 0.0
+    for group in groups:
+        start = group['start']
+        if start is None:
+            start = last_spawn + group['interval'] + group['delay']
+        bursts = -(-group['count'] // group['burst'])  # Round up
+        group_times = np.repeat(start + group['interval'] * np.arange(bursts), group['burst'])[:group['count']]
+        times.append(group_times)
+        kinds.append(np.full(group['count'], group['kind'], dtype=np.int8))
+        if group['count']:
+            last_spawn = float(group_times[-1])
+    if not times:
+        return np.zeros(0), np.zeros(0, dtype=np.int8)
+    times = np.concatenate(times)
+    kinds = np.concatenate(kinds)
+    order = np.argsort(times, kind='stable')
+    return times[order], kinds[order]
+
+class CompiledWaves:
+    """Spawn timelines for every level, see the module comment for the format."""
+
+    EMPTY = (np.zeros(0), np.zeros(0, dtype=np.int8))
+
+    def __init__(self, levels):
+        self.levels = levels  # level number -> (times, kinds)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def get(self, level):
+        # Levels missing from the config have no enemies
+        return self.levels.get(level, self.EMPTY)
+
+    def signature(self):
+        # Anything besides the compiled levels that decides the waves, for save game checks
+        return b''
+
+def compile_waves(config, kind_names):
+    levels = validate_level_config(config, kind_names)
+    return CompiledWaves({level: compile_level(groups) for level, groups in levels.items()})
+
+def cache_path(filename):
+    return os.path.splitext(filename)[0] + '.waves.npz'
+
+def load_waves(filename, kind_names):
+    """Load and compile a level config, reusing the compiled cache next to it if it's current."""
+    with open(filename, 'rb') as file:
+        source = file.read()
+    digest = hashlib.sha256(source + repr((COMPILER_VERSION, kind_names)).encode()).hexdigest()
+
+    cached = cache_path(filename)
+    try:
+        with np.load(cached) as data:
+            if str(data['digest']) == digest:
+                levels = {int(name[:-6]): (data[name], data[name[:-6] + '_kinds'])
+                          for name in data.files if name.endswith('_times')}
+                return CompiledWaves(levels)
+    except Exception:
+        # No cache yet, or it's unreadable: a truncated or corrupt .npz fails in all sorts
+        # of ways (BadZipFile, EOFError, ValueError...), compile from the JSON either way
+        pass
+
+    waves = compile_waves(json.loads(source), kind_names)
+    arrays = {'digest': np.array(digest)}
+    for level, (times, kinds) in waves.levels.items():
+        arrays[f'{level}_times'] = times
+        arrays[f'{level}_kinds'] = kinds
+    try:
+        # Write to a temporary file first so a crash never leaves half a cache behind. Its
+        # name is unique, sweep workers compiling the same config at once each write their own.
+        descriptor, temporary = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(cached) or '.')
+    except OSError:
+        return waves  # A read-only checkout just compiles every time
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(temporary, cached)
+    except OSError:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+    return waves